@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Awaitable, BinaryIO, Callable, Optional
+
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+SEND_CHUNK_BYTES = 256 * 1024
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """解析单段 Range 头，返回闭区间 (start, end)；无 Range 或多段时返回 None 表示整段发送。"""
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+def range_headers(size: int, byte_range: Optional[tuple[int, int]]) -> dict[str, str]:
+    headers = {"Accept-Ranges": "bytes"}
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+    else:
+        start, end = byte_range
+        headers["Content-Length"] = str(end - start + 1)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return headers
+
+
+def unsatisfiable_headers(size: int) -> dict[str, str]:
+    return {"Accept-Ranges": "bytes", "Content-Range": f"bytes */{size}"}
+
+
+class RangeResponse(Response):
+    """按区间发送对象内容，不把整个对象读进内存。
+
+    给定本地文件路径时，服务器支持 ASGI zerocopy 扩展则交给内核 sendfile，
+    否则在线程里按块 pread；其余情况通过 read_chunk(start, end) 按块读取。
+    """
+
+    def __init__(
+        self,
+        size: int,
+        media_type: str,
+        byte_range: Optional[tuple[int, int]] = None,
+        path: Optional[str] = None,
+        read_chunk: Optional[Callable[[int, int], Awaitable[bytes]]] = None,
+        headers: Optional[dict[str, str]] = None,
+    ) -> None:
+        super().__init__(
+            status_code=206 if byte_range else 200,
+            headers={**(headers or {}), **range_headers(size, byte_range)},
+            media_type=media_type,
+        )
+        self._start, self._end = byte_range or (0, size - 1)
+        self._path = path
+        self._read_chunk = read_chunk
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers}
+        )
+        if scope.get("method") == "HEAD" or self._end < self._start:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if self._path is not None:
+            await self._send_file(scope, send)
+            return
+        position = self._start
+        while position <= self._end:
+            last = min(self._end, position + SEND_CHUNK_BYTES - 1)
+            chunk = await self._read_chunk(position, last)
+            if not chunk:
+                break
+            position += len(chunk)
+            await send(
+                {"type": "http.response.body", "body": chunk, "more_body": position <= self._end}
+            )
+        if position <= self._end:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _send_file(self, scope: Scope, send: Send) -> None:
+        with open(self._path, "rb") as handle:
+            await send_file_segment(
+                scope, send, handle, self._start, self._end - self._start + 1, more_body=False
+            )
+
+
+class ChunkedFileResponse(Response):
+    """由若干缓存块文件拼出所请求的区间，每块按需打开，逐块零拷贝发送。"""
+
+    def __init__(
+        self,
+        size: int,
+        media_type: str,
+        chunk_size: int,
+        open_chunk: Callable[[int], Awaitable[BinaryIO]],
+        byte_range: Optional[tuple[int, int]] = None,
+        headers: Optional[dict[str, str]] = None,
+    ) -> None:
+        super().__init__(
+            status_code=206 if byte_range else 200,
+            headers={**(headers or {}), **range_headers(size, byte_range)},
+            media_type=media_type,
+        )
+        self._start, self._end = byte_range or (0, size - 1)
+        self._chunk_size = chunk_size
+        self._open_chunk = open_chunk
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers}
+        )
+        if scope.get("method") == "HEAD" or self._end < self._start:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        first = self._start // self._chunk_size
+        last = self._end // self._chunk_size
+        for index in range(first, last + 1):
+            chunk_start = index * self._chunk_size
+            offset = max(self._start, chunk_start) - chunk_start
+            count = min(self._end, chunk_start + self._chunk_size - 1) - chunk_start - offset + 1
+            with await self._open_chunk(index) as handle:
+                await send_file_segment(
+                    scope, send, handle, offset, count, more_body=index < last
+                )
+
+
+async def send_file_segment(
+    scope: Scope, send: Send, handle: BinaryIO, offset: int, count: int, more_body: bool
+) -> None:
+    """发送文件的一段：服务器支持 ASGI zerocopy 扩展时交给 sendfile，否则线程内按块 pread。"""
+    if "http.response.zerocopy" in scope.get("extensions", {}):
+        await send(
+            {
+                "type": "http.response.zerocopy",
+                "file": handle,
+                "offset": offset,
+                "count": count,
+                "more_body": more_body,
+            }
+        )
+        return
+    fd = handle.fileno()
+    position = offset
+    end = offset + count
+    while position < end:
+        size = min(SEND_CHUNK_BYTES, end - position)
+        chunk = await asyncio.to_thread(os.pread, fd, size, position)
+        if not chunk:
+            break
+        position += len(chunk)
+        await send(
+            {
+                "type": "http.response.body",
+                "body": chunk,
+                "more_body": more_body or position < end,
+            }
+        )
+    if position < end or count <= 0:
+        await send({"type": "http.response.body", "body": b"", "more_body": more_body})
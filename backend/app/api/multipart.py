@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import AsyncGenerator, AsyncIterator, Optional, Union
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class MultipartStreamError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class FieldPart:
+    name: str
+    value: str
+
+
+@dataclass(frozen=True)
+class FileStart:
+    name: str
+    filename: Optional[str]
+    content_type: Optional[str]
+
+
+@dataclass(frozen=True)
+class FileChunk:
+    data: bytes
+
+
+@dataclass(frozen=True)
+class FileEnd:
+    name: str
+
+
+MultipartEvent = Union[FieldPart, FileStart, FileChunk, FileEnd]
+
+
+class _PartState:
+    __slots__ = ("header_name", "header_value", "headers", "name", "is_file", "data")
+
+    def __init__(self) -> None:
+        self.header_name = b""
+        self.header_value = b""
+        self.headers: dict[bytes, bytes] = {}
+        self.name = ""
+        self.is_file = False
+        self.data = bytearray()
+
+
+async def iter_multipart(
+    content_type: str, stream: AsyncIterator[bytes]
+) -> AsyncGenerator[MultipartEvent, None]:
+    """按到达顺序产出 multipart 事件，文件内容以 FileChunk 形式逐块交给调用方，不落盘。
+
+    与 Starlette 的表单解析不同，这里不会先把整个文件缓存下来。
+    """
+    media_type, params = parse_options_header(content_type)
+    if media_type != b"multipart/form-data" or b"boundary" not in params:
+        raise MultipartStreamError("multipart/form-data body required")
+
+    events: list[MultipartEvent] = []
+    part = _PartState()
+
+    def on_part_begin() -> None:
+        nonlocal part
+        part = _PartState()
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        part.header_name += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        part.header_value += data[start:end]
+
+    def on_header_end() -> None:
+        part.headers[part.header_name.lower()] = part.header_value
+        part.header_name = b""
+        part.header_value = b""
+
+    def on_headers_finished() -> None:
+        _, options = parse_options_header(part.headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise MultipartStreamError("multipart part without name")
+        part.name = options[b"name"].decode("utf-8", "replace")
+        if b"filename" in options:
+            part.is_file = True
+            raw_type = part.headers.get(b"content-type")
+            events.append(
+                FileStart(
+                    part.name,
+                    options[b"filename"].decode("utf-8", "replace"),
+                    raw_type.decode("latin-1") if raw_type else None,
+                )
+            )
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        if part.is_file:
+            events.append(FileChunk(data[start:end]))
+            return
+        part.data += data[start:end]
+        if len(part.data) > MAX_FIELD_BYTES:
+            raise MultipartStreamError("multipart field too large")
+
+    def on_part_end() -> None:
+        if part.is_file:
+            events.append(FileEnd(part.name))
+        else:
+            events.append(FieldPart(part.name, part.data.decode("utf-8", "replace")))
+
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    try:
+        async for chunk in stream:
+            parser.write(chunk)
+            for event in events:
+                yield event
+            events.clear()
+        parser.finalize()
+    except MultipartParseError as exc:
+        raise MultipartStreamError("malformed multipart body") from exc
+    for event in events:
+        yield event
@@ -1,13 +1,22 @@
-from fastapi import APIRouter, Depends, Request
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Query, Request
 
+from app.api.streaming import stream_text_response
 from app.core.auth import require_user
 from app.core.config import Settings, get_settings
+from app.core.json_response import JSONResponse, JSONRoute
 from app.schemas.ai import AnalyzeRequest, GenerateImageRequest
-from app.schemas.response import error_response, success_response
-from app.services.ai_service import APIError, analyze_text, generate_image
+from app.schemas.response import error_response, retry_after_headers, success_response
+from app.services.ai_service import (
+    APIError,
+    analyze_text_cached,
+    generate_image,
+    stream_text_cached,
+)
+from app.services.response_cache import cache_headers, wants_refresh
 
-router = APIRouter(prefix="/api/v1/ai", dependencies=[Depends(require_user)])
+router = APIRouter(
+    prefix="/api/v1/ai", dependencies=[Depends(require_user)], route_class=JSONRoute
+)
 
 
 @router.post("/analyze", response_model=None)
@@ -15,18 +24,36 @@ async def analyze(
     payload: AnalyzeRequest,
     request: Request,
     settings: Settings = Depends(get_settings),
+    stream: bool = Query(default=False),
 ):
     model = payload.model or settings.default_text_model
     request.state.step = "ai.analyze"
     request.state.model = model
     user_key = request.headers.get("x-user-gemini-key")
+    refresh = wants_refresh(request.headers.get("cache-control"))
     try:
-        result = await analyze_text(payload, user_key, settings)
-        return success_response(result)
+        if stream:
+            chunks, cache_status = await stream_text_cached(
+                payload, user_key, settings, refresh=refresh
+            )
+            return await stream_text_response(
+                request, chunks, success_response, cache_headers(cache_status)
+            )
+        result, cache_status = await analyze_text_cached(
+            payload,
+            user_key,
+            settings,
+            refresh=refresh,
+            user_id=getattr(request.state, "user_id", None),
+        )
+        return JSONResponse(
+            content=success_response(result), headers=cache_headers(cache_status)
+        )
     except APIError as exc:
         return JSONResponse(
             status_code=exc.status_code,
             content=error_response(exc.code, exc.message),
+            headers=retry_after_headers(exc.retry_after),
         )
 
 
@@ -41,10 +68,13 @@ async def generate_image_proxy(
     request.state.model = model
     user_key = request.headers.get("x-user-gemini-key")
     try:
-        result = await generate_image(payload, user_key, settings)
+        result = await generate_image(
+            payload, user_key, settings, getattr(request.state, "user_id", None)
+        )
         return success_response(result)
     except APIError as exc:
         return JSONResponse(
             status_code=exc.status_code,
             content=error_response(exc.code, exc.message),
+            headers=retry_after_headers(exc.retry_after),
         )
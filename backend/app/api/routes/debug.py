@@ -0,0 +1,121 @@
+import asyncio
+import os
+import re
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+
+from app.core.auth import require_admin
+from app.core.config import Settings, get_settings
+from app.core.json_response import JSONResponse, JSONRoute
+from app.core.profiler import ProfilerBusy, profile_path, profile_process
+from app.core.tracing import Trace, get_tracer
+from app.schemas.response import error_response, success_response
+
+router = APIRouter(
+    prefix="/debug",
+    tags=["debug"],
+    dependencies=[Depends(require_admin)],
+    route_class=JSONRoute,
+)
+
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def _not_found(message: str) -> JSONResponse:
+    return JSONResponse(status_code=404, content=error_response("NOT_FOUND", message))
+
+
+def _summary(trace: Trace) -> dict:
+    phases: dict[str, float] = {}
+    for span in trace.spans[1:]:
+        phases[span.name] = round(phases.get(span.name, 0.0) + span.duration_ms, 3)
+    return {
+        "trace_id": trace.trace_id,
+        "request_id": trace.request_id,
+        "duration_ms": trace.root.duration_ms,
+        "attributes": trace.root.attributes,
+        "spans": len(trace.spans),
+        "phases": dict(sorted(phases.items(), key=lambda item: item[1], reverse=True)),
+    }
+
+
+def _memory_sink(settings: Settings):
+    if not settings.debug_endpoints_enabled:
+        return None
+    tracer = get_tracer(settings)
+    return tracer.memory if tracer is not None else None
+
+
+@router.get("/traces")
+async def list_traces(
+    settings: Settings = Depends(get_settings),
+    limit: int = Query(default=20, ge=1, le=200),
+    min_ms: float = Query(default=0.0, ge=0),
+    sort: str = Query(default="recent"),
+    request_id: Optional[str] = Query(default=None),
+) -> dict:
+    """最近的请求追踪摘要；sort=slowest 按耗时倒序，用于定位长尾请求的慢阶段。"""
+    sink = _memory_sink(settings)
+    if sink is None:
+        return _not_found("tracing buffer disabled")
+    if request_id:
+        trace = sink.find(request_id)
+        return success_response([_summary(trace)] if trace else [])
+    traces = sink.recent(limit, min_ms, slowest=sort == "slowest")
+    return success_response([_summary(trace) for trace in traces])
+
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str, settings: Settings = Depends(get_settings)) -> dict:
+    sink = _memory_sink(settings)
+    if sink is None:
+        return _not_found("tracing buffer disabled")
+    trace = sink.get(trace_id)
+    if trace is None:
+        return _not_found("trace not found")
+    return success_response(trace.to_payload())
+
+
+def _collapsed_response(collapsed: str, filename: str) -> PlainTextResponse:
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.collapsed"'},
+    )
+
+
+@router.get("/profile")
+async def profile(
+    settings: Settings = Depends(get_settings),
+    seconds: float = Query(default=10.0, gt=0),
+):
+    """对整个进程采样 seconds 秒，返回 collapsed 栈，可直接交给 flamegraph.pl / speedscope。"""
+    if not settings.profiler_enabled:
+        return _not_found("profiler disabled")
+    try:
+        collapsed = await profile_process(min(seconds, settings.profiler_max_seconds), settings)
+    except ProfilerBusy:
+        return JSONResponse(
+            status_code=429,
+            content=error_response("RATE_LIMITED", "已有采样正在进行，请稍后重试。"),
+        )
+    return _collapsed_response(collapsed, "process")
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, settings: Settings = Depends(get_settings)):
+    """读取单请求采样结果，profile_id 即响应头 X-Profile-ID。"""
+    if not settings.profiler_enabled:
+        return _not_found("profiler disabled")
+    path = profile_path(settings, profile_id)
+    if not PROFILE_ID_PATTERN.match(profile_id) or not os.path.isfile(path):
+        return _not_found("profile not found")
+    collapsed = await asyncio.to_thread(_read_text, path)
+    return _collapsed_response(collapsed, profile_id)
+
+
+def _read_text(path: str) -> str:
+    with open(path, encoding="utf-8") as handle:
+        return handle.read()
@@ -3,18 +3,56 @@ import logging
 
 from fastapi import APIRouter, Depends
 
+from app.core.auth import token_cache_stats
 from app.core.config import Settings, get_settings
+from app.core.json_response import JSONRoute
+from app.core.profiler import profiler_stats
+from app.core.tracing import tracer_stats
 from app.schemas.response import success_response
+from app.services.admission import admission_stats
+from app.services.idempotency import get_idempotency_store
+from app.services.singleflight import singleflight_stats
+from app.services.upstream import get_upstream_pool
+from app.services.video_poller import get_video_poller
+from app.services.video_task_store import get_video_task_store
+from app.storage.backend import storage_backend_stats
+from app.storage.chunk_cache import chunk_cache_stats
+from app.storage.dedup import get_media_digest_index
+from app.storage.executor import get_storage_executor
+from app.storage.mirror import get_media_mirror
 
 logger = logging.getLogger("gridworkflow")
 
-router = APIRouter()
+router = APIRouter(route_class=JSONRoute)
 
 
 @router.get("/health")
 async def health(settings: Settings = Depends(get_settings)) -> dict:
     now = datetime.now(timezone.utc).isoformat()
+    task_store = get_video_task_store(settings)
+    digest_index = get_media_digest_index(settings)
+    mirror = get_media_mirror(settings)
     logger.info("health check ok env=%s", settings.env)
-    return success_response({"status": "ok", "env": settings.env, "timestamp": now})
+    return success_response(
+        {
+            "status": "ok",
+            "env": settings.env,
+            "timestamp": now,
+            "upstream": get_upstream_pool(settings).stats(),
+            "singleflight": singleflight_stats(),
+            "video_poller": get_video_poller(settings).stats(),
+            "admission": admission_stats(),
+            "idempotency": get_idempotency_store(settings).stats(),
+            "storage_executor": get_storage_executor(settings).stats(),
+            "video_task_store": task_store.stats() if task_store else None,
+            "media_dedup": digest_index.stats() if digest_index else None,
+            "storage": storage_backend_stats(),
+            "media_proxy_cache": chunk_cache_stats(),
+            "media_mirror": mirror.stats() if mirror else None,
+            "jwt_cache": token_cache_stats(),
+            "tracing": tracer_stats(),
+            "profiler": profiler_stats(),
+        }
+    )
 
 
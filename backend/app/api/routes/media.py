@@ -1,25 +1,62 @@
+import asyncio
 import logging
+import mimetypes
 import os
+import time
 from typing import Optional
 
-from fastapi import APIRouter, Depends, File, Form, Request, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, File, Form, Query, Request, UploadFile
+from fastapi.responses import Response
 
+from app.api.file_response import (
+    ChunkedFileResponse,
+    RangeNotSatisfiable,
+    RangeResponse,
+    parse_range,
+    unsatisfiable_headers,
+)
+from app.api.multipart import (
+    FieldPart,
+    FileChunk,
+    FileEnd,
+    FileStart,
+    MultipartStreamError,
+    iter_multipart,
+)
 from app.core.auth import require_user
 from app.core.config import Settings, get_settings
-from app.schemas.response import error_response, success_response
+from app.core.json_response import JSONResponse, JSONRoute
+from app.core.metrics import upload_bytes_in_flight, upload_bytes_total
+from app.schemas.media import MediaCompleteRequest, MediaUploadUrlRequest
+from app.schemas.response import error_response, retry_after_headers, success_response
+from app.services.upstream import get_upstream_pool
+from app.storage.backend import StorageBackend, get_storage_backend
+from app.storage.chunk_cache import get_chunk_cache
 from app.storage.cos_client import (
-    COSClient,
     COSConfigError,
     COSUploadError,
     MediaValidationError,
     build_object_key,
+    clamp_signed_ttl,
+    detect_content_type,
     validate_media,
 )
+from app.storage.dedup import MediaDigestIndex, MediaObject, get_media_digest_index, hash_fileobj
+from app.storage.executor import StorageBusyError, get_storage_executor
+from app.storage.local import LocalStorageBackend, MemoryStorageBackend
+from app.storage.mirror import get_media_mirror
+from app.storage.multipart import MultipartUploader
+from app.storage.proxy_url import build_proxy_url, verify_proxy_signature
+from app.storage.upload_token import UploadGrant, issue_upload_token, verify_upload_token
 
 logger = logging.getLogger("gridworkflow")
 
-router = APIRouter(dependencies=[Depends(require_user)])
+router = APIRouter(dependencies=[Depends(require_user)], route_class=JSONRoute)
+# 本地/内存存储的对象下载地址会直接出现在 <img>/<video> 中，与公有读的 COS 桶一样不要求登录
+files_router = APIRouter(route_class=JSONRoute)
+
+
+MAGIC_BYTES = 512
 
 
 def _get_upload_size(file: UploadFile) -> int:
@@ -74,7 +111,7 @@ async def upload_media(
         )
 
     try:
-        cos_client = COSClient(settings)
+        storage = get_storage_backend(settings)
     except COSConfigError:
         if source_url:
             logger.warning(
@@ -91,9 +128,36 @@ async def upload_media(
         settings.cos_media_prefix, media_type, file.filename, content_type
     )
 
+    executor = get_storage_executor(settings)
+    index = get_media_digest_index(settings)
+    deduplicated = False
     try:
-        cos_client.upload_fileobj(file.file, key, content_type)
-        result = cos_client.build_access_url(key)
+        digest = await executor.run(hash_fileobj, file.file) if index is not None else None
+        existing = await index.acquire(digest) if digest else None
+        if existing is not None:
+            key, deduplicated = existing.key, True
+        else:
+            # SDK 上传是阻塞调用，放到存储专用线程池里执行
+            upload_bytes_in_flight.inc(amount=size)
+            try:
+                await executor.run(storage.upload_fileobj, file.file, key, content_type)
+            finally:
+                upload_bytes_in_flight.dec(amount=size)
+            upload_bytes_total.inc(amount=size)
+            if digest:
+                key, deduplicated = await _register_digest(
+                    index,
+                    storage,
+                    settings,
+                    MediaObject(digest, media_type, key, content_type, size),
+                )
+    except StorageBusyError:
+        logger.warning("cos upload rejected request_id=%s reason=queue_full", request_id)
+        return JSONResponse(
+            status_code=429,
+            content=error_response("RATE_LIMITED", "too many uploads in progress"),
+            headers=retry_after_headers(executor.retry_after()),
+        )
     except COSUploadError:
         if source_url:
             logger.warning(
@@ -109,7 +173,466 @@ async def upload_media(
     finally:
         await file.close()
 
+    payload = _upload_payload(storage, key, settings)
+    if index is not None:
+        payload["deduplicated"] = deduplicated
+    return success_response(payload)
+
+
+async def _register_digest(
+    index: MediaDigestIndex, storage: StorageBackend, settings: Settings, item: MediaObject
+) -> tuple[str, bool]:
+    """登记新对象；并发上传了相同内容时保留先登记的对象，删除自己刚传的副本。"""
+    stored = await index.register(item)
+    if stored.key == item.key:
+        return item.key, False
+    await _discard_object(storage, item.key, settings)
+    return stored.key, True
+
+
+def _max_bytes(settings: Settings, media_type: str) -> int:
+    if media_type == "image":
+        return settings.cos_image_max_bytes
+    return settings.cos_video_max_bytes
+
+
+def _upload_payload(storage: StorageBackend, key: str, settings: Settings) -> dict:
+    result = storage.build_access_url(key)
     payload = {"url": result.url, "signed": result.signed}
     if result.expires_in:
         payload["expires_in"] = result.expires_in
-    return success_response(payload)
+    proxy_url = build_proxy_url(settings, key)
+    if proxy_url:
+        payload["proxy_url"] = proxy_url
+    return payload
+
+
+@router.post("/media/upload/stream")
+async def upload_media_stream(
+    request: Request,
+    settings: Settings = Depends(get_settings),
+) -> dict:
+    """流式上传：字段需在文件之前，文件边接收边按分片并行写入 COS，内存占用与文件大小无关。"""
+    request_id = getattr(request.state, "request_id", "unknown")
+    fields: dict[str, str] = {}
+    media_type = ""
+    file_start: Optional[FileStart] = None
+    head = bytearray()
+    uploader: Optional[MultipartUploader] = None
+    storage: Optional[StorageBackend] = None
+    executor = get_storage_executor(settings)
+    finished = False
+
+    def _bad_request(message: str) -> JSONResponse:
+        return JSONResponse(status_code=400, content=error_response("BAD_REQUEST", message))
+
+    async def _begin() -> Optional[JSONResponse]:
+        """读到文件头后校验类型并开始上传。"""
+        nonlocal uploader, storage
+        try:
+            content_type = validate_media(media_type, file_start.content_type, bytes(head))
+        except MediaValidationError as exc:
+            return JSONResponse(status_code=400, content=error_response(exc.code, exc.message))
+        try:
+            storage = get_storage_backend(settings)
+        except COSConfigError:
+            if fields.get("source_url"):
+                logger.warning(
+                    "cos not configured request_id=%s fallback=source_url", request_id
+                )
+                return JSONResponse(
+                    status_code=200,
+                    content=success_response({"url": fields["source_url"], "fallback": True}),
+                )
+            return JSONResponse(
+                status_code=503,
+                content=error_response("COS_NOT_CONFIGURED", "COS not configured"),
+            )
+        key = build_object_key(
+            settings.cos_media_prefix, media_type, file_start.filename, content_type
+        )
+        uploader = MultipartUploader(
+            storage,
+            executor,
+            key,
+            content_type,
+            part_size=settings.cos_part_size_bytes,
+            concurrency=settings.cos_part_concurrency,
+            max_retries=settings.cos_part_max_retries,
+        )
+        await uploader.write(bytes(head))
+        head.clear()
+        return None
+
+    try:
+        async for event in iter_multipart(
+            request.headers.get("content-type", ""), request.stream()
+        ):
+            if isinstance(event, FieldPart):
+                fields[event.name] = event.value
+            elif isinstance(event, FileStart):
+                media_type = fields.get("media_type", "")
+                if event.name != "file" or file_start is not None:
+                    return _bad_request("exactly one file field is allowed")
+                if media_type not in {"image", "video"}:
+                    return _bad_request("media_type must be image or video")
+                file_start = event
+            elif isinstance(event, FileChunk):
+                received = (uploader.size if uploader else 0) + len(head) + len(event.data)
+                if received > _max_bytes(settings, media_type):
+                    return _bad_request("file size not allowed")
+                if uploader is not None:
+                    await uploader.write(event.data)
+                    continue
+                head += event.data
+                if len(head) >= MAGIC_BYTES:
+                    rejected = await _begin()
+                    if rejected is not None:
+                        return rejected
+            elif isinstance(event, FileEnd):
+                if uploader is None:
+                    if not head:
+                        return _bad_request("file size not allowed")
+                    rejected = await _begin()
+                    if rejected is not None:
+                        return rejected
+                index = get_media_digest_index(settings)
+                existing = await index.acquire(uploader.sha256) if index is not None else None
+                if existing is not None:
+                    # 分片已经传了一部分，放弃本次上传，直接复用已有对象
+                    await uploader.abort()
+                    finished = True
+                    payload = _upload_payload(storage, existing.key, settings)
+                    payload.update(
+                        {"size": existing.size, "sha256": existing.digest, "deduplicated": True}
+                    )
+                    return success_response(payload)
+                stored = await uploader.finish()
+                finished = True
+                logger.info(
+                    "cos stream upload done request_id=%s parts=%d retries=%d step=media_upload",
+                    request_id,
+                    stored.parts,
+                    uploader.retries,
+                )
+                key = stored.key
+                if index is not None:
+                    key, deduplicated = await _register_digest(
+                        index,
+                        storage,
+                        settings,
+                        MediaObject(
+                            stored.sha256, media_type, stored.key, uploader.content_type, stored.size
+                        ),
+                    )
+                payload = _upload_payload(storage, key, settings)
+                payload.update({"size": stored.size, "sha256": stored.sha256})
+                if index is not None:
+                    payload["deduplicated"] = deduplicated
+                return success_response(payload)
+    except MultipartStreamError as exc:
+        return _bad_request(str(exc))
+    except StorageBusyError:
+        logger.warning("cos upload rejected request_id=%s reason=queue_full", request_id)
+        return JSONResponse(
+            status_code=429,
+            content=error_response("RATE_LIMITED", "too many uploads in progress"),
+            headers=retry_after_headers(executor.retry_after()),
+        )
+    except COSUploadError:
+        logger.error("cos upload failed request_id=%s", request_id)
+        return JSONResponse(
+            status_code=502,
+            content=error_response("COS_UPLOAD_FAILED", "media upload failed"),
+        )
+    finally:
+        if uploader is not None and not finished:
+            await uploader.abort()
+
+    return _bad_request("file is required")
+
+
+@router.post("/media/upload-url")
+async def create_upload_url(
+    payload: MediaUploadUrlRequest,
+    request: Request,
+    settings: Settings = Depends(get_settings),
+) -> dict:
+    """签发 COS 直传地址，文件不再经过后端；上传完成后调用 /media/complete 校验。"""
+    media_type = payload.media_type
+    if media_type not in {"image", "video"}:
+        return JSONResponse(
+            status_code=400,
+            content=error_response("BAD_REQUEST", "media_type must be image or video"),
+        )
+    if payload.size > _max_bytes(settings, media_type):
+        return JSONResponse(
+            status_code=400,
+            content=error_response("BAD_REQUEST", "file size not allowed"),
+        )
+    try:
+        # 此时拿不到文件头，只校验声明的类型，魔数在 complete 时检查
+        content_type = validate_media(media_type, payload.content_type, b"")
+    except MediaValidationError as exc:
+        return JSONResponse(status_code=400, content=error_response(exc.code, exc.message))
+
+    try:
+        storage = get_storage_backend(settings)
+    except COSConfigError:
+        return JSONResponse(
+            status_code=503,
+            content=error_response("COS_NOT_CONFIGURED", "COS not configured"),
+        )
+    if not storage.supports_presigned_upload:
+        return JSONResponse(
+            status_code=503,
+            content=error_response("COS_NOT_CONFIGURED", "direct upload requires COS"),
+        )
+
+    key = build_object_key(
+        settings.cos_media_prefix, media_type, payload.filename, content_type
+    )
+    expires_in = clamp_signed_ttl(settings.cos_upload_url_ttl_seconds)
+    upload_url = storage.presign_put_url(key, content_type, payload.size, expires_in)
+    grant = UploadGrant(
+        user_id=request.state.user_id,
+        key=key,
+        media_type=media_type,
+        content_type=content_type,
+        size=payload.size,
+        expires_at=int(time.time()) + expires_in,
+    )
+    return success_response(
+        {
+            "upload_url": upload_url,
+            "method": "PUT",
+            "headers": {"Content-Type": content_type},
+            "expires_in": expires_in,
+            "upload_token": issue_upload_token(settings.cos_secret_key, grant),
+        }
+    )
+
+
+async def _discard_object(storage: StorageBackend, key: str, settings: Settings) -> None:
+    try:
+        await get_storage_executor(settings).run(storage.delete_object, key)
+    except (COSUploadError, StorageBusyError):
+        logger.warning("cos delete rejected object failed step=media_complete")
+
+
+@router.post("/media/complete")
+async def complete_upload(
+    payload: MediaCompleteRequest,
+    request: Request,
+    settings: Settings = Depends(get_settings),
+) -> dict:
+    """确认直传对象存在、大小与声明一致，并用范围读取检查文件魔数。"""
+    request_id = getattr(request.state, "request_id", "unknown")
+    try:
+        storage = get_storage_backend(settings)
+    except COSConfigError:
+        return JSONResponse(
+            status_code=503,
+            content=error_response("COS_NOT_CONFIGURED", "COS not configured"),
+        )
+    try:
+        grant = verify_upload_token(
+            settings.cos_secret_key,
+            payload.upload_token,
+            request.state.user_id,
+            grace_seconds=settings.cos_upload_complete_grace_seconds,
+        )
+    except MediaValidationError as exc:
+        status_code = 403 if exc.code == "FORBIDDEN" else 400
+        return JSONResponse(
+            status_code=status_code, content=error_response(exc.code, exc.message)
+        )
+
+    executor = get_storage_executor(settings)
+    try:
+        size = await executor.run(storage.head_object_size, grant.key)
+        if size is None:
+            return JSONResponse(
+                status_code=404,
+                content=error_response("NOT_FOUND", "uploaded object not found"),
+            )
+        if size != grant.size or size > _max_bytes(settings, grant.media_type):
+            await _discard_object(storage, grant.key, settings)
+            return JSONResponse(
+                status_code=400,
+                content=error_response("BAD_REQUEST", "file size not allowed"),
+            )
+        head = await executor.run(storage.read_range, grant.key, 0, MAGIC_BYTES - 1)
+        try:
+            validate_media(grant.media_type, grant.content_type, head)
+            if detect_content_type(grant.media_type, head) is None:
+                raise MediaValidationError("BAD_REQUEST", "media signature mismatch")
+        except MediaValidationError as exc:
+            await _discard_object(storage, grant.key, settings)
+            return JSONResponse(
+                status_code=400, content=error_response(exc.code, exc.message)
+            )
+    except StorageBusyError:
+        return JSONResponse(
+            status_code=429,
+            content=error_response("RATE_LIMITED", "too many uploads in progress"),
+            headers=retry_after_headers(executor.retry_after()),
+        )
+    except COSUploadError:
+        logger.error("cos complete check failed request_id=%s", request_id)
+        return JSONResponse(
+            status_code=502,
+            content=error_response("COS_UPLOAD_FAILED", "media upload failed"),
+        )
+
+    return success_response(_upload_payload(storage, grant.key, settings))
+
+
+@router.get("/media/mirror/{mirror_id}")
+async def mirror_status(
+    mirror_id: str,
+    request: Request,
+    settings: Settings = Depends(get_settings),
+) -> dict:
+    """查询生成结果转存进度，id 来自工作流响应中的 *_mirror 字段。"""
+    mirror = get_media_mirror(settings)
+    job = mirror.get(mirror_id) if mirror is not None else None
+    if job is None or job.user_id != request.state.user_id:
+        return JSONResponse(
+            status_code=404,
+            content=error_response("NOT_FOUND", "mirror job not found"),
+        )
+    return success_response(job.to_payload())
+
+
+@files_router.api_route("/media/files/{key:path}", methods=["GET", "HEAD"])
+async def serve_media_file(
+    key: str,
+    request: Request,
+    settings: Settings = Depends(get_settings),
+) -> Response:
+    """提供本地/内存存储中的对象，支持 Range；COS 存储下对象由 COS 直接提供。"""
+    try:
+        storage = get_storage_backend(settings)
+    except COSConfigError:
+        storage = None
+    if not isinstance(storage, (LocalStorageBackend, MemoryStorageBackend)):
+        return JSONResponse(
+            status_code=404, content=error_response("NOT_FOUND", "object not found")
+        )
+    path = storage.object_path(key)
+    size = os.path.getsize(path) if path else storage.head_object_size(key)
+    if size is None:
+        return JSONResponse(
+            status_code=404, content=error_response("NOT_FOUND", "object not found")
+        )
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except RangeNotSatisfiable:
+        return JSONResponse(
+            status_code=416,
+            content=error_response("BAD_REQUEST", "range not satisfiable"),
+            headers=unsatisfiable_headers(size),
+        )
+
+    async def _read_chunk(start: int, end: int) -> bytes:
+        return await asyncio.to_thread(storage.read_range, key, start, end)
+
+    return RangeResponse(
+        size,
+        storage.content_type_of(key),
+        byte_range,
+        path=path,
+        read_chunk=_read_chunk,
+        # 对象 key 含随机 uuid，内容不会变化
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+def _not_found() -> JSONResponse:
+    return JSONResponse(status_code=404, content=error_response("NOT_FOUND", "object not found"))
+
+
+def _chunk_source(storage: StorageBackend, key: str, settings: Settings):
+    """缓存块的回源方式：COS 走 HTTP Range 流式下载，其余存储直接按区间读取。"""
+
+    async def _from_url(start: int, end: int):
+        url = storage.build_access_url(key).url
+        async with get_upstream_pool(settings).stream(
+            "GET",
+            url,
+            timeout_seconds=settings.media_mirror_timeout_sec,
+            headers={"Range": f"bytes={start}-{end}"},
+        ) as response:
+            if response.status_code not in {200, 206}:
+                raise COSUploadError("proxy origin fetch failed")
+            async for data in response.aiter_bytes():
+                yield data
+
+    async def _from_storage(start: int, end: int):
+        yield await asyncio.to_thread(storage.read_range, key, start, end)
+
+    return _from_url if storage.name == "cos" else _from_storage
+
+
+@files_router.api_route("/media/proxy/{key:path}", methods=["GET", "HEAD"])
+async def proxy_media(
+    key: str,
+    request: Request,
+    expires: Optional[int] = Query(default=None),
+    signature: Optional[str] = Query(default=None),
+    settings: Settings = Depends(get_settings),
+) -> Response:
+    """带 Range 的媒体代理：内容按块缓存在本地磁盘，视频拖动进度时不再回源。"""
+    if not settings.media_proxy_enabled:
+        return _not_found()
+    if not verify_proxy_signature(settings, key, expires, signature):
+        return JSONResponse(
+            status_code=403, content=error_response("FORBIDDEN", "invalid proxy signature")
+        )
+    try:
+        storage = get_storage_backend(settings)
+    except COSConfigError:
+        return _not_found()
+
+    cache = get_chunk_cache(settings)
+    path = storage.object_path(key) if isinstance(storage, LocalStorageBackend) else None
+    size = os.path.getsize(path) if path else cache.known_size(key)
+    try:
+        if size is None:
+            size = await get_storage_executor(settings).run(storage.head_object_size, key)
+    except StorageBusyError:
+        return JSONResponse(
+            status_code=429,
+            content=error_response("RATE_LIMITED", "too many storage requests"),
+            headers=retry_after_headers(get_storage_executor(settings).retry_after()),
+        )
+    except COSUploadError:
+        return JSONResponse(
+            status_code=502, content=error_response("UPSTREAM_ERROR", "media origin unavailable")
+        )
+    if size is None:
+        return _not_found()
+    cache.remember_size(key, size)
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except RangeNotSatisfiable:
+        return JSONResponse(
+            status_code=416,
+            content=error_response("BAD_REQUEST", "range not satisfiable"),
+            headers=unsatisfiable_headers(size),
+        )
+
+    media_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+    headers = {"Cache-Control": "private, max-age=3600"}
+    if path:
+        # 本地磁盘存储本身就是文件，无需再缓存一份
+        return RangeResponse(size, media_type, byte_range, path=path, headers=headers)
+    source = _chunk_source(storage, key, settings)
+
+    async def _open_chunk(index: int):
+        return await cache.open_chunk(key, index, size, source)
+
+    return ChunkedFileResponse(
+        size, media_type, cache.chunk_size, _open_chunk, byte_range, headers=headers
+    )
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import Response
+
+from app.core.config import Settings, get_settings
+from app.core.json_response import JSONResponse, JSONRoute
+from app.core.metrics import CONTENT_TYPE, render_metrics
+from app.schemas.response import error_response
+
+router = APIRouter(route_class=JSONRoute)
+
+
+@router.get("/metrics")
+async def metrics(settings: Settings = Depends(get_settings)) -> Response:
+    """Prometheus 文本格式的进程内指标，供抓取使用。"""
+    if not settings.metrics_enabled:
+        return JSONResponse(status_code=404, content=error_response("NOT_FOUND", "metrics disabled"))
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
@@ -1,27 +1,48 @@
+import asyncio
 import logging
 import math
+from typing import Any, Optional
 
-from fastapi import APIRouter, Depends, Header, Query, Request
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Header, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
 
-from app.core.auth import require_user, require_user_or_allowlisted
+from app.core.auth import (
+    AuthError,
+    authenticate_websocket,
+    require_user,
+    require_user_or_allowlisted,
+)
 from app.core.config import Settings, get_settings
-from app.schemas.response import error_response, success_response
-from app.schemas.video import VideoGenerateRequest
+from app.core.json_codec import dumps_str
+from app.core.json_response import JSONResponse, JSONRoute
+from app.core.sse import SSE_HEADERS, SSE_MEDIA_TYPE, format_sse, format_sse_comment
+from app.schemas.response import error_response, retry_after_headers, success_response
+from app.schemas.video import VideoGenerateRequest, VideoStatusBatchRequest
+from app.services.admission import AdmissionRejected, get_admission_controller
+from app.services.idempotency import (
+    IdempotencyConflict,
+    build_fingerprint,
+    get_idempotency_store,
+    is_valid_idempotency_key,
+)
+from app.services.video_poller import (
+    VideoStatusPoller,
+    format_event_id,
+    get_video_poller,
+    parse_event_id,
+)
+from app.services.video_task_store import get_video_task_store
 from app.services.video_service import (
     UpstreamServiceError,
-    extract_video_url,
     get_video_provider_registry,
     is_valid_task_id,
     mask_task_id,
-    normalize_status,
-    sanitize_error_message,
 )
 
 logger = logging.getLogger("gridworkflow")
 
 # 仅处理视频生成和状态查询，Step1-Step4 由 workflow.py 处理
-router = APIRouter(prefix="/api/v1/video", tags=["video"])
+router = APIRouter(prefix="/api/v1/video", tags=["video"], route_class=JSONRoute)
 
 ALLOWED_MODELS = {"sora-2", "sora-2-pro"}
 ALLOWED_DURATIONS = {10, 15, 25}
@@ -32,13 +53,72 @@ def _get_request_id(request: Request) -> str:
     return getattr(request.state, "request_id", "unknown")
 
 
+def _parse_task_ids(raw: str) -> list[str]:
+    return list(dict.fromkeys(item.strip() for item in raw.split(",") if item.strip()))
+
+
+def _check_watch_request(
+    task_ids: list[str], provider: str, settings: Settings, user_key: Optional[str]
+) -> Optional[tuple[int, str, str]]:
+    if not task_ids:
+        return 400, "BAD_REQUEST", "task_ids 不能为空。"
+    if len(task_ids) > settings.video_events_max_tasks:
+        return 400, "BAD_REQUEST", f"task_ids 最多 {settings.video_events_max_tasks} 个。"
+    if not all(is_valid_task_id(task_id) for task_id in task_ids):
+        return 400, "BAD_REQUEST", "task_id 格式不正确。"
+    if not (user_key or settings.ai_gateway_api_key):
+        return 401, "UNAUTHORIZED", "缺少上游 API Key。"
+    if get_video_provider_registry(settings).get(provider) is None:
+        return 400, "BAD_REQUEST", "provider 不支持。"
+    return None
+
+
+async def _start_watch(
+    poller: VideoStatusPoller,
+    provider: str,
+    task_ids: list[str],
+    user_key: Optional[str],
+    settings: Settings,
+    user_id: Optional[str] = None,
+) -> tuple[list, list[tuple[str, UpstreamServiceError]]]:
+    """先拿到每个任务的当前状态；查询失败的任务单独报告，不进入订阅。"""
+    provider_instance = get_video_provider_registry(settings).get(provider)
+    results = await asyncio.gather(
+        *(
+            poller.get_status(provider, provider_instance, task_id, user_key, user_id)
+            for task_id in task_ids
+        ),
+        return_exceptions=True,
+    )
+    entries = []
+    failures: list[tuple[str, UpstreamServiceError]] = []
+    for task_id, result in zip(task_ids, results):
+        if isinstance(result, UpstreamServiceError):
+            failures.append((task_id, result))
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            entries.append(poller.track(provider, provider_instance, task_id, user_key))
+    return entries, failures
+
+
+def _task_error(task_id: str, exc: UpstreamServiceError) -> dict:
+    return {**error_response(exc.code, exc.message), "task_id": task_id}
+
+
 @router.post("/generate", dependencies=[Depends(require_user)])
 async def generate_video(
     payload: VideoGenerateRequest,
     request: Request,
     settings: Settings = Depends(get_settings),
     x_user_gemini_key: str | None = Header(default=None, alias="x-user-gemini-key"),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
 ) -> JSONResponse:
+    if idempotency_key is not None and not is_valid_idempotency_key(idempotency_key):
+        return JSONResponse(
+            status_code=400,
+            content=error_response("BAD_REQUEST", "Idempotency-Key 格式不正确。"),
+        )
     if payload.model not in ALLOWED_MODELS:
         return JSONResponse(
             status_code=400,
@@ -96,29 +176,76 @@ async def generate_video(
         payload.aspect_ratio,
     )
 
+    user_id = getattr(request.state, "user_id", None)
+
+    async def _generate() -> Any:
+        controller = get_admission_controller("video", settings)
+        if controller is None:
+            return await provider.generate(upstream_payload, x_user_gemini_key)
+        try:
+            async with controller.slot(user_id, payload.model):
+                return await provider.generate(upstream_payload, x_user_gemini_key)
+        except AdmissionRejected as exc:
+            raise UpstreamServiceError(
+                "RATE_LIMITED", "当前生成请求较多，请稍后重试。", 429, exc.retry_after
+            ) from exc
+
+    async def _submit() -> str:
+        result = await _generate()
+        task_id = result.get("task_id") if isinstance(result, dict) else None
+        if not task_id or not is_valid_task_id(task_id):
+            logger.warning(
+                "video generate invalid task_id request_id=%s task_id=%s step=video_generate",
+                _get_request_id(request),
+                mask_task_id(str(task_id or "")),
+            )
+            raise UpstreamServiceError("UPSTREAM_ERROR", "上游返回异常，请稍后重试。", 502)
+        # 创建即开始后台轮询，并以 queued 作为初始状态，首个状态查询无需回源；
+        # 放在这里是为了首个请求断开时（幂等结果仍会保留）任务也照常被跟踪
+        get_video_poller(settings).track(
+            payload.provider, provider, task_id, x_user_gemini_key, initial_status="queued"
+        )
+        task_store = get_video_task_store(settings)
+        if task_store is not None:
+            task_store.record_created(task_id, user_id)
+        return task_id
+
+    replayed = False
     try:
-        result = await provider.generate(upstream_payload, x_user_gemini_key)
+        if idempotency_key and user_id:
+            task_id, replayed = await get_idempotency_store(settings).run(
+                user_id,
+                idempotency_key,
+                build_fingerprint({**upstream_payload, "provider": payload.provider}),
+                _submit,
+            )
+        else:
+            task_id = await _submit()
+    except IdempotencyConflict:
+        return JSONResponse(
+            status_code=400,
+            content=error_response("BAD_REQUEST", "Idempotency-Key 已用于不同的请求。"),
+        )
     except UpstreamServiceError as exc:
         return JSONResponse(
             status_code=exc.status_code,
             content=error_response(exc.code, exc.message),
+            headers=retry_after_headers(exc.retry_after),
         )
 
-    task_id = result.get("task_id") if isinstance(result, dict) else None
-    if not task_id or not is_valid_task_id(task_id):
-        logger.warning(
-            "video generate invalid task_id request_id=%s task_id=%s step=video_generate",
+    headers = None
+    if replayed:
+        logger.info(
+            "video generate replayed request_id=%s task_id=%s step=video_generate",
             _get_request_id(request),
-            mask_task_id(str(task_id or "")),
-        )
-        return JSONResponse(
-            status_code=502,
-            content=error_response("UPSTREAM_ERROR", "上游返回异常，请稍后重试。"),
+            mask_task_id(task_id),
         )
+        headers = {"Idempotent-Replayed": "true"}
 
     return JSONResponse(
         status_code=200,
         content=success_response({"task_id": task_id}),
+        headers=headers,
     )
 
 
@@ -156,20 +283,85 @@ async def video_status(
     )
 
     try:
-        result = await provider_instance.status(task_id, x_user_gemini_key)
+        snapshot = await get_video_poller(settings).get_status(
+            provider.lower(),
+            provider_instance,
+            task_id,
+            x_user_gemini_key,
+            getattr(request.state, "user_id", None),
+        )
     except UpstreamServiceError as exc:
         return JSONResponse(
             status_code=exc.status_code,
             content=error_response(exc.code, exc.message),
         )
 
-    status = normalize_status(result.get("status") if isinstance(result, dict) else None)
-    fail_reason = None
-    if isinstance(result, dict):
-        fail_reason = sanitize_error_message(result.get("fail_reason"))
-    if status != "failed":
-        fail_reason = None
-    video_url = extract_video_url(result.get("data") if isinstance(result, dict) else None)
+    poll_interval_ms = max(settings.video_poll_interval_ms, 3000)
+    headers = {
+        "X-Poll-Interval-Ms": str(poll_interval_ms),
+        "Retry-After": str(max(1, math.ceil(poll_interval_ms / 1000))),
+    }
+    return JSONResponse(
+        status_code=200,
+        content=success_response(snapshot.to_payload()),
+        headers=headers,
+    )
+
+
+@router.post("/status:batch", dependencies=[Depends(require_user_or_allowlisted)])
+async def video_status_batch(
+    payload: VideoStatusBatchRequest,
+    request: Request,
+    settings: Settings = Depends(get_settings),
+    x_user_gemini_key: str | None = Header(default=None, alias="x-user-gemini-key"),
+) -> JSONResponse:
+    """一次查询多个任务，items 与去重后的 task_ids 一一对应，每项自带 ok/data/error。"""
+    if len(payload.task_ids) > settings.video_status_batch_max:
+        return JSONResponse(
+            status_code=400,
+            content=error_response(
+                "BAD_REQUEST", f"task_ids 最多 {settings.video_status_batch_max} 个。"
+            ),
+        )
+    if not all(is_valid_task_id(task_id) for task_id in payload.task_ids):
+        return JSONResponse(
+            status_code=400,
+            content=error_response("BAD_REQUEST", "task_id 格式不正确。"),
+        )
+    if not (x_user_gemini_key or settings.ai_gateway_api_key):
+        return JSONResponse(
+            status_code=401,
+            content=error_response("UNAUTHORIZED", "缺少上游 API Key。"),
+        )
+
+    registry = get_video_provider_registry(settings)
+    provider_instance = registry.get(payload.provider)
+    if provider_instance is None:
+        return JSONResponse(
+            status_code=400,
+            content=error_response("BAD_REQUEST", "provider 不支持。"),
+        )
+
+    logger.info(
+        "video status batch request request_id=%s tasks=%d step=video_status_batch",
+        _get_request_id(request),
+        len(payload.task_ids),
+    )
+
+    results = await get_video_poller(settings).get_status_many(
+        payload.provider,
+        provider_instance,
+        payload.task_ids,
+        x_user_gemini_key,
+        settings.video_status_batch_concurrency,
+        getattr(request.state, "user_id", None),
+    )
+    items = []
+    for task_id, result in zip(payload.task_ids, results):
+        if isinstance(result, UpstreamServiceError):
+            items.append(_task_error(task_id, result))
+        else:
+            items.append({**success_response(result.to_payload()), "task_id": task_id})
 
     poll_interval_ms = max(settings.video_poll_interval_ms, 3000)
     headers = {
@@ -178,14 +370,119 @@ async def video_status(
     }
     return JSONResponse(
         status_code=200,
-        content=success_response(
-            {
-                "task_id": task_id,
-                "provider": provider.lower(),
-                "status": status,
-                "video_url": video_url,
-                "error_message": fail_reason,
-            }
-        ),
+        content=success_response({"items": items}),
         headers=headers,
     )
+
+
+@router.get("/events", dependencies=[Depends(require_user_or_allowlisted)])
+async def video_events(
+    request: Request,
+    settings: Settings = Depends(get_settings),
+    task_ids: str = Query(default=""),
+    provider: str = Query(default="t8star"),
+    last_event_id: str | None = Query(default=None),
+    last_event_id_header: str | None = Header(default=None, alias="Last-Event-ID"),
+    x_user_gemini_key: str | None = Header(default=None, alias="x-user-gemini-key"),
+) -> Response:
+    """订阅一个或多个任务的状态变化（SSE），事件 id 为“进程纪元-快照版本号”，可用 Last-Event-ID 续传。"""
+    provider = provider.lower()
+    ids = _parse_task_ids(task_ids)
+    problem = _check_watch_request(ids, provider, settings, x_user_gemini_key)
+    if problem:
+        status_code, code, message = problem
+        return JSONResponse(status_code=status_code, content=error_response(code, message))
+
+    logger.info(
+        "video events subscribe request_id=%s tasks=%d step=video_events",
+        _get_request_id(request),
+        len(ids),
+    )
+
+    poller = get_video_poller(settings)
+    entries, failures = await _start_watch(
+        poller,
+        provider,
+        ids,
+        x_user_gemini_key,
+        settings,
+        getattr(request.state, "user_id", None),
+    )
+    resume_from = parse_event_id(last_event_id_header or last_event_id)
+
+    async def _events():
+        yield f"retry: {max(settings.video_poll_interval_ms, 1000)}\n\n"
+        for task_id, exc in failures:
+            yield format_sse(_task_error(task_id, exc), event="error")
+        async for snapshot in poller.watch(
+            entries,
+            resume_from,
+            settings.video_events_heartbeat_sec,
+            settings.video_events_buffer_size,
+        ):
+            if snapshot is None:
+                yield format_sse_comment("ping")
+                continue
+            yield format_sse(
+                success_response(snapshot.to_payload()),
+                event="status",
+                event_id=format_event_id(snapshot),
+            )
+        yield format_sse(success_response(None), event="end")
+
+    return StreamingResponse(_events(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+
+
+@router.websocket("/ws")
+async def video_events_ws(
+    websocket: WebSocket,
+    task_ids: str = Query(default=""),
+    provider: str = Query(default="t8star"),
+    last_event_id: str | None = Query(default=None),
+) -> None:
+    """/events 的 WebSocket 版本，消息格式为 {"event","id","data"}。"""
+    settings = get_settings()
+    try:
+        user_id = authenticate_websocket(websocket, settings)
+    except AuthError as exc:
+        await websocket.close(code=4401, reason=exc.message)
+        return
+
+    provider = provider.lower()
+    user_key = websocket.headers.get("x-user-gemini-key")
+    ids = _parse_task_ids(task_ids)
+    problem = _check_watch_request(ids, provider, settings, user_key)
+    if problem:
+        status_code, _code, message = problem
+        await websocket.close(code=4000 + status_code, reason=message)
+        return
+
+    await websocket.accept()
+    poller = get_video_poller(settings)
+    try:
+        entries, failures = await _start_watch(
+            poller, provider, ids, user_key, settings, user_id
+        )
+        for task_id, exc in failures:
+            await websocket.send_text(
+                dumps_str({"event": "error", "data": _task_error(task_id, exc)})
+            )
+        async for snapshot in poller.watch(
+            entries,
+            parse_event_id(last_event_id),
+            settings.video_events_heartbeat_sec,
+            settings.video_events_buffer_size,
+        ):
+            if snapshot is None:
+                message = {"event": "ping"}
+            else:
+                message = {
+                    "event": "status",
+                    "id": format_event_id(snapshot),
+                    "data": success_response(snapshot.to_payload()),
+                }
+            await websocket.send_text(dumps_str(message))
+        await websocket.send_text(dumps_str({"event": "end", "data": success_response(None)}))
+        await websocket.close()
+    except WebSocketDisconnect:
+        return
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import Callable, Optional
 
-from fastapi import APIRouter, Depends, Request
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import Response
 
+from app.api.streaming import stream_text_response
 from app.core.auth import require_user
 from app.core.config import Settings, get_settings
+from app.core.json_response import JSONResponse, JSONRoute
+from app.core.tracing import span
 from app.core.prompts import (
     build_anchor_context,
     build_concept_prompt,
@@ -16,17 +19,29 @@ from app.core.prompts import (
     build_video_prompt_system,
 )
 from app.schemas.ai import AnalyzeRequest, GenerateImageRequest
-from app.schemas.response import error_response, success_response
+from app.schemas.response import error_response, retry_after_headers, success_response
 from app.schemas.workflow import (
     ConceptRequest,
     StoryboardGenerateRequest,
     StoryboardPlanRequest,
     VideoPromptRequest,
 )
-from app.services.ai_service import APIError, analyze_text, generate_image
+from app.services.ai_service import (
+    APIError,
+    analyze_text_cached,
+    generate_image,
+    stream_text_cached,
+)
+from app.services.response_cache import cache_headers, wants_refresh
 from app.services.workflow_service import extract_first_image_url, select_reference_image
+from app.storage.mirror import MIRROR_DONE, get_media_mirror
 
-router = APIRouter(prefix="/api/v1", tags=["workflow"], dependencies=[Depends(require_user)])
+router = APIRouter(
+    prefix="/api/v1",
+    tags=["workflow"],
+    dependencies=[Depends(require_user)],
+    route_class=JSONRoute,
+)
 
 ALLOWED_ASPECT_RATIOS = {"16:9", "9:16"}
 ALLOWED_IMAGE_SIZES = {"1K", "2K", "4K"}
@@ -50,8 +65,39 @@ def _field_required_message(field_name: str) -> str:
     return f"{field_name} \u5b57\u6bb5\u4e0d\u80fd\u4e3a\u7a7a\u3002"
 
 
-def _error_response(status_code: int, code: str, message: str) -> JSONResponse:
-    return JSONResponse(status_code=status_code, content=error_response(code, message))
+def _error_response(
+    status_code: int, code: str, message: str, headers: Optional[dict] = None
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code, content=error_response(code, message), headers=headers
+    )
+
+
+async def _mirror_image(
+    image_url: str, settings: Settings, user_id: Optional[str]
+) -> tuple[str, Optional[dict]]:
+    """短暂等待转存完成以便直接返回 COS 地址；未完成时返回原地址和转存状态。"""
+    mirror = get_media_mirror(settings)
+    if mirror is None:
+        return image_url, None
+    with span("media.mirror_wait") as current:
+        job = await mirror.wait(
+            mirror.submit(image_url, "image", user_id), settings.media_mirror_wait_ms / 1000
+        )
+        current.set("mirror_status", job.status)
+    return (job.url if job.status == MIRROR_DONE else image_url), job.to_payload()
+
+
+def _text_step_finalizer(field_name: str) -> Callable[[str], dict]:
+    """流式文本步骤结束时的信封，与非流式分支的校验保持一致。"""
+
+    def _finalize(text: str) -> dict:
+        value = text.strip()
+        if not value:
+            return error_response("UPSTREAM_ERROR", _UPSTREAM_MESSAGE)
+        return success_response({field_name: value})
+
+    return _finalize
 
 
 @router.post("/concept")
@@ -75,8 +121,9 @@ async def concept(
     if image_size not in ALLOWED_IMAGE_SIZES:
         return _error_response(400, "BAD_REQUEST", _IMAGE_SIZE_MESSAGE)
 
-    concept_prompt = build_concept_prompt(style, plot, payload.anchors, aspect_ratio)
-    reference_image = select_reference_image(payload.anchors)
+    with span("workflow.build_prompt"):
+        concept_prompt = build_concept_prompt(style, plot, payload.anchors, aspect_ratio)
+        reference_image = select_reference_image(payload.anchors)
 
     request.state.step = "workflow.concept"
     request.state.model = settings.default_image_model
@@ -92,28 +139,33 @@ async def concept(
             ),
             user_key,
             settings,
+            getattr(request.state, "user_id", None),
         )
     except APIError as exc:
-        return _error_response(exc.status_code, exc.code, exc.message)
+        return _error_response(
+            exc.status_code, exc.code, exc.message, retry_after_headers(exc.retry_after)
+        )
 
     image_url = extract_first_image_url(result)
     if not image_url:
         return _error_response(502, "UPSTREAM_ERROR", _UPSTREAM_MESSAGE)
-
-    return JSONResponse(
-        status_code=200,
-        content=success_response(
-            {"concept_prompt": concept_prompt, "concept_image_url": image_url}
-        ),
+    image_url, mirror = await _mirror_image(
+        image_url, settings, getattr(request.state, "user_id", None)
     )
 
+    data = {"concept_prompt": concept_prompt, "concept_image_url": image_url}
+    if mirror is not None:
+        data["concept_image_mirror"] = mirror
+    return JSONResponse(status_code=200, content=success_response(data))
+
 
 @router.post("/storyboard/plan")
 async def storyboard_plan(
     payload: StoryboardPlanRequest,
     request: Request,
     settings: Settings = Depends(get_settings),
-) -> JSONResponse:
+    stream: bool = Query(default=False),
+) -> Response:
     style = _normalize_text(payload.style)
     if not style:
         return _error_response(400, "BAD_REQUEST", _field_required_message("style"))
@@ -136,14 +188,30 @@ async def storyboard_plan(
     request.state.step = "workflow.storyboard_plan"
     request.state.model = settings.default_text_model
     user_key = request.headers.get("x-user-gemini-key")
+    text_request = AnalyzeRequest(prompt=prompt, system_instruction=system_instruction)
+    refresh = wants_refresh(request.headers.get("cache-control"))
     try:
-        result = await analyze_text(
-            AnalyzeRequest(prompt=prompt, system_instruction=system_instruction),
+        if stream:
+            chunks, cache_status = await stream_text_cached(
+                text_request, user_key, settings, refresh=refresh
+            )
+            return await stream_text_response(
+                request,
+                chunks,
+                _text_step_finalizer("storyboard_prompt"),
+                cache_headers(cache_status),
+            )
+        result, cache_status = await analyze_text_cached(
+            text_request,
             user_key,
             settings,
+            refresh=refresh,
+            user_id=getattr(request.state, "user_id", None),
         )
     except APIError as exc:
-        return _error_response(exc.status_code, exc.code, exc.message)
+        return _error_response(
+            exc.status_code, exc.code, exc.message, retry_after_headers(exc.retry_after)
+        )
 
     if not isinstance(result, str):
         return _error_response(502, "UPSTREAM_ERROR", _UPSTREAM_MESSAGE)
@@ -152,7 +220,9 @@ async def storyboard_plan(
         return _error_response(502, "UPSTREAM_ERROR", _UPSTREAM_MESSAGE)
 
     return JSONResponse(
-        status_code=200, content=success_response({"storyboard_prompt": storyboard_prompt})
+        status_code=200,
+        content=success_response({"storyboard_prompt": storyboard_prompt}),
+        headers=cache_headers(cache_status),
     )
 
 
@@ -190,25 +260,33 @@ async def storyboard_generate(
             ),
             user_key,
             settings,
+            getattr(request.state, "user_id", None),
         )
     except APIError as exc:
-        return _error_response(exc.status_code, exc.code, exc.message)
+        return _error_response(
+            exc.status_code, exc.code, exc.message, retry_after_headers(exc.retry_after)
+        )
 
     image_url = extract_first_image_url(result)
     if not image_url:
         return _error_response(502, "UPSTREAM_ERROR", _UPSTREAM_MESSAGE)
-
-    return JSONResponse(
-        status_code=200, content=success_response({"grid_image_url": image_url})
+    image_url, mirror = await _mirror_image(
+        image_url, settings, getattr(request.state, "user_id", None)
     )
 
+    data = {"grid_image_url": image_url}
+    if mirror is not None:
+        data["grid_image_mirror"] = mirror
+    return JSONResponse(status_code=200, content=success_response(data))
+
 
 @router.post("/video/prompt")
 async def video_prompt(
     payload: VideoPromptRequest,
     request: Request,
     settings: Settings = Depends(get_settings),
-) -> JSONResponse:
+    stream: bool = Query(default=False),
+) -> Response:
     storyboard_prompt = _normalize_text(payload.storyboard_prompt)
     if not storyboard_prompt:
         return _error_response(
@@ -231,14 +309,30 @@ async def video_prompt(
     request.state.step = "workflow.video_prompt"
     request.state.model = settings.default_text_model
     user_key = request.headers.get("x-user-gemini-key")
+    text_request = AnalyzeRequest(prompt=prompt, system_instruction=system_instruction)
+    refresh = wants_refresh(request.headers.get("cache-control"))
     try:
-        result = await analyze_text(
-            AnalyzeRequest(prompt=prompt, system_instruction=system_instruction),
+        if stream:
+            chunks, cache_status = await stream_text_cached(
+                text_request, user_key, settings, refresh=refresh
+            )
+            return await stream_text_response(
+                request,
+                chunks,
+                _text_step_finalizer("video_prompt"),
+                cache_headers(cache_status),
+            )
+        result, cache_status = await analyze_text_cached(
+            text_request,
             user_key,
             settings,
+            refresh=refresh,
+            user_id=getattr(request.state, "user_id", None),
         )
     except APIError as exc:
-        return _error_response(exc.status_code, exc.code, exc.message)
+        return _error_response(
+            exc.status_code, exc.code, exc.message, retry_after_headers(exc.retry_after)
+        )
 
     if not isinstance(result, str):
         return _error_response(502, "UPSTREAM_ERROR", _UPSTREAM_MESSAGE)
@@ -247,5 +341,7 @@ async def video_prompt(
         return _error_response(502, "UPSTREAM_ERROR", _UPSTREAM_MESSAGE)
 
     return JSONResponse(
-        status_code=200, content=success_response({"video_prompt": video_prompt_text})
+        status_code=200,
+        content=success_response({"video_prompt": video_prompt_text}),
+        headers=cache_headers(cache_status),
     )
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import AsyncGenerator, Callable, Optional
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from app.core.sse import SSE_HEADERS, SSE_MEDIA_TYPE, format_sse
+from app.schemas.response import error_response
+from app.services.ai_service import APIError
+
+logger = logging.getLogger("gridworkflow")
+
+
+async def stream_text_response(
+    request: Request,
+    chunks: AsyncGenerator[str, None],
+    finalize: Callable[[str], dict],
+    headers: Optional[dict[str, str]] = None,
+) -> StreamingResponse:
+    """把增量文本转成 SSE：若干 delta 事件 + 一个携带标准信封的 result 事件。
+
+    先等到首个增量再返回响应，这样上游在出字前失败时仍可按普通 JSON 错误返回，
+    调用方负责捕获此处抛出的 APIError。
+    """
+    start_time = time.perf_counter()
+    try:
+        first: Optional[str] = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+    logger.info(
+        "stream first token request_id=%s step=%s model=%s latency_ms=%.2f",
+        getattr(request.state, "request_id", "unknown"),
+        getattr(request.state, "step", "-"),
+        getattr(request.state, "model", "-"),
+        (time.perf_counter() - start_time) * 1000,
+    )
+
+    async def _events() -> AsyncGenerator[str, None]:
+        parts: list[str] = []
+        try:
+            if first is not None:
+                parts.append(first)
+                yield format_sse({"content": first}, event="delta")
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield format_sse({"content": chunk}, event="delta")
+        except APIError as exc:
+            yield format_sse(error_response(exc.code, exc.message), event="result")
+            return
+        finally:
+            await chunks.aclose()
+        yield format_sse(finalize("".join(parts)), event="result")
+
+    return StreamingResponse(
+        _events(),
+        media_type=SSE_MEDIA_TYPE,
+        headers={**SSE_HEADERS, **(headers or {})},
+    )
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+from collections import OrderedDict
 from functools import lru_cache
-from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network, ip_address, ip_network
-from typing import Any
+import hashlib
+from ipaddress import ip_address
+import threading
+import time
+from typing import Any, Optional
 
 import jwt
 from fastapi import Depends, Header, Request
+from starlette.requests import HTTPConnection
 
 from app.core.config import Settings, get_settings
+from app.core.ip_matcher import Address, compile_networks
 
 
 class AuthError(Exception):
@@ -16,25 +22,11 @@ class AuthError(Exception):
         self.message = message
 
 
-Network = IPv4Network | IPv6Network
-Address = IPv4Address | IPv6Address
-
-
-def _split_csv(value: str) -> list[str]:
-    return [item.strip() for item in value.split(",") if item.strip()]
-
-
-@lru_cache(maxsize=64)
-def _parse_networks(raw: str) -> tuple[Network, ...]:
-    networks: list[Network] = []
-    for item in _split_csv(raw):
-        try:
-            networks.append(ip_network(item, strict=False))
-        except ValueError:
-            continue
-    return tuple(networks)
+class ForbiddenError(AuthError):
+    """已登录但缺少所需权限，对外返回 403 FORBIDDEN。"""
 
 
+@lru_cache(maxsize=4096)
 def _parse_ip(value: str) -> Address | None:
     candidate = value.strip()
     if not candidate:
@@ -53,10 +45,6 @@ def _parse_ip(value: str) -> Address | None:
         return None
 
 
-def _ip_in_networks(address: Address, networks: tuple[Network, ...]) -> bool:
-    return any(address in network for network in networks)
-
-
 def _allowlist_enabled(settings: Settings) -> bool:
     if not settings.ip_allowlist_enabled:
         return False
@@ -65,31 +53,31 @@ def _allowlist_enabled(settings: Settings) -> bool:
     return True
 
 
-def _get_client_ip(request: Request, settings: Settings) -> Address | None:
+def _get_client_ip(request: HTTPConnection, settings: Settings) -> Address | None:
     if request.client is None or not request.client.host:
         return None
     client_ip = _parse_ip(request.client.host)
     if client_ip is None:
         return None
-    trusted_proxies = _parse_networks(settings.trusted_proxy_cidrs)
-    if trusted_proxies and _ip_in_networks(client_ip, trusted_proxies):
+    trusted_proxies = compile_networks(settings.trusted_proxy_cidrs)
+    if trusted_proxies and client_ip in trusted_proxies:
         forwarded_for = request.headers.get("x-forwarded-for")
         if forwarded_for:
-            first_hop = forwarded_for.split(",", 1)[0].strip()
+            first_hop = forwarded_for.partition(",")[0]
             forwarded_ip = _parse_ip(first_hop)
             if forwarded_ip:
                 return forwarded_ip
     return client_ip
 
 
-def _is_request_allowlisted(request: Request, settings: Settings) -> bool:
+def _is_request_allowlisted(request: HTTPConnection, settings: Settings) -> bool:
+    allowlist = compile_networks(settings.ip_allowlist)
+    if not allowlist:
+        return False
     client_ip = _get_client_ip(request, settings)
     if client_ip is None:
         return False
-    allowlist_networks = _parse_networks(settings.ip_allowlist)
-    if not allowlist_networks:
-        return False
-    return _ip_in_networks(client_ip, allowlist_networks)
+    return client_ip in allowlist
 
 
 def _extract_bearer_token(authorization: str | None) -> str | None:
@@ -101,10 +89,129 @@ def _extract_bearer_token(authorization: str | None) -> str | None:
     return parts[1]
 
 
+class VerifiedTokenCache:
+    """验签通过的 token 声明缓存，以 token 的 sha256 为键，容量有上限。
+
+    条目在 token 的 exp 与 ttl 先到者失效；密钥变化时整体清空。
+    命中只省去验签，audience/issuer 仍按当前配置校验。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int) -> None:
+        self._max_entries = max(1, max_entries)
+        self._ttl = max(1, ttl_seconds)
+        self._entries: OrderedDict[bytes, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._secret: Optional[str] = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str, secret: str) -> Optional[dict[str, Any]]:
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            if self._secret != secret:
+                self._entries.clear()
+                self._secret = secret
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, claims = entry
+            if now >= expires_at:
+                del self._entries[key]
+                self._expired += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return claims
+
+    def put(self, token: str, secret: str, claims: dict[str, Any]) -> None:
+        expires_at = time.time() + self._ttl
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, float(exp))
+        key = self._key(token)
+        with self._lock:
+            if self._secret != secret:
+                return
+            self._entries[key] = (expires_at, claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self._max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "expired": self._expired,
+            "evictions": self._evictions,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_token_cache: Optional[VerifiedTokenCache] = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache(settings: Settings) -> Optional[VerifiedTokenCache]:
+    global _token_cache
+    if not settings.jwt_cache_enabled:
+        return None
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = VerifiedTokenCache(
+                    settings.jwt_cache_max_entries, settings.jwt_cache_ttl_sec
+                )
+    return _token_cache
+
+
+def token_cache_stats() -> Optional[dict[str, Any]]:
+    return _token_cache.stats() if _token_cache is not None else None
+
+
+def _check_claim_policy(claims: dict[str, Any], settings: Settings) -> None:
+    """与 jwt.decode 的 audience/issuer 校验一致，供缓存命中时使用。"""
+    audience = settings.supabase_jwt_audience
+    if audience:
+        token_audience = claims.get("aud")
+        if isinstance(token_audience, str):
+            token_audience = [token_audience]
+        if not isinstance(token_audience, list) or audience not in token_audience:
+            raise AuthError("鉴权失败，请登录。")
+    issuer = settings.supabase_jwt_issuer
+    if issuer and claims.get("iss") != issuer:
+        raise AuthError("鉴权失败，请登录。")
+
+
 def _decode_supabase_jwt(token: str, settings: Settings) -> dict[str, Any]:
     secret = settings.supabase_jwt_secret
     if not secret:
         raise AuthError("鉴权失败，请稍后重试。")
+    cache = get_token_cache(settings)
+    if cache is not None:
+        claims = cache.get(token, secret)
+        if claims is not None:
+            _check_claim_policy(claims, settings)
+            return claims
+    claims = _verify_supabase_jwt(token, secret, settings)
+    if cache is not None:
+        cache.put(token, secret, claims)
+    return claims
+
+
+def _verify_supabase_jwt(token: str, secret: str, settings: Settings) -> dict[str, Any]:
     options = {"verify_aud": bool(settings.supabase_jwt_audience)}
     decode_kwargs: dict[str, Any] = {}
     if settings.supabase_jwt_audience:
@@ -141,12 +248,49 @@ async def require_user(
     return user_id
 
 
-async def require_user_or_allowlisted(
-    request: Request,
+def has_admin_claim(claims: dict[str, Any], settings: Settings) -> bool:
+    """按 ADMIN_CLAIM（形如 app_metadata.role=admin）检查声明；值为列表时包含即可。"""
+    path, _, expected = settings.admin_claim.partition("=")
+    value: Any = claims
+    for part in path.strip().split("."):
+        if not isinstance(value, dict):
+            return False
+        value = value.get(part)
+    expected = expected.strip()
+    if isinstance(value, list):
+        return expected in value
+    if not expected:
+        return value is True
+    return value is not None and str(value) == expected
+
+
+async def require_admin(
+    user_id: str = Depends(require_user),
     authorization: str | None = Header(default=None, alias="Authorization"),
     settings: Settings = Depends(get_settings),
-) -> str | None:
+) -> str:
+    # require_user 已验过签，这里再次解析会命中校验缓存
+    claims = _decode_supabase_jwt(_extract_bearer_token(authorization) or "", settings)
+    if not has_admin_claim(claims, settings):
+        raise ForbiddenError("权限不足。")
+    return user_id
+
+
+def is_admin_token(authorization: str | None, settings: Settings) -> bool:
+    """中间件里判断请求是否来自管理员；任何鉴权失败都视为否。"""
     token = _extract_bearer_token(authorization)
+    if not token:
+        return False
+    try:
+        claims = _decode_supabase_jwt(token, settings)
+    except AuthError:
+        return False
+    return bool(claims.get("sub") or claims.get("user_id")) and has_admin_claim(claims, settings)
+
+
+def _authenticate_or_allowlist(
+    conn: HTTPConnection, token: str | None, settings: Settings
+) -> str | None:
     auth_error: AuthError | None = None
     if token:
         try:
@@ -157,12 +301,29 @@ async def require_user_or_allowlisted(
             user_id = claims.get("sub") or claims.get("user_id")
             if not user_id:
                 raise AuthError("鉴权失败，请登录。")
-            request.state.user_id = user_id
+            conn.state.user_id = user_id
             return user_id
 
-    if _allowlist_enabled(settings) and _is_request_allowlisted(request, settings):
+    if _allowlist_enabled(settings) and _is_request_allowlisted(conn, settings):
         return None
 
     if auth_error:
         raise auth_error
     raise AuthError("未登录或鉴权失败。")
+
+
+async def require_user_or_allowlisted(
+    request: Request,
+    authorization: str | None = Header(default=None, alias="Authorization"),
+    settings: Settings = Depends(get_settings),
+) -> str | None:
+    token = _extract_bearer_token(authorization)
+    return _authenticate_or_allowlist(request, token, settings)
+
+
+def authenticate_websocket(conn: HTTPConnection, settings: Settings) -> str | None:
+    """WebSocket 无法走 Header 依赖；浏览器也无法自定义握手头，因此额外接受 access_token 查询参数。"""
+    token = _extract_bearer_token(conn.headers.get("authorization"))
+    if not token:
+        token = conn.query_params.get("access_token") or None
+    return _authenticate_or_allowlist(conn, token, settings)
@@ -44,6 +44,132 @@ class Settings(BaseModel):
     video_timeout_sec: float = Field(
         default_factory=lambda: float(os.getenv("VIDEO_TIMEOUT_SEC", "180"))
     )
+    video_poller_enabled: bool = Field(
+        default_factory=lambda: os.getenv("VIDEO_POLLER_ENABLED", "true").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    video_poll_min_interval_ms: int = Field(
+        default_factory=lambda: int(os.getenv("VIDEO_POLL_MIN_INTERVAL_MS", "2000"))
+    )
+    video_poll_max_interval_ms: int = Field(
+        default_factory=lambda: int(os.getenv("VIDEO_POLL_MAX_INTERVAL_MS", "15000"))
+    )
+    video_poll_backoff: float = Field(
+        default_factory=lambda: float(os.getenv("VIDEO_POLL_BACKOFF", "1.5"))
+    )
+    video_poll_idle_timeout_sec: float = Field(
+        default_factory=lambda: float(os.getenv("VIDEO_POLL_IDLE_TIMEOUT_SEC", "300"))
+    )
+    video_status_max_staleness_ms: int = Field(
+        default_factory=lambda: int(os.getenv("VIDEO_STATUS_MAX_STALENESS_MS", "20000"))
+    )
+    video_status_terminal_ttl_sec: float = Field(
+        default_factory=lambda: float(os.getenv("VIDEO_STATUS_TERMINAL_TTL_SEC", "3600"))
+    )
+    video_status_store_max_tasks: int = Field(
+        default_factory=lambda: int(os.getenv("VIDEO_STATUS_STORE_MAX_TASKS", "1000"))
+    )
+    admission_enabled: bool = Field(
+        default_factory=lambda: os.getenv("ADMISSION_ENABLED", "true").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    image_admission_global_limit: int = Field(
+        default_factory=lambda: int(os.getenv("IMAGE_ADMISSION_GLOBAL_LIMIT", "16"))
+    )
+    video_admission_global_limit: int = Field(
+        default_factory=lambda: int(os.getenv("VIDEO_ADMISSION_GLOBAL_LIMIT", "8"))
+    )
+    admission_per_user_limit: int = Field(
+        default_factory=lambda: int(os.getenv("ADMISSION_PER_USER_LIMIT", "2"))
+    )
+    admission_model_limits: str = Field(
+        default_factory=lambda: os.getenv("ADMISSION_MODEL_LIMITS", "")
+    )
+    admission_max_queue: int = Field(
+        default_factory=lambda: int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+    )
+    admission_max_wait_sec: float = Field(
+        default_factory=lambda: float(os.getenv("ADMISSION_MAX_WAIT_SEC", "30"))
+    )
+    idempotency_ttl_sec: float = Field(
+        default_factory=lambda: float(os.getenv("IDEMPOTENCY_TTL_SEC", "86400"))
+    )
+    idempotency_max_entries: int = Field(
+        default_factory=lambda: int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+    )
+    video_status_batch_max: int = Field(
+        default_factory=lambda: int(os.getenv("VIDEO_STATUS_BATCH_MAX", "50"))
+    )
+    video_status_batch_concurrency: int = Field(
+        default_factory=lambda: int(os.getenv("VIDEO_STATUS_BATCH_CONCURRENCY", "8"))
+    )
+    video_task_store: str = Field(
+        default_factory=lambda: os.getenv("VIDEO_TASK_STORE", "")
+    )
+    video_task_sqlite_path: str = Field(
+        default_factory=lambda: os.getenv(
+            "VIDEO_TASK_SQLITE_PATH", "/tmp/gridworkflow_video_tasks.sqlite3"
+        )
+    )
+    video_task_flush_interval_ms: int = Field(
+        default_factory=lambda: int(os.getenv("VIDEO_TASK_FLUSH_INTERVAL_MS", "1000"))
+    )
+    video_task_flush_batch_size: int = Field(
+        default_factory=lambda: int(os.getenv("VIDEO_TASK_FLUSH_BATCH_SIZE", "100"))
+    )
+    video_events_max_tasks: int = Field(
+        default_factory=lambda: int(os.getenv("VIDEO_EVENTS_MAX_TASKS", "20"))
+    )
+    video_events_heartbeat_sec: float = Field(
+        default_factory=lambda: float(os.getenv("VIDEO_EVENTS_HEARTBEAT_SEC", "15"))
+    )
+    video_events_buffer_size: int = Field(
+        default_factory=lambda: int(os.getenv("VIDEO_EVENTS_BUFFER_SIZE", "32"))
+    )
+    upstream_max_connections: int = Field(
+        default_factory=lambda: int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+    )
+    upstream_max_keepalive_connections: int = Field(
+        default_factory=lambda: int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    )
+    upstream_keepalive_expiry_sec: float = Field(
+        default_factory=lambda: float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY_SEC", "30"))
+    )
+    upstream_connect_timeout_sec: float = Field(
+        default_factory=lambda: float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_SEC", "5"))
+    )
+    upstream_http2: bool = Field(
+        default_factory=lambda: os.getenv("UPSTREAM_HTTP2", "false").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    ai_cache_enabled: bool = Field(
+        default_factory=lambda: os.getenv("AI_CACHE_ENABLED", "false").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    ai_cache_ttl_sec: float = Field(
+        default_factory=lambda: float(os.getenv("AI_CACHE_TTL_SEC", "3600"))
+    )
+    ai_cache_max_entries: int = Field(
+        default_factory=lambda: int(os.getenv("AI_CACHE_MAX_ENTRIES", "512"))
+    )
+    ai_cache_max_bytes: int = Field(
+        default_factory=lambda: int(os.getenv("AI_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+    )
+    ai_cache_shared_backend: str = Field(
+        default_factory=lambda: os.getenv("AI_CACHE_SHARED_BACKEND", "")
+    )
+    ai_cache_sqlite_path: str = Field(
+        default_factory=lambda: os.getenv(
+            "AI_CACHE_SQLITE_PATH", "/tmp/gridworkflow_ai_cache.sqlite3"
+        )
+    )
+    singleflight_enabled: bool = Field(
+        default_factory=lambda: os.getenv("SINGLEFLIGHT_ENABLED", "true").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    singleflight_scope: str = Field(
+        default_factory=lambda: os.getenv("SINGLEFLIGHT_SCOPE", "user").lower()
+    )
     cos_secret_id: str | None = Field(default_factory=lambda: os.getenv("COS_SECRET_ID"))
     cos_secret_key: str | None = Field(default_factory=lambda: os.getenv("COS_SECRET_KEY"))
     cos_bucket: str | None = Field(default_factory=lambda: os.getenv("COS_BUCKET"))
@@ -55,6 +181,12 @@ class Settings(BaseModel):
     cos_signed_url_ttl_seconds: int = Field(
         default_factory=lambda: int(os.getenv("COS_SIGNED_URL_TTL_SECONDS", "300"))
     )
+    cos_signed_url_refresh_seconds: int = Field(
+        default_factory=lambda: int(os.getenv("COS_SIGNED_URL_REFRESH_SECONDS", "60"))
+    )
+    cos_signed_url_cache_entries: int = Field(
+        default_factory=lambda: int(os.getenv("COS_SIGNED_URL_CACHE_ENTRIES", "4096"))
+    )
     cos_media_prefix: str = Field(
         default_factory=lambda: os.getenv("COS_MEDIA_PREFIX", "media")
     )
@@ -64,6 +196,91 @@ class Settings(BaseModel):
     cos_video_max_bytes: int = Field(
         default_factory=lambda: int(os.getenv("COS_VIDEO_MAX_BYTES", "104857600"))
     )
+    database_url: str | None = Field(default_factory=lambda: os.getenv("DATABASE_URL"))
+    cos_upload_url_ttl_seconds: int = Field(
+        default_factory=lambda: int(os.getenv("COS_UPLOAD_URL_TTL_SECONDS", "900"))
+    )
+    cos_upload_complete_grace_seconds: int = Field(
+        default_factory=lambda: int(os.getenv("COS_UPLOAD_COMPLETE_GRACE_SECONDS", "3600"))
+    )
+    cos_part_size_bytes: int = Field(
+        default_factory=lambda: int(os.getenv("COS_PART_SIZE_BYTES", str(8 * 1024 * 1024)))
+    )
+    cos_part_concurrency: int = Field(
+        default_factory=lambda: int(os.getenv("COS_PART_CONCURRENCY", "4"))
+    )
+    cos_part_max_retries: int = Field(
+        default_factory=lambda: int(os.getenv("COS_PART_MAX_RETRIES", "3"))
+    )
+    storage_backend: str = Field(
+        default_factory=lambda: os.getenv("STORAGE_BACKEND", "cos").lower()
+    )
+    storage_local_root: str = Field(
+        default_factory=lambda: os.getenv("STORAGE_LOCAL_ROOT", "/tmp/gridworkflow_media")
+    )
+    storage_public_base_url: str = Field(
+        default_factory=lambda: os.getenv("STORAGE_PUBLIC_BASE_URL", "")
+    )
+    storage_max_workers: int = Field(
+        default_factory=lambda: int(os.getenv("STORAGE_MAX_WORKERS", "4"))
+    )
+    storage_max_queue: int = Field(
+        default_factory=lambda: int(os.getenv("STORAGE_MAX_QUEUE", "32"))
+    )
+    media_dedup_enabled: bool = Field(
+        default_factory=lambda: os.getenv("MEDIA_DEDUP_ENABLED", "false").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    media_dedup_store: str = Field(
+        default_factory=lambda: os.getenv("MEDIA_DEDUP_STORE", "")
+    )
+    media_dedup_sqlite_path: str = Field(
+        default_factory=lambda: os.getenv(
+            "MEDIA_DEDUP_SQLITE_PATH", "/tmp/gridworkflow_media_objects.sqlite3"
+        )
+    )
+    media_dedup_cache_entries: int = Field(
+        default_factory=lambda: int(os.getenv("MEDIA_DEDUP_CACHE_ENTRIES", "4096"))
+    )
+    media_mirror_enabled: bool = Field(
+        default_factory=lambda: os.getenv("MEDIA_MIRROR_ENABLED", "false").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    media_mirror_concurrency: int = Field(
+        default_factory=lambda: int(os.getenv("MEDIA_MIRROR_CONCURRENCY", "4"))
+    )
+    media_mirror_max_retries: int = Field(
+        default_factory=lambda: int(os.getenv("MEDIA_MIRROR_MAX_RETRIES", "3"))
+    )
+    media_mirror_timeout_sec: float = Field(
+        default_factory=lambda: float(os.getenv("MEDIA_MIRROR_TIMEOUT_SEC", "120"))
+    )
+    media_mirror_wait_ms: int = Field(
+        default_factory=lambda: int(os.getenv("MEDIA_MIRROR_WAIT_MS", "3000"))
+    )
+    media_mirror_max_jobs: int = Field(
+        default_factory=lambda: int(os.getenv("MEDIA_MIRROR_MAX_JOBS", "1000"))
+    )
+    media_proxy_enabled: bool = Field(
+        default_factory=lambda: os.getenv("MEDIA_PROXY_ENABLED", "false").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    media_proxy_cache_dir: str = Field(
+        default_factory=lambda: os.getenv(
+            "MEDIA_PROXY_CACHE_DIR", "/tmp/gridworkflow_media_proxy"
+        )
+    )
+    media_proxy_cache_max_bytes: int = Field(
+        default_factory=lambda: int(
+            os.getenv("MEDIA_PROXY_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024))
+        )
+    )
+    media_proxy_chunk_bytes: int = Field(
+        default_factory=lambda: int(os.getenv("MEDIA_PROXY_CHUNK_BYTES", str(1024 * 1024)))
+    )
+    media_proxy_url_ttl_seconds: int = Field(
+        default_factory=lambda: int(os.getenv("MEDIA_PROXY_URL_TTL_SECONDS", "3600"))
+    )
     supabase_url: str | None = Field(default_factory=lambda: os.getenv("SUPABASE_URL"))
     supabase_anon_key: str | None = Field(
         default_factory=lambda: os.getenv("SUPABASE_ANON_KEY")
@@ -80,6 +297,57 @@ class Settings(BaseModel):
     supabase_jwt_issuer: str | None = Field(
         default_factory=lambda: os.getenv("SUPABASE_JWT_ISSUER")
     )
+    tracing_enabled: bool = Field(
+        default_factory=lambda: os.getenv("TRACING_ENABLED", "false").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    tracing_sinks: str = Field(default_factory=lambda: os.getenv("TRACING_SINKS", "memory"))
+    tracing_buffer_size: int = Field(
+        default_factory=lambda: int(os.getenv("TRACING_BUFFER_SIZE", "200"))
+    )
+    tracing_file_path: str = Field(
+        default_factory=lambda: os.getenv(
+            "TRACING_FILE_PATH", "/tmp/gridworkflow_traces.jsonl"
+        )
+    )
+    debug_endpoints_enabled: bool = Field(
+        default_factory=lambda: os.getenv("DEBUG_ENDPOINTS_ENABLED", "false").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    admin_claim: str = Field(
+        default_factory=lambda: os.getenv("ADMIN_CLAIM", "app_metadata.role=admin")
+    )
+    profiler_enabled: bool = Field(
+        default_factory=lambda: os.getenv("PROFILER_ENABLED", "false").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    profiler_interval_ms: int = Field(
+        default_factory=lambda: int(os.getenv("PROFILER_INTERVAL_MS", "5"))
+    )
+    profiler_max_seconds: int = Field(
+        default_factory=lambda: int(os.getenv("PROFILER_MAX_SECONDS", "60"))
+    )
+    profiler_output_dir: str = Field(
+        default_factory=lambda: os.getenv("PROFILER_OUTPUT_DIR", "/tmp/gridworkflow_profiles")
+    )
+    profiler_max_files: int = Field(
+        default_factory=lambda: int(os.getenv("PROFILER_MAX_FILES", "100"))
+    )
+    metrics_enabled: bool = Field(
+        default_factory=lambda: os.getenv("METRICS_ENABLED", "true").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    json_codec: str = Field(default_factory=lambda: os.getenv("JSON_CODEC", "auto"))
+    jwt_cache_enabled: bool = Field(
+        default_factory=lambda: os.getenv("JWT_CACHE_ENABLED", "true").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    jwt_cache_max_entries: int = Field(
+        default_factory=lambda: int(os.getenv("JWT_CACHE_MAX_ENTRIES", "10000"))
+    )
+    jwt_cache_ttl_sec: int = Field(
+        default_factory=lambda: int(os.getenv("JWT_CACHE_TTL_SEC", "300"))
+    )
     ip_allowlist_enabled: bool = Field(
         default_factory=lambda: os.getenv("IP_ALLOWLIST_ENABLED", "false").lower()
         in {"1", "true", "yes", "on"}
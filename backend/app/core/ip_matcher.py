@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from functools import lru_cache
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network, ip_network
+from typing import Iterable
+
+Network = IPv4Network | IPv6Network
+Address = IPv4Address | IPv6Address
+
+
+def _merge(ranges: list[tuple[int, int]]) -> tuple[tuple[int, ...], tuple[int, ...]]:
+    starts: list[int] = []
+    ends: list[int] = []
+    for start, end in sorted(ranges):
+        if ends and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+            continue
+        starts.append(start)
+        ends.append(end)
+    return tuple(starts), tuple(ends)
+
+
+class NetworkMatcher:
+    """把一组 CIDR 合并成按地址排序、互不重叠的区间，查找时二分，与条目数量基本无关。
+
+    IPv4 与 IPv6 分开存放，与 ``address in network`` 的语义一致：不同版本互不匹配。
+    """
+
+    __slots__ = ("_v4", "_v6", "size")
+
+    def __init__(self, networks: Iterable[Network]) -> None:
+        v4: list[tuple[int, int]] = []
+        v6: list[tuple[int, int]] = []
+        size = 0
+        for network in networks:
+            size += 1
+            bucket = v4 if network.version == 4 else v6
+            bucket.append((int(network.network_address), int(network.broadcast_address)))
+        self._v4 = _merge(v4)
+        self._v6 = _merge(v6)
+        self.size = size
+
+    def __bool__(self) -> bool:
+        return bool(self._v4[0] or self._v6[0])
+
+    def __contains__(self, address: Address) -> bool:
+        starts, ends = self._v4 if address.version == 4 else self._v6
+        value = int(address)
+        index = bisect_right(starts, value) - 1
+        return index >= 0 and value <= ends[index]
+
+    @property
+    def intervals(self) -> int:
+        return len(self._v4[0]) + len(self._v6[0])
+
+
+@lru_cache(maxsize=64)
+def compile_networks(raw: str) -> NetworkMatcher:
+    """解析逗号分隔的 CIDR/IP 列表并编译；同一配置值只编译一次，非法条目忽略。"""
+    networks: list[Network] = []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ip_network(item, strict=False))
+        except ValueError:
+            continue
+    return NetworkMatcher(networks)
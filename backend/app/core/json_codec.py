@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Callable
+
+from app.core.config import get_settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 未安装时回退到 msgspec 或标准库
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+logger = logging.getLogger("gridworkflow")
+
+JSON_CODECS = ("orjson", "msgspec", "stdlib")
+
+
+def _stdlib_dumps(value: Any) -> bytes:
+    return json.dumps(
+        value, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _stdlib_loads(data: bytes | str) -> Any:
+    return json.loads(data)
+
+
+def _orjson_dumps(value: Any) -> bytes:
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _msgspec_loads(data: bytes | str) -> Any:
+    try:
+        return _msgspec_decoder.decode(data)
+    except msgspec.DecodeError as exc:
+        # FastAPI 按 json.JSONDecodeError 识别请求体格式错误
+        raise json.JSONDecodeError(str(exc), data if isinstance(data, str) else "", 0) from exc
+
+
+if msgspec is not None:
+    _msgspec_encoder = msgspec.json.Encoder()
+    _msgspec_decoder = msgspec.json.Decoder()
+
+
+def _available(name: str) -> bool:
+    return (
+        name == "stdlib"
+        or (name == "orjson" and orjson is not None)
+        or (name == "msgspec" and msgspec is not None)
+    )
+
+
+def _select(preferred: str) -> str:
+    """JSON_CODEC=auto 时按 orjson、msgspec、标准库的顺序取第一个可用实现。"""
+    preferred = preferred.strip().lower()
+    if preferred in JSON_CODECS and _available(preferred):
+        return preferred
+    if preferred not in {"", "auto"}:
+        logger.warning("json codec %s unavailable, falling back", preferred)
+    return next(name for name in JSON_CODECS if _available(name))
+
+
+def _bind(name: str) -> tuple[Callable[[Any], bytes], Callable[[bytes | str], Any]]:
+    if name == "orjson":
+        return _orjson_dumps, orjson.loads
+    if name == "msgspec":
+        return _msgspec_encoder.encode, _msgspec_loads
+    return _stdlib_dumps, _stdlib_loads
+
+
+codec_name = _select(get_settings().json_codec)
+# dumps 输出紧凑的 UTF-8 字节串，非 ASCII 字符不转义；loads 接受 bytes 或 str
+dumps, loads = _bind(codec_name)
+
+
+def dumps_str(value: Any) -> str:
+    return dumps(value).decode("utf-8")
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Coroutine
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.responses import JSONResponse as _StarletteJSONResponse
+
+from app.core.json_codec import dumps, loads
+from app.core.tracing import span
+
+
+class JSONResponse(_StarletteJSONResponse):
+    """用 app.core.json_codec 编码的 JSONResponse，响应信封一次编码为字节串。"""
+
+    def render(self, content: Any) -> bytes:
+        with span("response.encode_json") as current:
+            body = dumps(content)
+            current.set("bytes", len(body))
+        return body
+
+
+class JSONRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            with span("request.decode_json", bytes=len(body)):
+                self._json = loads(body)
+        return self._json
+
+
+class JSONRoute(APIRoute):
+    """请求体改用 json_codec 解析；大体积 base64 字段的解析开销主要在这里。"""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(JSONRequest(request.scope, request.receive))
+
+        return route_handler
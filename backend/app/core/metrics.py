@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+import math
+from typing import Iterable, Optional, TypeVar
+
+# 所有记录都发生在事件循环线程内，单次记录只是字典查找加整数运算，不加锁。
+# 标签组合数按指标设上限，超出后归入 "other"，避免上游 model 等自由取值撑爆内存。
+
+MAX_SERIES_PER_METRIC = 2000
+OVERFLOW_LABEL = "other"
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 180.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._overflow = tuple(OVERFLOW_LABEL for _ in self.labelnames)
+
+    def _key(self, labels: tuple[str, ...], series: dict) -> tuple[str, ...]:
+        if labels in series or len(series) < MAX_SERIES_PER_METRIC:
+            return labels
+        return self._overflow
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        if not self.labelnames:
+            self._values[()] = 0.0
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        key = self._key(labels, self._values)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for labels, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        self._values[self._key(labels, self._values)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = HTTP_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._bounds = tuple(sorted(buckets))
+        # 每个标签组合：各桶计数（非累计，最后一格为 +Inf）、总和
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels, self._series)
+        series = self._series.get(key)
+        if series is None:
+            series = ([0] * (len(self._bounds) + 1), [0.0])
+            self._series[key] = series
+        series[0][bisect_left(self._bounds, value)] += 1
+        series[1][0] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for labels, (counts, total) in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self._bounds, math.inf), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+MetricT = TypeVar("MetricT", bound=_Metric)
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: MetricT) -> MetricT:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+http_requests_total = REGISTRY.register(
+    Counter(
+        "gw_http_requests_total",
+        "HTTP requests by route template, method and status code.",
+        ("route", "method", "status"),
+    )
+)
+http_request_duration_seconds = REGISTRY.register(
+    Histogram(
+        "gw_http_request_duration_seconds",
+        "HTTP request latency by route template, step and model.",
+        ("route", "step", "model"),
+        HTTP_BUCKETS,
+    )
+)
+http_requests_in_flight = REGISTRY.register(
+    Gauge("gw_http_requests_in_flight", "HTTP requests currently being handled.")
+)
+upstream_request_duration_seconds = REGISTRY.register(
+    Histogram(
+        "gw_upstream_request_duration_seconds",
+        "Upstream gateway call latency by endpoint and outcome.",
+        ("endpoint", "outcome"),
+        UPSTREAM_BUCKETS,
+    )
+)
+errors_total = REGISTRY.register(
+    Counter(
+        "gw_errors_total",
+        "APIError / UpstreamServiceError raised, by source and error code.",
+        ("source", "code"),
+    )
+)
+upload_bytes_in_flight = REGISTRY.register(
+    Gauge("gw_upload_bytes_in_flight", "Bytes held by media uploads that have not finished yet.")
+)
+upload_bytes_total = REGISTRY.register(
+    Counter("gw_upload_bytes_total", "Bytes written to object storage by media uploads.")
+)
+
+
+# 上游网关路径 → 指标里的 endpoint 标签；任务 id 等路径参数不进入标签
+UPSTREAM_ENDPOINTS = (
+    ("/v2/videos/generations/", "v2/videos/generations/{task_id}"),
+    ("/v2/videos/generations", "v2/videos/generations"),
+    ("/chat/completions", "chat/completions"),
+    ("/images/edits", "images/edits"),
+    ("/images/generations", "images/generations"),
+)
+
+
+def upstream_endpoint(path: str) -> str:
+    for marker, label in UPSTREAM_ENDPOINTS:
+        if marker in path:
+            return label
+    return OVERFLOW_LABEL
+
+
+def upstream_outcome(status_code: Optional[int]) -> str:
+    if status_code is None:
+        return "error"
+    return f"{status_code // 100}xx"
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
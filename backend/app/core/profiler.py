@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+import os
+import sys
+import threading
+from types import CodeType, FrameType
+from typing import Any, Optional
+
+from app.core.config import Settings, get_settings
+
+# 输出 flamegraph.pl / speedscope / inferno 通用的 collapsed 格式：每行 "根;...;叶 样本数"。
+# 采样线程定时读取 sys._current_frames()，被采样的代码不插桩；未开启时没有任何额外开销。
+
+AWAITING_FRAME = "[awaiting]"
+PROFILE_SUFFIX = ".collapsed"
+
+
+class ProfilerBusy(Exception):
+    """同一时间只允许一个采样任务，避免采样线程叠加放大开销。"""
+
+
+def _frame_name(code: CodeType) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)})".replace(";", ":")
+
+
+def _stack(frame: Optional[FrameType], stop: Optional[FrameType] = None) -> list[str]:
+    """从叶子向根收集帧名，遇到 stop 帧为止（含 stop），返回根在前的列表。"""
+    names: list[str] = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        if frame is stop:
+            break
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def _await_chain(task: asyncio.Task) -> list[str]:
+    """任务挂起时沿 cr_await 链还原协程调用栈，末尾追加正在等待的对象类型。"""
+    names = [AWAITING_FRAME]
+    awaitable: Any = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None and not hasattr(awaitable, "cr_await"):
+            # Future、Event 等非协程对象
+            names.append(f"<{type(awaitable).__name__}>")
+            break
+        if frame is not None:
+            names.append(_frame_name(frame.f_code))
+        awaitable = (
+            getattr(awaitable, "cr_await", None)
+            or getattr(awaitable, "gi_yieldfrom", None)
+            or getattr(awaitable, "ag_await", None)
+        )
+    return names
+
+
+class SamplingProfiler:
+    """后台线程按固定间隔采样调用栈。
+
+    传入 task 时只采样该 asyncio 任务：任务正在运行则记录事件循环线程的栈，
+    挂起时记录 "[awaiting]" 加协程等待链，用于区分 CPU 耗时与等待上游的时间；
+    不传 task 时采样进程内除采样线程外的所有线程，栈底为线程名。
+    """
+
+    def __init__(
+        self,
+        interval_ms: float,
+        *,
+        task: Optional[asyncio.Task] = None,
+    ) -> None:
+        self._interval = max(interval_ms, 0.5) / 1000
+        self._task = task
+        self._loop = task.get_loop() if task is not None else None
+        self._loop_thread_id = threading.get_ident()
+        self._stacks: Counter[tuple[str, ...]] = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+
+    def start(self) -> "SamplingProfiler":
+        if not _active.acquire(blocking=False):
+            raise ProfilerBusy("another profile is running")
+        self._thread = threading.Thread(
+            target=self._sample_loop, name="gridworkflow-profiler", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        """停止采样并返回 collapsed 文本。"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            _active.release()
+            _stats["profiles"] += 1
+            _stats["samples"] += self.samples
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        lines = [
+            f"{';'.join(stack)} {count}"
+            for stack, count in sorted(self._stacks.items(), key=lambda item: -item[1])
+        ]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def _sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            frames = sys._current_frames()
+            if self._task is not None:
+                stack = self._sample_task(frames)
+                if stack:
+                    self._stacks[tuple(stack)] += 1
+            else:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in frames.items():
+                    if thread_id != own_id:
+                        stack = [names.get(thread_id, str(thread_id)), *_stack(frame)]
+                        self._stacks[tuple(stack)] += 1
+            del frames
+            self.samples += 1
+
+    def _sample_task(self, frames: dict[int, FrameType]) -> Optional[list[str]]:
+        task = self._task
+        if task is None or task.done():
+            return None
+        if asyncio.current_task(self._loop) is task:
+            coro_frame = getattr(task.get_coro(), "cr_frame", None)
+            return _stack(frames.get(self._loop_thread_id), stop=coro_frame)
+        return _await_chain(task)
+
+
+_active = threading.Lock()
+_stats = {"profiles": 0, "samples": 0}
+
+
+def start_request_profile(settings: Settings) -> Optional[SamplingProfiler]:
+    """为当前请求所在任务开启采样；已有采样在进行时返回 None，请求照常处理。"""
+    task = asyncio.current_task()
+    if task is None:
+        return None
+    try:
+        return SamplingProfiler(settings.profiler_interval_ms, task=task).start()
+    except ProfilerBusy:
+        return None
+
+
+async def profile_process(seconds: float, settings: Optional[Settings] = None) -> str:
+    """采样整个进程 seconds 秒，返回 collapsed 文本；已有采样在进行时抛出 ProfilerBusy。"""
+    settings = settings or get_settings()
+    profiler = SamplingProfiler(settings.profiler_interval_ms).start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        collapsed = await asyncio.to_thread(profiler.stop)
+    return collapsed
+
+
+def profile_path(settings: Settings, profile_id: str) -> str:
+    return os.path.join(settings.profiler_output_dir, f"{profile_id}{PROFILE_SUFFIX}")
+
+
+def save_profile(settings: Settings, profile_id: str, collapsed: str) -> str:
+    os.makedirs(settings.profiler_output_dir, exist_ok=True)
+    path = profile_path(settings, profile_id)
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(collapsed)
+    _prune_profiles(settings.profiler_output_dir, settings.profiler_max_files)
+    return path
+
+
+def _prune_profiles(directory: str, max_files: int) -> None:
+    """只保留最新的 max_files 份单请求采样结果。"""
+    entries = []
+    with os.scandir(directory) as scan:
+        for entry in scan:
+            if entry.name.endswith(PROFILE_SUFFIX) and entry.is_file():
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+    if len(entries) <= max(1, max_files):
+        return
+    entries.sort()
+    for _, path in entries[: len(entries) - max(1, max_files)]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def profiler_stats() -> Optional[dict[str, Any]]:
+    if not get_settings().profiler_enabled:
+        return None
+    return {**_stats, "active": _active.locked()}
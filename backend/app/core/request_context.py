@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Optional
+from uuid import uuid4
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.auth import is_admin_token
+from app.core.config import get_settings
+from app.core.json_response import JSONResponse
+from app.core.metrics import (
+    http_request_duration_seconds,
+    http_requests_in_flight,
+    http_requests_total,
+)
+from app.core.profiler import SamplingProfiler, save_profile, start_request_profile
+from app.core.tracing import start_trace
+from app.schemas.response import error_response
+
+logger = logging.getLogger("gridworkflow")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+PROFILE_HEADER = b"x-debug-profile"
+PROFILE_QUERY_FLAG = b"__profile=1"
+PROFILE_ID_HEADER = "X-Profile-ID"
+
+
+class RequestContextMiddleware:
+    """追加 request_id、记录时延并统一异常输出。
+
+    纯 ASGI 实现：直接转发 send/receive，不额外起任务或缓冲响应体，
+    SSE 与流式响应逐块透传，BackgroundTask 在响应结束后照常执行。
+    request_id/step/model 通过 scope["state"] 与 request.state 共享，
+    同时按路由模板记录请求数、时延直方图与在途请求数。
+    开启 PROFILER_ENABLED 后，管理员可用 X-Debug-Profile 头或 __profile=1 对单个请求采样。
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.settings = get_settings()
+        self.profiler_enabled = self.settings.profiler_enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = str(uuid4())
+        state = scope.setdefault("state", {})
+        state["request_id"] = request_id
+        start_time = time.perf_counter()
+        response_started = False
+        status_code = 500
+        http_requests_in_flight.inc()
+        profiler = self._start_profile(scope) if self.profiler_enabled else None
+
+        async def send_with_request_id(message: Message) -> None:
+            nonlocal response_started, status_code
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers[REQUEST_ID_HEADER] = request_id
+                if profiler is not None:
+                    headers[PROFILE_ID_HEADER] = request_id
+            await send(message)
+
+        try:
+            with start_trace("http.request", request_id, _header(scope, b"traceparent")) as root:
+                await self.app(scope, receive, send_with_request_id)
+                root.set("route", _route_template(scope))
+                root.set("status", status_code)
+                root.set("step", state.get("step", "-"))
+                root.set("model", state.get("model", "-"))
+        except Exception:
+            logger.exception(
+                "Unhandled error request_id=%s step=%s model=%s",
+                request_id,
+                state.get("step", "-"),
+                state.get("model", "-"),
+            )
+            if response_started:
+                # 响应头已发出，无法再改成 500，交给服务器断开连接
+                raise
+            response = JSONResponse(
+                status_code=500,
+                content=error_response("UPSTREAM_ERROR", "服务内部异常，请稍后重试。"),
+            )
+            await response(scope, receive, send_with_request_id)
+        finally:
+            if profiler is not None:
+                await asyncio.to_thread(self._finish_profile, profiler, request_id)
+            elapsed = time.perf_counter() - start_time
+            step = state.get("step", "-")
+            model = state.get("model", "-")
+            route = _route_template(scope)
+            http_requests_in_flight.dec()
+            http_requests_total.inc(route, scope["method"], str(status_code))
+            http_request_duration_seconds.observe(elapsed, route, step, model)
+            logger.info(
+                "request completed request_id=%s step=%s model=%s latency_ms=%.2f",
+                request_id,
+                step,
+                model,
+                elapsed * 1000,
+            )
+
+    def _start_profile(self, scope: Scope) -> Optional[SamplingProfiler]:
+        requested = _header(scope, PROFILE_HEADER) is not None or PROFILE_QUERY_FLAG in (
+            scope.get("query_string") or b""
+        ).split(b"&")
+        # 非管理员带上开关时静默忽略，不暴露采样功能是否存在
+        if not requested or not is_admin_token(_header(scope, b"authorization"), self.settings):
+            return None
+        return start_request_profile(self.settings)
+
+    def _finish_profile(self, profiler: SamplingProfiler, request_id: str) -> None:
+        collapsed = profiler.stop()
+        try:
+            save_profile(self.settings, request_id, collapsed)
+        except OSError:
+            logger.warning("profile save failed request_id=%s", request_id, exc_info=True)
+
+
+def _header(scope: Scope, name: bytes) -> str | None:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _route_template(scope: Scope) -> str:
+    # 用路由模板而不是原始路径做标签，task_id、对象 key 等不会进入指标
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+
+from app.core.json_codec import dumps_str
+
+SSE_MEDIA_TYPE = "text/event-stream"
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(
+    data: Any, event: Optional[str] = None, event_id: Optional[str] = None
+) -> str:
+    """按 text/event-stream 规范编码一条事件，data 统一序列化为单行 JSON。"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {dumps_str(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def format_sse_comment(text: str = "") -> str:
+    return f": {text}\n\n"
@@ -0,0 +1,384 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Iterator, Optional, Protocol
+
+from app.core.config import Settings, get_settings
+from app.core.json_codec import dumps
+
+logger = logging.getLogger("gridworkflow")
+
+SERVICE_NAME = "gridworkflow"
+
+
+class Trace:
+    """一次请求内产生的全部 span；根 span 结束时整体交给 sink。"""
+
+    __slots__ = ("trace_id", "request_id", "spans", "closed")
+
+    def __init__(self, trace_id: str, request_id: str) -> None:
+        self.trace_id = trace_id
+        self.request_id = request_id
+        self.spans: list[Span] = []
+        self.closed = False
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def to_payload(self) -> dict[str, Any]:
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "request_id": self.request_id,
+            "name": root.name,
+            "duration_ms": root.duration_ms,
+            "attributes": root.attributes,
+            "spans": [span.to_payload() for span in self.spans],
+        }
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str]) -> None:
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: dict[str, Any] = {}
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns or time.time_ns()
+        return round((end_ns - self.start_ns) / 1_000_000, 3)
+
+    def to_payload(self) -> dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "offset_ms": round((self.start_ns - self.trace.root.start_ns) / 1_000_000, 3),
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("gridworkflow_span", default=None)
+_request_id: ContextVar[Optional[str]] = ContextVar("gridworkflow_request_id", default=None)
+
+
+class SpanSink(Protocol):
+    def export(self, trace: Trace) -> None:
+        ...
+
+
+class LogSink:
+    """每个 span 一行日志，只输出名称、时延与 request_id/step/model 等允许记录的字段。"""
+
+    def export(self, trace: Trace) -> None:
+        for span in trace.spans:
+            logger.info(
+                "span name=%s request_id=%s trace_id=%s latency_ms=%.2f%s",
+                span.name,
+                trace.request_id,
+                trace.trace_id,
+                span.duration_ms,
+                " error=" + span.error if span.error else "",
+            )
+
+
+class MemorySink:
+    """最近 max_traces 条追踪的环形缓冲，供 /debug/traces 查看。"""
+
+    def __init__(self, max_traces: int) -> None:
+        self._max_traces = max(1, max_traces)
+        self._traces: OrderedDict[str, Trace] = OrderedDict()
+
+    def export(self, trace: Trace) -> None:
+        self._traces[trace.trace_id] = trace
+        self._traces.move_to_end(trace.trace_id)
+        while len(self._traces) > self._max_traces:
+            self._traces.popitem(last=False)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        return self._traces.get(trace_id)
+
+    def find(self, request_id: str) -> Optional[Trace]:
+        return next(
+            (trace for trace in reversed(self._traces.values()) if trace.request_id == request_id),
+            None,
+        )
+
+    def recent(self, limit: int, min_ms: float = 0.0, slowest: bool = False) -> list[Trace]:
+        traces = [trace for trace in self._traces.values() if trace.root.duration_ms >= min_ms]
+        if slowest:
+            traces.sort(key=lambda trace: trace.root.duration_ms, reverse=True)
+        else:
+            traces.reverse()
+        return traces[:limit]
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(trace: Trace) -> dict[str, Any]:
+    """按 OTLP/JSON 的 ExportTraceServiceRequest 结构编码，可直接被 collector 的 file receiver 读取。"""
+    spans = []
+    for span in trace.spans:
+        attributes = {"request_id": trace.request_id, **span.attributes}
+        spans.append(
+            {
+                "traceId": trace.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": 2 if span is trace.root else 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [
+                    {"key": key, "value": _otlp_value(value)} for key, value in attributes.items()
+                ],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+        )
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+            }
+        ]
+    }
+
+
+class OTLPFileSink:
+    """每条追踪编码为一行 OTLP/JSON 追加到文件；写文件在后台线程，不阻塞事件循环。"""
+
+    def __init__(self, path: str, max_pending: int = 10000) -> None:
+        self._path = path
+        self._queue: queue.Queue[Optional[bytes]] = queue.Queue(maxsize=max(1, max_pending))
+        self.dropped = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(
+            target=self._write_loop, name="gridworkflow-trace-file", daemon=True
+        )
+        self._thread.start()
+
+    def export(self, trace: Trace) -> None:
+        try:
+            self._queue.put_nowait(dumps(otlp_payload(trace)) + b"\n")
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self) -> None:
+        with open(self._path, "ab") as handle:
+            while True:
+                line = self._queue.get()
+                if line is None:
+                    return
+                handle.write(line)
+                if self._queue.empty():
+                    handle.flush()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+class Tracer:
+    def __init__(self, sinks: list[SpanSink]) -> None:
+        self.sinks = sinks
+        self._exported = 0
+        self._failed = 0
+
+    @property
+    def memory(self) -> Optional[MemorySink]:
+        return next((sink for sink in self.sinks if isinstance(sink, MemorySink)), None)
+
+    def finish(self, trace: Trace) -> None:
+        trace.closed = True
+        self._exported += 1
+        for sink in self.sinks:
+            try:
+                sink.export(trace)
+            except Exception:
+                self._failed += 1
+                logger.warning("trace export failed sink=%s", type(sink).__name__, exc_info=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "sinks": [type(sink).__name__ for sink in self.sinks],
+            "exported": self._exported,
+            "failed": self._failed,
+        }
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            close = getattr(sink, "close", None)
+            if close is not None:
+                close()
+
+
+def _build_sinks(settings: Settings) -> list[SpanSink]:
+    sinks: list[SpanSink] = []
+    for name in (item.strip().lower() for item in settings.tracing_sinks.split(",")):
+        if name == "memory":
+            sinks.append(MemorySink(settings.tracing_buffer_size))
+        elif name == "log":
+            sinks.append(LogSink())
+        elif name in {"otlp", "otlp_file"}:
+            sinks.append(OTLPFileSink(settings.tracing_file_path))
+        elif name:
+            logger.warning("unknown tracing sink=%s", name)
+    return sinks
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer(settings: Optional[Settings] = None) -> Optional[Tracer]:
+    """未开启 TRACING_ENABLED 时返回 None，所有 span 调用退化为空操作。"""
+    global _tracer
+    settings = settings or get_settings()
+    if not settings.tracing_enabled:
+        return None
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer(_build_sinks(settings))
+    return _tracer
+
+
+def tracer_stats() -> Optional[dict[str, Any]]:
+    return _tracer.stats() if _tracer is not None else None
+
+
+async def close_tracer() -> None:
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple[str, str]]:
+    """解析 W3C traceparent，返回 (trace_id, parent_span_id)；格式不对时返回 None。"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    trace_id, parent_id = parts[1].lower(), parts[2].lower()
+    try:
+        if int(trace_id, 16) == 0 or int(parent_id, 16) == 0:
+            return None
+    except ValueError:
+        return None
+    return trace_id, parent_id
+
+
+@contextmanager
+def start_trace(
+    name: str, request_id: str, traceparent: Optional[str] = None
+) -> Iterator[Span | _NoopSpan]:
+    """开始一次请求级追踪；沿用上游传入的 traceparent，否则新建 trace_id。
+
+    未开启追踪时只记录 request_id，调用上游仍会带上 X-Request-ID。
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        request_token = _request_id.set(request_id)
+        try:
+            yield _NOOP
+        finally:
+            _request_id.reset(request_token)
+        return
+    parent = parse_traceparent(traceparent)
+    trace_id, parent_id = parent if parent else (os.urandom(16).hex(), None)
+    trace = Trace(trace_id, request_id)
+    root = Span(trace, name, parent_id)
+    trace.spans.append(root)
+    token = _current.set(root)
+    request_token = _request_id.set(request_id)
+    try:
+        yield root
+    except BaseException as exc:
+        root.error = type(exc).__name__
+        raise
+    finally:
+        root.end_ns = time.time_ns()
+        _request_id.reset(request_token)
+        _current.reset(token)
+        tracer.finish(trace)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | _NoopSpan]:
+    """在当前追踪下记录一个阶段；没有进行中的追踪时为空操作。
+
+    后台任务会继承创建时的上下文，追踪结束后才完成的 span 不再记录。
+    """
+    parent = _current.get()
+    if parent is None or parent.trace.closed:
+        yield _NOOP
+        return
+    current = Span(parent.trace, name, parent.span_id)
+    current.attributes.update(attributes)
+    parent.trace.spans.append(current)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.error = type(exc).__name__
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current.reset(token)
+
+
+def propagation_headers() -> dict[str, str]:
+    """调用上游时附带的 traceparent 与 X-Request-ID；没有进行中的追踪时为空。"""
+    headers: dict[str, str] = {}
+    request_id = _request_id.get()
+    if request_id:
+        headers["X-Request-ID"] = request_id
+    current = _current.get()
+    if current is not None:
+        headers["traceparent"] = f"00-{current.trace.trace_id}-{current.span_id}-01"
+    return headers
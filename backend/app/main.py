@@ -1,21 +1,48 @@
-import time
-from uuid import uuid4
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
 
 from app.api import api_router
-from app.core.auth import AuthError
+from app.core.auth import AuthError, ForbiddenError
 from app.core.config import get_settings
+from app.core.json_response import JSONResponse
 from app.core.logger import get_logger
+from app.core.request_context import RequestContextMiddleware
+from app.core.tracing import close_tracer
 from app.schemas.response import error_response
+from app.services.response_cache import close_response_cache
+from app.services.upstream import close_upstream_pool
+from app.services.video_poller import close_video_poller
+from app.services.video_task_store import close_video_task_store
+from app.storage.backend import close_storage_backend
+from app.storage.dedup import close_media_digest_index
+from app.storage.executor import close_storage_executor
+from app.storage.mirror import close_media_mirror
 
 settings = get_settings()
 logger = get_logger(settings.log_level)
 
-app = FastAPI(title=settings.app_name)
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """进程级资源在这里统一创建与回收。"""
+    yield
+    await close_video_poller()
+    await close_media_mirror()
+    await close_video_task_store()
+    await close_response_cache()
+    await close_media_digest_index()
+    await close_storage_executor()
+    await close_storage_backend()
+    await close_upstream_pool()
+    await close_tracer()
+
+
+app = FastAPI(
+    title=settings.app_name, lifespan=lifespan, default_response_class=JSONResponse
+)
 
 def _parse_cors_origins(raw: str) -> list[str]:
     if not raw:
@@ -45,6 +72,14 @@ async def validation_exception_handler(_: Request, exc: RequestValidationError):
     )
 
 
+@app.exception_handler(ForbiddenError)
+async def forbidden_exception_handler(_: Request, exc: ForbiddenError):
+    return JSONResponse(
+        status_code=403,
+        content=error_response("FORBIDDEN", exc.message),
+    )
+
+
 @app.exception_handler(AuthError)
 async def auth_exception_handler(_: Request, exc: AuthError):
     return JSONResponse(
@@ -53,42 +88,4 @@ async def auth_exception_handler(_: Request, exc: AuthError):
     )
 
 
-@app.middleware("http")
-async def request_context(request: Request, call_next):
-    """追加 request_id、记录时延并统一异常输出。"""
-    request_id = str(uuid4())
-    request.state.request_id = request_id
-    start_time = time.perf_counter()
-    response = None
-    try:
-        response = await call_next(request)
-    except Exception:
-        step = getattr(request.state, "step", "-")
-        model = getattr(request.state, "model", "-")
-        logger.exception(
-            "Unhandled error request_id=%s step=%s model=%s",
-            request_id,
-            step,
-            model,
-        )
-        response = JSONResponse(
-            status_code=500,
-            content=error_response("UPSTREAM_ERROR", "服务内部异常，请稍后重试。"),
-        )
-    duration_ms = (time.perf_counter() - start_time) * 1000
-    step = getattr(request.state, "step", "-")
-    model = getattr(request.state, "model", "-")
-    logger.info(
-        "request completed request_id=%s step=%s model=%s latency_ms=%.2f",
-        request_id,
-        step,
-        model,
-        duration_ms,
-    )
-    if response is None:
-        response = JSONResponse(
-            status_code=500,
-            content=error_response("UPSTREAM_ERROR", "服务内部异常，请稍后重试。"),
-        )
-    response.headers["X-Request-ID"] = request_id
-    return response
+app.add_middleware(RequestContextMiddleware)
@@ -0,0 +1,16 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class MediaUploadUrlRequest(BaseModel):
+    """申请 COS 直传地址"""
+    media_type: str = Field(..., min_length=1)
+    content_type: str = Field(..., min_length=1)
+    size: int = Field(..., ge=1)
+    filename: Optional[str] = None
+
+
+class MediaCompleteRequest(BaseModel):
+    """直传完成后回调，upload_token 来自 /media/upload-url"""
+    upload_token: str = Field(..., min_length=1)
@@ -24,3 +24,8 @@ def error_response(code: str, message: str) -> dict:
     return {"ok": False, "data": None, "error": {"code": code, "message": message}}
 
 
+def retry_after_headers(retry_after: Optional[int]) -> Optional[dict]:
+    """限流响应附带 Retry-After（秒）。"""
+    if retry_after is None:
+        return None
+    return {"Retry-After": str(retry_after)}
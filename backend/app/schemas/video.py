@@ -35,3 +35,17 @@ class VideoGenerateRequest(BaseModel):
     @validator("provider")
     def normalize_provider(cls, value: str) -> str:
         return value.lower()
+
+
+class VideoStatusBatchRequest(BaseModel):
+    """批量查询视频任务状态，数量上限由 VIDEO_STATUS_BATCH_MAX 控制"""
+    task_ids: List[str] = Field(..., min_items=1)
+    provider: str = Field("t8star")
+
+    @validator("task_ids")
+    def dedupe_task_ids(cls, value: List[str]) -> List[str]:
+        return list(dict.fromkeys(item.strip() for item in value))
+
+    @validator("provider")
+    def normalize_provider(cls, value: str) -> str:
+        return value.strip().lower()
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import asyncio
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+import logging
+import math
+import time
+from typing import AsyncIterator, Optional
+
+from app.core.config import Settings, get_settings
+from app.core.tracing import span
+
+logger = logging.getLogger("gridworkflow")
+
+_ANONYMOUS = "-"
+
+
+@dataclass
+class AdmissionRejected(Exception):
+    """排队已满或等待超时，retry_after 为预计可重试的秒数。"""
+
+    retry_after: int
+    reason: str = "queue_full"
+
+
+def parse_model_limits(raw: str) -> dict[str, int]:
+    """解析 "sora-2-pro=2,nano-banana-2=8" 形式的按模型并发上限。"""
+    limits: dict[str, int] = {}
+    for item in raw.split(","):
+        name, sep, value = item.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            limits[name.strip()] = max(1, int(value))
+        except ValueError:
+            logger.warning("invalid admission model limit entry ignored")
+    return limits
+
+
+class _Waiter:
+    __slots__ = ("user", "model", "future", "enqueued_at")
+
+    def __init__(self, user: str, model: str) -> None:
+        self.user = user
+        self.model = model
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionController:
+    """进程内准入控制：全局 / 按模型 / 按用户并发上限 + 有界等待队列。
+
+    队列按用户分组，出队时在用户之间轮转，单个用户排很多任务也不会饿死其他人；
+    队列满或等待超时直接拒绝，Retry-After 按平均占用时长和前面的排队数估算。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        global_limit: int,
+        per_user_limit: int,
+        model_limits: Optional[dict[str, int]] = None,
+        max_queue: int = 64,
+        max_wait_seconds: float = 30.0,
+        initial_service_seconds: float = 5.0,
+    ) -> None:
+        self.name = name
+        self._global_limit = max(1, global_limit)
+        self._per_user_limit = max(1, per_user_limit)
+        self._model_limits = model_limits or {}
+        self._max_queue = max(0, max_queue)
+        self._max_wait = max(0.1, max_wait_seconds)
+        self._service_ewma = max(0.1, initial_service_seconds)
+        self._active = 0
+        self._active_by_model: Counter[str] = Counter()
+        self._active_by_user: Counter[str] = Counter()
+        # 用户 -> 该用户的等待者；OrderedDict 的顺序即轮转顺序
+        self._queues: OrderedDict[str, deque[_Waiter]] = OrderedDict()
+        self._queued = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._waited = 0
+
+    def _can_run(self, user: str, model: str) -> bool:
+        if self._active >= self._global_limit:
+            return False
+        if self._active_by_user[user] >= self._per_user_limit:
+            return False
+        model_limit = self._model_limits.get(model)
+        return model_limit is None or self._active_by_model[model] < model_limit
+
+    def _acquire(self, user: str, model: str) -> None:
+        self._active += 1
+        self._active_by_model[model] += 1
+        self._active_by_user[user] += 1
+        self._admitted += 1
+
+    def _release(self, user: str, model: str) -> None:
+        self._active -= 1
+        self._active_by_model[model] -= 1
+        if self._active_by_model[model] <= 0:
+            del self._active_by_model[model]
+        self._active_by_user[user] -= 1
+        if self._active_by_user[user] <= 0:
+            del self._active_by_user[user]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        granted = True
+        while granted and self._queues and self._active < self._global_limit:
+            granted = False
+            for user in list(self._queues):
+                queue = self._queues[user]
+                while queue and queue[0].future.done():
+                    queue.popleft()
+                    self._queued -= 1
+                if not queue:
+                    del self._queues[user]
+                    continue
+                waiter = queue[0]
+                if not self._can_run(user, waiter.model):
+                    continue
+                queue.popleft()
+                self._queued -= 1
+                self._acquire(user, waiter.model)
+                waiter.future.set_result(None)
+                # 本轮已放行的用户挪到队尾
+                del self._queues[user]
+                if queue:
+                    self._queues[user] = queue
+                granted = True
+                if self._active >= self._global_limit:
+                    break
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.user)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            del self._queues[waiter.user]
+
+    def retry_after(self) -> int:
+        # 前面的排队任务按全局并发分批完成，每批约一个平均占用时长
+        waves = (self._queued + 1) / self._global_limit
+        return max(1, math.ceil(waves * self._service_ewma))
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[str], model: str) -> AsyncIterator[None]:
+        user = user_id or _ANONYMOUS
+        if not self._queues and self._can_run(user, model):
+            self._acquire(user, model)
+        else:
+            with span("admission.wait", model=model):
+                await self._wait(user, model)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self._service_ewma = self._service_ewma * 0.8 + elapsed * 0.2
+            self._release(user, model)
+
+    async def _wait(self, user: str, model: str) -> None:
+        if self._queued >= self._max_queue:
+            self._rejected += 1
+            raise AdmissionRejected(self.retry_after())
+        waiter = _Waiter(user, model)
+        self._queues.setdefault(user, deque()).append(waiter)
+        self._queued += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(waiter.future, self._max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 名额已分配但调用方不再需要，立即归还
+                self._release(user, model)
+            else:
+                self._remove(waiter)
+            if isinstance(exc, asyncio.TimeoutError):
+                self._timeouts += 1
+                self._rejected += 1
+                raise AdmissionRejected(self.retry_after(), "timeout") from None
+            raise
+        waited = time.monotonic() - waiter.enqueued_at
+        self._waited += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "active": self._active,
+            "queue_depth": self._queued,
+            "queued_users": len(self._queues),
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "timeouts": self._timeouts,
+            "wait_ms_avg": round(self._wait_total / self._waited * 1000, 2) if self._waited else 0.0,
+            "wait_ms_max": round(self._wait_max * 1000, 2),
+            "service_sec_ewma": round(self._service_ewma, 3),
+        }
+
+
+_controllers: dict[str, AdmissionController] = {}
+
+
+def get_admission_controller(
+    name: str, settings: Optional[Settings] = None
+) -> Optional[AdmissionController]:
+    """name 为 "image" 或 "video"；未开启准入控制时返回 None。"""
+    settings = settings or get_settings()
+    if not settings.admission_enabled:
+        return None
+    controller = _controllers.get(name)
+    if controller is None:
+        if name == "video":
+            global_limit = settings.video_admission_global_limit
+            initial_service_seconds = settings.video_timeout_sec / 10
+        else:
+            global_limit = settings.image_admission_global_limit
+            initial_service_seconds = settings.image_timeout_sec / 2
+        controller = AdmissionController(
+            name,
+            global_limit=global_limit,
+            per_user_limit=settings.admission_per_user_limit,
+            model_limits=parse_model_limits(settings.admission_model_limits),
+            max_queue=settings.admission_max_queue,
+            max_wait_seconds=settings.admission_max_wait_sec,
+            initial_service_seconds=initial_service_seconds,
+        )
+        _controllers[name] = controller
+    return controller
+
+
+def admission_stats() -> dict[str, dict[str, float]]:
+    return {name: controller.stats() for name, controller in _controllers.items()}
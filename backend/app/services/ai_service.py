@@ -3,12 +3,26 @@ from __future__ import annotations
 import base64
 import binascii
 from dataclasses import dataclass
-from typing import Any, Optional
+import hashlib
+from typing import Any, AsyncGenerator, Awaitable, Callable, Optional
 
 import httpx
 
 from app.core.config import Settings
+from app.core.json_codec import loads
+from app.core.metrics import errors_total
+from app.core.tracing import span
+from app.services.admission import AdmissionRejected, get_admission_controller
 from app.schemas.ai import AnalyzeRequest, GenerateImageRequest
+from app.services.response_cache import (
+    CACHE_HIT,
+    CACHE_MISS,
+    ResponseCache,
+    build_cache_key,
+    get_response_cache,
+)
+from app.services.singleflight import build_flight_key, get_singleflight
+from app.services.upstream import get_upstream_pool
 
 EMPTY_1X1_PNG = bytes(
     [
@@ -83,11 +97,18 @@ EMPTY_1X1_PNG = bytes(
 )
 
 
+_STREAM_DONE = object()
+
+
 @dataclass
 class APIError(Exception):
     code: str
     message: str
     status_code: int = 400
+    retry_after: Optional[int] = None
+
+    def __post_init__(self) -> None:
+        errors_total.inc("ai", self.code)
 
 
 def _resolve_api_key(settings: Settings, user_key: Optional[str]) -> str:
@@ -178,11 +199,7 @@ def _ensure_prompt(prompt: str) -> None:
         raise APIError(code="BAD_REQUEST", message="prompt 不能为空", status_code=400)
 
 
-async def analyze_text(
-    payload: AnalyzeRequest, user_key: Optional[str], settings: Settings
-) -> Any:
-    _ensure_prompt(payload.prompt)
-    api_key = _resolve_api_key(settings, user_key)
+def _build_chat_body(payload: AnalyzeRequest, settings: Settings) -> dict[str, Any]:
     model = payload.model or settings.default_text_model
     messages = []
     if payload.system_instruction:
@@ -193,34 +210,206 @@ async def analyze_text(
     response_format = _build_response_format(payload.response_format)
     if response_format:
         body["response_format"] = response_format
+    return body
+
 
+def _text_cache_key(payload: AnalyzeRequest, settings: Settings) -> str:
+    return build_cache_key(
+        payload.model or settings.default_text_model,
+        payload.system_instruction,
+        payload.prompt,
+        payload.response_format,
+    )
+
+
+def _parse_stream_line(line: str) -> Any:
+    """解析上游 SSE 的一行，返回增量文本、None（无内容）或 _STREAM_DONE。"""
+    if not line.startswith("data:"):
+        return None
+    raw = line[5:].strip()
+    if not raw:
+        return None
+    if raw == "[DONE]":
+        return _STREAM_DONE
     try:
-        async with httpx.AsyncClient(timeout=settings.text_timeout_sec) as client:
-            resp = await client.post(
+        chunk = loads(raw)
+    except ValueError:
+        return None
+    choices = chunk.get("choices") if isinstance(chunk, dict) else None
+    if not isinstance(choices, list) or not choices or not isinstance(choices[0], dict):
+        return None
+    delta = choices[0].get("delta")
+    if isinstance(delta, dict):
+        content = delta.get("content")
+        return content if isinstance(content, str) and content else None
+    return None
+
+
+async def _coalesce(
+    settings: Settings,
+    operation: str,
+    api_key: str,
+    user_id: Optional[str],
+    fingerprint: Any,
+    call: Callable[[], Awaitable[Any]],
+) -> Any:
+    if not settings.singleflight_enabled:
+        return await call()
+    scope = user_id if settings.singleflight_scope == "user" else None
+    key = build_flight_key(operation, api_key, scope, fingerprint)
+    with span("singleflight", operation=operation):
+        return await get_singleflight(operation).do(key, call)
+
+
+async def analyze_text(
+    payload: AnalyzeRequest,
+    user_key: Optional[str],
+    settings: Settings,
+    user_id: Optional[str] = None,
+) -> Any:
+    _ensure_prompt(payload.prompt)
+    api_key = _resolve_api_key(settings, user_key)
+    body = _build_chat_body(payload, settings)
+
+    async def _call() -> Any:
+        try:
+            resp = await get_upstream_pool(settings).request(
+                "POST",
                 f"{_normalize_base_url(settings)}/chat/completions",
+                timeout_seconds=settings.text_timeout_sec,
                 headers={"Authorization": f"Bearer {api_key}"},
                 json=body,
             )
+        except httpx.TimeoutException as exc:
+            raise APIError(code="TIMEOUT", message="上游服务超时，请稍后重试", status_code=504) from exc
+        except httpx.RequestError as exc:
+            raise APIError(code="UPSTREAM_ERROR", message="上游服务异常，请稍后重试", status_code=502) from exc
+
+        if resp.status_code >= 400:
+            raise _map_upstream_error(resp.status_code)
+
+        with span("upstream.decode_json", bytes=len(resp.content)):
+            data = loads(resp.content)
+        return _extract_chat_content(data)
+
+    return await _coalesce(settings, "ai.analyze", api_key, user_id, body, _call)
+
+
+def _cacheable_text(result: Any) -> bool:
+    return isinstance(result, str) and bool(result.strip())
+
+
+async def analyze_text_cached(
+    payload: AnalyzeRequest,
+    user_key: Optional[str],
+    settings: Settings,
+    refresh: bool = False,
+    user_id: Optional[str] = None,
+) -> tuple[Any, Optional[str]]:
+    """带响应缓存的 analyze_text，返回 (结果, X-Cache 状态)；未开启缓存时状态为 None。"""
+    cache = get_response_cache(settings)
+    if cache is None:
+        return await analyze_text(payload, user_key, settings, user_id), None
+    _ensure_prompt(payload.prompt)
+    key = _text_cache_key(payload, settings)
+    if not refresh:
+        found, cached = await cache.get(key)
+        if found and _cacheable_text(cached):
+            return cached, CACHE_HIT
+    result = await analyze_text(payload, user_key, settings, user_id)
+    if _cacheable_text(result):
+        # 上游缺 choices 或内容为空时路由会返回 502，这类结果不能写入缓存
+        await cache.set(key, result)
+    return result, CACHE_MISS
+
+
+async def stream_text(
+    payload: AnalyzeRequest, user_key: Optional[str], settings: Settings
+) -> AsyncGenerator[str, None]:
+    """以 stream=true 调用 chat/completions，逐段产出增量文本。"""
+    _ensure_prompt(payload.prompt)
+    api_key = _resolve_api_key(settings, user_key)
+    body = _build_chat_body(payload, settings)
+    body["stream"] = True
+
+    try:
+        async with get_upstream_pool(settings).stream(
+            "POST",
+            f"{_normalize_base_url(settings)}/chat/completions",
+            timeout_seconds=settings.text_timeout_sec,
+            headers={"Authorization": f"Bearer {api_key}"},
+            json=body,
+        ) as resp:
+            if resp.status_code >= 400:
+                raise _map_upstream_error(resp.status_code)
+            if "text/event-stream" not in resp.headers.get("content-type", ""):
+                # 上游忽略 stream 参数时退化为一次性返回
+                content = _extract_chat_content(loads(await resp.aread()))
+                if isinstance(content, str) and content:
+                    yield content
+                return
+            async for line in resp.aiter_lines():
+                delta = _parse_stream_line(line)
+                if delta is _STREAM_DONE:
+                    break
+                if delta:
+                    yield delta
     except httpx.TimeoutException as exc:
         raise APIError(code="TIMEOUT", message="上游服务超时，请稍后重试", status_code=504) from exc
     except httpx.RequestError as exc:
         raise APIError(code="UPSTREAM_ERROR", message="上游服务异常，请稍后重试", status_code=502) from exc
+    except ValueError as exc:
+        raise APIError(code="UPSTREAM_ERROR", message="上游服务异常，请稍后重试", status_code=502) from exc
 
-    if resp.status_code >= 400:
-        raise _map_upstream_error(resp.status_code)
 
-    data = resp.json()
-    return _extract_chat_content(data)
+async def _single_chunk(text: str) -> AsyncGenerator[str, None]:
+    yield text
+
+
+async def _store_on_complete(
+    chunks: AsyncGenerator[str, None], cache: ResponseCache, key: str
+) -> AsyncGenerator[str, None]:
+    parts: list[str] = []
+    async for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    text = "".join(parts)
+    if _cacheable_text(text):
+        await cache.set(key, text)
+
+
+async def stream_text_cached(
+    payload: AnalyzeRequest,
+    user_key: Optional[str],
+    settings: Settings,
+    refresh: bool = False,
+) -> tuple[AsyncGenerator[str, None], Optional[str]]:
+    """流式版本的 analyze_text_cached；命中缓存时整段文本作为一个增量返回。"""
+    cache = get_response_cache(settings)
+    if cache is None:
+        return stream_text(payload, user_key, settings), None
+    _ensure_prompt(payload.prompt)
+    key = _text_cache_key(payload, settings)
+    if not refresh:
+        found, cached = await cache.get(key)
+        if found and _cacheable_text(cached):
+            return _single_chunk(cached), CACHE_HIT
+    return _store_on_complete(stream_text(payload, user_key, settings), cache, key), CACHE_MISS
 
 
 async def generate_image(
-    payload: GenerateImageRequest, user_key: Optional[str], settings: Settings
+    payload: GenerateImageRequest,
+    user_key: Optional[str],
+    settings: Settings,
+    user_id: Optional[str] = None,
 ) -> Any:
     _ensure_prompt(payload.prompt)
     api_key = _resolve_api_key(settings, user_key)
     model = payload.model or settings.default_image_model
     response_format = _validate_image_response_format(payload.response_format)
-    image_bytes = _decode_image_base64(payload.image, settings.max_image_base64_bytes)
+    with span("image.decode_base64") as current:
+        image_bytes = _decode_image_base64(payload.image, settings.max_image_base64_bytes)
+        current.set("bytes", len(image_bytes))
 
     data: dict[str, Any] = {
         "model": model,
@@ -234,21 +423,44 @@ async def generate_image(
 
     files = {"image": ("reference.png", image_bytes, "image/png")}
 
-    try:
-        async with httpx.AsyncClient(timeout=settings.image_timeout_sec) as client:
-            resp = await client.post(
+    async def _post() -> Any:
+        try:
+            resp = await get_upstream_pool(settings).request(
+                "POST",
                 f"{_normalize_base_url(settings)}/images/edits",
+                timeout_seconds=settings.image_timeout_sec,
                 headers={"Authorization": f"Bearer {api_key}"},
                 data=data,
                 files=files,
             )
-    except httpx.TimeoutException as exc:
-        raise APIError(code="TIMEOUT", message="上游服务超时，请稍后重试", status_code=504) from exc
-    except httpx.RequestError as exc:
-        raise APIError(code="UPSTREAM_ERROR", message="上游服务异常，请稍后重试", status_code=502) from exc
-
-    if resp.status_code >= 400:
-        raise _map_upstream_error(resp.status_code)
-
-    data = resp.json()
-    return data.get("data") if isinstance(data, dict) and "data" in data else data
+        except httpx.TimeoutException as exc:
+            raise APIError(code="TIMEOUT", message="上游服务超时，请稍后重试", status_code=504) from exc
+        except httpx.RequestError as exc:
+            raise APIError(code="UPSTREAM_ERROR", message="上游服务异常，请稍后重试", status_code=502) from exc
+
+        if resp.status_code >= 400:
+            raise _map_upstream_error(resp.status_code)
+
+        with span("upstream.decode_json", bytes=len(resp.content)):
+            result = loads(resp.content)
+        return result.get("data") if isinstance(result, dict) and "data" in result else result
+
+    async def _call() -> Any:
+        # 合并之后再排队，同一请求的多个等待者只占一个名额
+        controller = get_admission_controller("image", settings)
+        if controller is None:
+            return await _post()
+        try:
+            async with controller.slot(user_id, model):
+                return await _post()
+        except AdmissionRejected as exc:
+            raise APIError(
+                code="RATE_LIMITED",
+                message="当前生成请求较多，请稍后重试",
+                status_code=429,
+                retry_after=exc.retry_after,
+            ) from exc
+
+    with span("image.fingerprint"):
+        fingerprint = {**data, "image_sha256": hashlib.sha256(image_bytes).hexdigest()}
+    return await _coalesce(settings, "ai.generate_image", api_key, user_id, fingerprint, _call)
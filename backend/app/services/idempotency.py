@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from app.core.config import Settings, get_settings
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """同一个 Idempotency-Key 被用于内容不同的请求。"""
+
+
+def is_valid_idempotency_key(key: str) -> bool:
+    return 0 < len(key) <= MAX_KEY_LENGTH and key.isprintable()
+
+
+def build_fingerprint(payload: Any) -> str:
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Record:
+    __slots__ = ("fingerprint", "task", "expires_at")
+
+    def __init__(self, fingerprint: str, task: asyncio.Future, expires_at: float) -> None:
+        self.fingerprint = fingerprint
+        self.task = task
+        self.expires_at = expires_at
+
+
+class IdempotencyStore:
+    """(user_id, key) -> 结果的有界 TTL 表，进程内有效。
+
+    - 首次请求执行 fn，成功结果保留 ttl 秒；
+    - 并发的重复请求等待首个请求完成并拿到同一结果；
+    - 失败不记忆，允许客户端用同一个 key 重试；
+    - 首个请求的连接断开不会取消 fn，避免上游已扣费却丢失结果。
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int) -> None:
+        self._ttl = max(1.0, ttl_seconds)
+        self._max_entries = max(1, max_entries)
+        self._records: OrderedDict[tuple[str, str], _Record] = OrderedDict()
+        self._executions = 0
+        self._replays = 0
+        self._conflicts = 0
+
+    async def run(
+        self,
+        user_id: str,
+        key: str,
+        fingerprint: str,
+        fn: Callable[[], Awaitable[Any]],
+    ) -> tuple[Any, bool]:
+        """返回 (结果, 是否为重放)。"""
+        record_key = (user_id, key)
+        now = time.monotonic()
+        record = self._records.get(record_key)
+        if record is not None and record.expires_at <= now:
+            self._forget(record_key, record)
+            record = None
+        if record is not None:
+            if record.fingerprint != fingerprint:
+                self._conflicts += 1
+                raise IdempotencyConflict(key)
+            self._replays += 1
+            return await asyncio.shield(record.task), True
+
+        record = _Record(fingerprint, asyncio.ensure_future(fn()), now + self._ttl)
+        self._records[record_key] = record
+        record.task.add_done_callback(lambda task: self._on_done(record_key, record, task))
+        self._executions += 1
+        self._evict()
+        return await asyncio.shield(record.task), False
+
+    def _on_done(self, record_key: tuple[str, str], record: _Record, task: asyncio.Future) -> None:
+        if task.cancelled() or task.exception() is not None:
+            self._forget(record_key, record)
+
+    def _forget(self, record_key: tuple[str, str], record: _Record) -> None:
+        if self._records.get(record_key) is record:
+            del self._records[record_key]
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for record_key, record in list(self._records.items()):
+            if len(self._records) <= self._max_entries:
+                break
+            # 进行中的记录不能淘汰，否则并发重复请求会再次调用上游
+            if record.task.done() or record.expires_at <= now:
+                del self._records[record_key]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._records),
+            "executions": self._executions,
+            "replays": self._replays,
+            "conflicts": self._conflicts,
+        }
+
+
+_store: Optional[IdempotencyStore] = None
+
+
+def get_idempotency_store(settings: Optional[Settings] = None) -> IdempotencyStore:
+    global _store
+    if _store is None:
+        settings = settings or get_settings()
+        _store = IdempotencyStore(
+            settings.idempotency_ttl_sec, settings.idempotency_max_entries
+        )
+    return _store
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from contextlib import closing
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Optional, Protocol
+
+from app.core.config import Settings, get_settings
+from app.core.json_codec import dumps_str, loads
+
+logger = logging.getLogger("gridworkflow")
+
+CACHE_HIT = "HIT"
+CACHE_MISS = "MISS"
+
+
+def build_cache_key(
+    model: str,
+    system_instruction: Optional[str],
+    prompt: str,
+    response_format: Optional[str],
+) -> str:
+    raw = json.dumps(
+        [model, system_instruction or "", prompt, (response_format or "").lower()],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def wants_refresh(cache_control: Optional[str]) -> bool:
+    """客户端显式 Cache-Control: no-cache 时跳过读缓存，但仍回写最新结果。"""
+    if not cache_control:
+        return False
+    directives = {item.strip().lower() for item in cache_control.split(",")}
+    return "no-cache" in directives or "no-store" in directives
+
+
+def cache_headers(cache_status: Optional[str]) -> dict[str, str]:
+    return {"X-Cache": cache_status} if cache_status else {}
+
+
+class CacheTier(Protocol):
+    async def get(self, key: str) -> Optional[str]:
+        ...
+
+    async def set(self, key: str, value: str, ttl_seconds: float) -> None:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+
+class MemoryCacheTier:
+    """进程内 LRU，按条目数与总字节数双重限制。"""
+
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        self._max_entries = max(1, max_entries)
+        self._max_bytes = max(1, max_bytes)
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl_seconds: float) -> None:
+        size = len(value)
+        if size > self._max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl_seconds, value)
+        self._bytes += size
+        while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    async def close(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+
+class SQLiteCacheTier:
+    """共享缓存层的本地替身，多进程/多 worker 间通过同一个文件共享。"""
+
+    def __init__(self, path: str, max_entries: int) -> None:
+        self._path = path
+        self._max_entries = max(1, max_entries)
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path, timeout=5)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_response_cache_created_at "
+                "ON response_cache(created_at)"
+            )
+            self._initialized = True
+        return conn
+
+    def _get_sync(self, key: str) -> Optional[str]:
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at <= time.time():
+                conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            return value
+
+    def _set_sync(self, key: str, value: str, ttl_seconds: float) -> None:
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl_seconds, now),
+            )
+            conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self._max_entries,),
+            )
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get_sync, key)
+
+    async def set(self, key: str, value: str, ttl_seconds: float) -> None:
+        await asyncio.to_thread(self._set_sync, key, value, ttl_seconds)
+
+    async def close(self) -> None:
+        return None
+
+
+class ResponseCache:
+    """两级缓存：内存 LRU 优先，未命中再查共享层并回填内存。"""
+
+    def __init__(
+        self,
+        memory: MemoryCacheTier,
+        shared: Optional[CacheTier] = None,
+        ttl_seconds: float = 3600,
+    ) -> None:
+        self._memory = memory
+        self._shared = shared
+        self._ttl = ttl_seconds
+        self._hits = 0
+        self._shared_hits = 0
+        self._misses = 0
+
+    async def get(self, key: str) -> tuple[bool, Any]:
+        raw = await self._memory.get(key)
+        if raw is None and self._shared is not None:
+            try:
+                raw = await self._shared.get(key)
+            except Exception:
+                logger.warning("response cache shared tier read failed", exc_info=True)
+                raw = None
+            if raw is not None:
+                self._shared_hits += 1
+                await self._memory.set(key, raw, self._ttl)
+        if raw is None:
+            self._misses += 1
+            return False, None
+        self._hits += 1
+        return True, loads(raw)
+
+    async def set(self, key: str, value: Any) -> None:
+        raw = dumps_str(value)
+        await self._memory.set(key, raw, self._ttl)
+        if self._shared is not None:
+            try:
+                await self._shared.set(key, raw, self._ttl)
+            except Exception:
+                logger.warning("response cache shared tier write failed", exc_info=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hits": self._hits,
+            "shared_hits": self._shared_hits,
+            "misses": self._misses,
+            "entries": len(self._memory),
+            "bytes": self._memory.size_bytes,
+        }
+
+    async def close(self) -> None:
+        await self._memory.close()
+        if self._shared is not None:
+            await self._shared.close()
+
+
+def _build_shared_tier(settings: Settings) -> Optional[CacheTier]:
+    backend = settings.ai_cache_shared_backend.strip().lower()
+    if not backend:
+        return None
+    if backend == "sqlite":
+        return SQLiteCacheTier(settings.ai_cache_sqlite_path, settings.ai_cache_max_entries * 8)
+    logger.warning("unknown ai cache shared backend=%s, shared tier disabled", backend)
+    return None
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache(settings: Optional[Settings] = None) -> Optional[ResponseCache]:
+    """未开启缓存时返回 None，调用方据此直连上游。"""
+    global _cache
+    settings = settings or get_settings()
+    if not settings.ai_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = ResponseCache(
+            MemoryCacheTier(settings.ai_cache_max_entries, settings.ai_cache_max_bytes),
+            _build_shared_tier(settings),
+            ttl_seconds=settings.ai_cache_ttl_sec,
+        )
+    return _cache
+
+
+async def close_response_cache() -> None:
+    global _cache
+    cache, _cache = _cache, None
+    if cache is not None:
+        await cache.close()
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def build_flight_key(
+    operation: str, api_key: str, scope: Optional[str], fingerprint: Any
+) -> str:
+    key_digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    raw = json.dumps(
+        [operation, key_digest, scope or "", fingerprint],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """同 key 的并发调用共享一个上游 Future。
+
+    - 上游异常会原样抛给所有等待者；
+    - 单个等待者被取消不影响其他人，所有等待者都离开时才取消上游调用。
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._flights: dict[str, _Flight] = {}
+        self._calls = 0
+        self._executions = 0
+        self._coalesced = 0
+        self._abandoned = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        self._calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task: self._forget(key, flight))
+            self._executions += 1
+        else:
+            self._coalesced += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # 没人再等这个结果了，取消上游并让后续请求重新发起
+                self._abandoned += 1
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "calls": self._calls,
+            "executions": self._executions,
+            "coalesced": self._coalesced,
+            "abandoned": self._abandoned,
+            "in_flight": len(self._flights),
+        }
+
+
+_groups: dict[str, SingleFlight] = {}
+
+
+def get_singleflight(name: str) -> SingleFlight:
+    group = _groups.get(name)
+    if group is None:
+        group = SingleFlight(name)
+        _groups[name] = group
+    return group
+
+
+def singleflight_stats() -> dict[str, dict[str, int]]:
+    return {name: group.stats() for name, group in _groups.items()}
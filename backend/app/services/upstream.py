@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+import logging
+import time
+from typing import Any, AsyncIterator, Optional
+
+import httpx
+
+from app.core.config import Settings, get_settings
+from app.core.metrics import (
+    upstream_endpoint,
+    upstream_outcome,
+    upstream_request_duration_seconds,
+)
+from app.core.tracing import propagation_headers, span
+
+logger = logging.getLogger("gridworkflow")
+
+
+def _has_http2_support() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _origin_of(url: str) -> str:
+    parsed = httpx.URL(url)
+    port = f":{parsed.port}" if parsed.port else ""
+    return f"{parsed.scheme}://{parsed.host}{port}"
+
+
+class UpstreamClientPool:
+    """按上游 origin 维护长连接池，供 ai_service / video_service 共享。"""
+
+    def __init__(self, settings: Settings) -> None:
+        self._limits = httpx.Limits(
+            max_connections=settings.upstream_max_connections,
+            max_keepalive_connections=settings.upstream_max_keepalive_connections,
+            keepalive_expiry=settings.upstream_keepalive_expiry_sec,
+        )
+        self._connect_timeout = settings.upstream_connect_timeout_sec
+        self._http2 = settings.upstream_http2 and _has_http2_support()
+        if settings.upstream_http2 and not self._http2:
+            logger.warning("upstream http2 requested but h2 is not installed, using http/1.1")
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        # 只向 AI 网关透传 traceparent/X-Request-ID，媒体源站与 COS 不带
+        self._propagate_origins = {_origin_of(settings.ai_gateway_base_url)}
+        self._requests_total: dict[str, int] = {}
+        self._in_flight: dict[str, int] = {}
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        origin = _origin_of(url)
+        client = self._clients.get(origin)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=self._limits, http2=self._http2)
+            self._clients[origin] = client
+        return client
+
+    def _headers(self, origin: str, headers: Optional[dict[str, str]]) -> Optional[dict[str, str]]:
+        if origin not in self._propagate_origins:
+            return headers
+        # 调用方显式传入的同名头优先
+        return {**propagation_headers(), **(headers or {})}
+
+    def timeout(self, seconds: float) -> httpx.Timeout:
+        return httpx.Timeout(seconds, connect=min(self._connect_timeout, seconds))
+
+    async def request(
+        self, method: str, url: str, *, timeout_seconds: float, **kwargs: Any
+    ) -> httpx.Response:
+        origin = _origin_of(url)
+        client = self.client(url)
+        self._requests_total[origin] = self._requests_total.get(origin, 0) + 1
+        self._in_flight[origin] = self._in_flight.get(origin, 0) + 1
+        started = time.perf_counter()
+        outcome = "error"
+        endpoint = upstream_endpoint(httpx.URL(url).path)
+        try:
+            with span("upstream." + endpoint, method=method) as current:
+                response = await client.request(
+                    method,
+                    url,
+                    timeout=self.timeout(timeout_seconds),
+                    headers=self._headers(origin, kwargs.pop("headers", None)),
+                    **kwargs,
+                )
+                current.set("status", response.status_code)
+            outcome = upstream_outcome(response.status_code)
+            return response
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            raise
+        finally:
+            self._in_flight[origin] -= 1
+            _observe(endpoint, outcome, started)
+
+    @asynccontextmanager
+    async def stream(
+        self, method: str, url: str, *, timeout_seconds: float, **kwargs: Any
+    ) -> AsyncIterator[httpx.Response]:
+        origin = _origin_of(url)
+        client = self.client(url)
+        self._requests_total[origin] = self._requests_total.get(origin, 0) + 1
+        self._in_flight[origin] = self._in_flight.get(origin, 0) + 1
+        started = time.perf_counter()
+        outcome = "error"
+        endpoint = upstream_endpoint(httpx.URL(url).path)
+        try:
+            with span("upstream." + endpoint, method=method, stream=True) as current:
+                async with client.stream(
+                    method,
+                    url,
+                    timeout=self.timeout(timeout_seconds),
+                    headers=self._headers(origin, kwargs.pop("headers", None)),
+                    **kwargs,
+                ) as response:
+                    current.set("status", response.status_code)
+                    outcome = upstream_outcome(response.status_code)
+                    yield response
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            raise
+        finally:
+            self._in_flight[origin] -= 1
+            # 流式调用记录到整个响应体读完为止
+            _observe(endpoint, outcome, started)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        result: dict[str, dict[str, Any]] = {}
+        for origin, client in self._clients.items():
+            connections = _pool_connections(client)
+            idle = sum(1 for conn in connections if _safe_call(conn, "is_idle"))
+            result[origin] = {
+                "http2": self._http2,
+                "requests_total": self._requests_total.get(origin, 0),
+                "in_flight": self._in_flight.get(origin, 0),
+                "connections": len(connections),
+                "idle_connections": idle,
+                "active_connections": len(connections) - idle,
+                "max_connections": self._limits.max_connections,
+                "max_keepalive_connections": self._limits.max_keepalive_connections,
+            }
+        return result
+
+    async def aclose(self) -> None:
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception:
+                logger.warning("upstream client close failed", exc_info=True)
+
+
+def _observe(endpoint: str, outcome: str, started: float) -> None:
+    upstream_request_duration_seconds.observe(time.perf_counter() - started, endpoint, outcome)
+
+
+def _pool_connections(client: httpx.AsyncClient) -> list:
+    # httpx 未公开连接池状态，这里只做只读探测，取不到时按 0 处理
+    transport = getattr(client, "_transport", None)
+    pool = getattr(transport, "_pool", None)
+    connections = getattr(pool, "connections", None)
+    return list(connections) if connections else []
+
+
+def _safe_call(obj: Any, name: str) -> bool:
+    method: Optional[Any] = getattr(obj, name, None)
+    if method is None:
+        return False
+    try:
+        return bool(method())
+    except Exception:
+        return False
+
+
+_pool: Optional[UpstreamClientPool] = None
+
+
+def get_upstream_pool(settings: Optional[Settings] = None) -> UpstreamClientPool:
+    global _pool
+    if _pool is None:
+        _pool = UpstreamClientPool(settings or get_settings())
+    return _pool
+
+
+async def close_upstream_pool() -> None:
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.aclose()
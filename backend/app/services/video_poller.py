@@ -0,0 +1,529 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+import hashlib
+import itertools
+import logging
+import os
+import time
+from typing import Any, AsyncGenerator, Optional
+
+from app.core.config import Settings, get_settings
+from app.services.video_task_store import get_video_task_store
+from app.services.video_service import (
+    T8StarVideoProvider,
+    UpstreamServiceError,
+    mask_task_id,
+    parse_status_result,
+)
+from app.storage.mirror import (
+    MIRROR_DONE,
+    MIRROR_PENDING,
+    MirrorJob,
+    get_media_mirror,
+    resolve_media_url,
+)
+
+logger = logging.getLogger("gridworkflow")
+
+TERMINAL_STATUSES = {"succeeded", "failed"}
+
+_versions = itertools.count(1)
+# 版本号只在本进程内递增；事件 id 带上进程纪元，重启或换 worker 后旧 id 不会误伤新版本号
+EVENT_EPOCH = os.urandom(4).hex()
+
+
+def format_event_id(snapshot: "VideoStatusSnapshot") -> str:
+    return f"{EVENT_EPOCH}-{snapshot.version}"
+
+
+def parse_event_id(raw: Optional[str]) -> Optional[int]:
+    """解析 Last-Event-ID；格式不对或来自其他进程纪元时返回 None，即全部重放。"""
+    if not raw:
+        return None
+    epoch, _, version = raw.strip().rpartition("-")
+    if epoch != EVENT_EPOCH:
+        return None
+    try:
+        return int(version)
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class VideoStatusSnapshot:
+    task_id: str
+    provider: str
+    status: str
+    # 转存完成后为 storage:<key>，to_payload 时才换成访问地址
+    video_url: Optional[str] = None
+    error_message: Optional[str] = None
+    progress: Optional[int] = None
+    mirror_status: Optional[str] = None
+    fetched_at: float = field(default_factory=time.monotonic)
+    version: int = field(default_factory=lambda: next(_versions))
+
+    @property
+    def terminal(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    @property
+    def settled(self) -> bool:
+        """上游已结束且结果转存（如开启）也已结束，之后不会再推送变化。"""
+        return self.terminal and self.mirror_status != MIRROR_PENDING
+
+    def same_state(self, other: Optional["VideoStatusSnapshot"]) -> bool:
+        if other is None:
+            return False
+        return (
+            self.status == other.status
+            and self.video_url == other.video_url
+            and self.error_message == other.error_message
+            and self.progress == other.progress
+            and self.mirror_status == other.mirror_status
+        )
+
+    def to_payload(self) -> dict[str, Any]:
+        payload = {
+            "task_id": self.task_id,
+            "provider": self.provider,
+            "status": self.status,
+            "video_url": resolve_media_url(self.video_url),
+            "error_message": self.error_message,
+        }
+        if self.mirror_status is not None:
+            payload["mirror_status"] = self.mirror_status
+        return payload
+
+
+class StatusSubscription:
+    """单个连接的有界缓冲；同一任务只保留最新快照，溢出时丢弃最旧的一条。"""
+
+    def __init__(self, keys: set[str], max_buffer: int) -> None:
+        self.keys = keys
+        self._max_buffer = max(1, max_buffer)
+        self._pending: OrderedDict[str, VideoStatusSnapshot] = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, key: str, snapshot: VideoStatusSnapshot) -> None:
+        self._pending.pop(key, None)
+        self._pending[key] = snapshot
+        while len(self._pending) > self._max_buffer:
+            self._pending.popitem(last=False)
+            self.dropped += 1
+        self._wakeup.set()
+
+    async def drain(self, timeout: float) -> list[VideoStatusSnapshot]:
+        if not self._pending:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._wakeup.clear()
+        items = list(self._pending.values())
+        self._pending.clear()
+        return items
+
+
+class _TrackedTask:
+    __slots__ = (
+        "key",
+        "task_id",
+        "provider_name",
+        "provider",
+        "user_api_key",
+        "snapshot",
+        "interval",
+        "last_access",
+        "loop_task",
+        "mirror_task",
+    )
+
+    def __init__(
+        self,
+        key: str,
+        task_id: str,
+        provider_name: str,
+        provider: T8StarVideoProvider,
+        user_api_key: Optional[str],
+        interval: float,
+    ) -> None:
+        self.key = key
+        self.task_id = task_id
+        self.provider_name = provider_name
+        self.provider = provider
+        self.user_api_key = user_api_key
+        self.snapshot: Optional[VideoStatusSnapshot] = None
+        self.interval = interval
+        self.last_access = time.monotonic()
+        self.loop_task: Optional[asyncio.Task] = None
+        self.mirror_task: Optional[asyncio.Task] = None
+
+    @property
+    def polling(self) -> bool:
+        return self.loop_task is not None and not self.loop_task.done()
+
+
+def _task_key(provider_name: str, task_id: str, user_api_key: Optional[str]) -> str:
+    # 同一个 task_id 用不同 API Key 查询时结果可能不同，按 Key 摘要隔离
+    key_digest = hashlib.sha256((user_api_key or "").strip().encode("utf-8")).hexdigest()[:16]
+    return f"{provider_name}:{task_id}:{key_digest}"
+
+
+class VideoStatusPoller:
+    """后台按任务轮询上游并缓存状态，上游请求量只随任务数增长，与查看者数量无关。
+
+    轮询间隔从 min_interval 开始，每次未完成就乘以 backoff 直到 max_interval；
+    任务进入 succeeded/failed 或长时间无人查看时停止轮询。
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self._enabled = settings.video_poller_enabled
+        self._min_interval = max(0.5, settings.video_poll_min_interval_ms / 1000)
+        self._max_interval = max(self._min_interval, settings.video_poll_max_interval_ms / 1000)
+        self._backoff = max(1.0, settings.video_poll_backoff)
+        self._max_staleness = max(self._max_interval, settings.video_status_max_staleness_ms / 1000)
+        self._idle_timeout = settings.video_poll_idle_timeout_sec
+        self._terminal_ttl = settings.video_status_terminal_ttl_sec
+        self._max_tasks = max(1, settings.video_status_store_max_tasks)
+        self._tasks: OrderedDict[str, _TrackedTask] = OrderedDict()
+        self._subscribers: dict[str, set[StatusSubscription]] = {}
+        self._task_store = get_video_task_store(settings)
+        self._mirror = get_media_mirror(settings)
+        self._upstream_polls = 0
+        self._upstream_errors = 0
+        self._served_from_store = 0
+
+    def track(
+        self,
+        provider_name: str,
+        provider: T8StarVideoProvider,
+        task_id: str,
+        user_api_key: Optional[str],
+        initial_status: Optional[str] = None,
+    ) -> _TrackedTask:
+        key = _task_key(provider_name, task_id, user_api_key)
+        entry = self._tasks.get(key)
+        if entry is None:
+            entry = _TrackedTask(
+                key, task_id, provider_name, provider, user_api_key, self._min_interval
+            )
+            if initial_status:
+                entry.snapshot = VideoStatusSnapshot(task_id, provider_name, initial_status)
+            self._tasks[key] = entry
+            self._evict(keep=key)
+        else:
+            self._tasks.move_to_end(key)
+        entry.last_access = time.monotonic()
+        self._ensure_polling(entry)
+        return entry
+
+    async def get_status(
+        self,
+        provider_name: str,
+        provider: T8StarVideoProvider,
+        task_id: str,
+        user_api_key: Optional[str],
+        user_id: Optional[str] = None,
+    ) -> VideoStatusSnapshot:
+        entry = self.track(provider_name, provider, task_id, user_api_key)
+        snapshot = await self._cached_snapshot(entry, user_id)
+        if snapshot is not None:
+            return snapshot
+        return await self._refresh(entry)
+
+    async def get_status_many(
+        self,
+        provider_name: str,
+        provider: T8StarVideoProvider,
+        task_ids: list[str],
+        user_api_key: Optional[str],
+        concurrency: int,
+        user_id: Optional[str] = None,
+    ) -> list[VideoStatusSnapshot | UpstreamServiceError]:
+        """批量查询：缓存里够新的直接返回，其余按并发上限回源，单个失败不影响其他任务。"""
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def _one(task_id: str) -> VideoStatusSnapshot | UpstreamServiceError:
+            entry = self.track(provider_name, provider, task_id, user_api_key)
+            snapshot = await self._cached_snapshot(entry, user_id)
+            if snapshot is not None:
+                return snapshot
+            async with semaphore:
+                try:
+                    return await self._refresh(entry)
+                except UpstreamServiceError as exc:
+                    return exc
+
+        return list(await asyncio.gather(*(_one(task_id) for task_id in task_ids)))
+
+    async def _cached_snapshot(
+        self, entry: _TrackedTask, user_id: Optional[str]
+    ) -> Optional[VideoStatusSnapshot]:
+        snapshot = entry.snapshot
+        if snapshot is None and self._task_store is not None and user_id:
+            snapshot = await self._load_finished(entry, user_id)
+        if snapshot is not None and self._is_fresh(entry, snapshot):
+            self._served_from_store += 1
+            return snapshot
+        return None
+
+    async def _load_finished(
+        self, entry: _TrackedTask, user_id: str
+    ) -> Optional[VideoStatusSnapshot]:
+        """内存里没有时查持久化记录；只信任本人创建且已结束的任务。"""
+        try:
+            record = await self._task_store.get(entry.task_id)
+        except Exception:
+            logger.exception(
+                "video task load failed task_id=%s step=video_task_store",
+                mask_task_id(entry.task_id),
+            )
+            return None
+        if record is None or not record.terminal or record.user_id != user_id:
+            return None
+        if entry.snapshot is None:
+            entry.snapshot = VideoStatusSnapshot(
+                entry.task_id,
+                entry.provider_name,
+                record.status,
+                record.result_url,
+                record.error_message,
+                record.progress,
+            )
+        if entry.polling:
+            entry.loop_task.cancel()
+        return entry.snapshot
+
+    def _is_fresh(self, entry: _TrackedTask, snapshot: VideoStatusSnapshot) -> bool:
+        age = time.monotonic() - snapshot.fetched_at
+        if snapshot.terminal:
+            # 有持久化存储时已结束的任务不会再变化，无需回源
+            return self._task_store is not None or age <= self._terminal_ttl
+        # 后台在轮询时可以容忍到下一次轮询的间隔，否则按最短间隔回源
+        limit = self._max_staleness if entry.polling else self._min_interval
+        return age <= limit
+
+    async def _refresh(self, entry: _TrackedTask) -> VideoStatusSnapshot:
+        self._upstream_polls += 1
+        try:
+            result = await entry.provider.status(entry.task_id, entry.user_api_key)
+        except UpstreamServiceError:
+            self._upstream_errors += 1
+            raise
+        parsed = self._apply_mirror(entry, parse_status_result(result))
+        snapshot = VideoStatusSnapshot(entry.task_id, entry.provider_name, **parsed)
+        previous = entry.snapshot
+        if snapshot.same_state(previous):
+            # 状态未变化时沿用旧版本号，只刷新时间
+            snapshot = VideoStatusSnapshot(
+                entry.task_id,
+                entry.provider_name,
+                version=previous.version,
+                **parsed,
+            )
+        self._commit(entry, snapshot, previous)
+        return snapshot
+
+    def _commit(
+        self,
+        entry: _TrackedTask,
+        snapshot: VideoStatusSnapshot,
+        previous: Optional[VideoStatusSnapshot],
+    ) -> None:
+        entry.snapshot = snapshot
+        if snapshot.version == getattr(previous, "version", None):
+            return
+        self._publish(entry.key, snapshot)
+        if self._task_store is not None:
+            self._task_store.record_status(
+                entry.task_id,
+                snapshot.status,
+                snapshot.progress,
+                snapshot.video_url,
+                snapshot.error_message,
+            )
+
+    def _apply_mirror(self, entry: _TrackedTask, parsed: dict[str, Any]) -> dict[str, Any]:
+        """成功的视频结果交给后台转存；已转存的直接换成 COS 地址。"""
+        if self._mirror is None or parsed["status"] != "succeeded" or not parsed["video_url"]:
+            return parsed
+        job = self._mirror.submit(parsed["video_url"], "video")
+        if job.status == MIRROR_DONE:
+            return {**parsed, "video_url": job.ref, "mirror_status": MIRROR_DONE}
+        if job.status == MIRROR_PENDING and (
+            entry.mirror_task is None or entry.mirror_task.done()
+        ):
+            entry.mirror_task = asyncio.create_task(self._await_mirror(entry, job))
+        return {**parsed, "mirror_status": job.status}
+
+    async def _await_mirror(self, entry: _TrackedTask, job: MirrorJob) -> None:
+        await job.done.wait()
+        previous = entry.snapshot
+        if previous is None or previous.mirror_status != MIRROR_PENDING:
+            return
+        snapshot = replace(
+            previous,
+            video_url=job.ref if job.status == MIRROR_DONE else previous.video_url,
+            mirror_status=job.status,
+            fetched_at=time.monotonic(),
+            version=next(_versions),
+        )
+        self._commit(entry, snapshot, previous)
+
+    def _publish(self, key: str, snapshot: VideoStatusSnapshot) -> None:
+        for subscription in self._subscribers.get(key, ()):
+            subscription.push(key, snapshot)
+
+    def subscribe(self, entries: list[_TrackedTask], max_buffer: int) -> StatusSubscription:
+        subscription = StatusSubscription({entry.key for entry in entries}, max_buffer)
+        for entry in entries:
+            self._subscribers.setdefault(entry.key, set()).add(subscription)
+            # 有长连接订阅时即使关闭了后台轮询也要推进状态
+            self._ensure_polling(entry, force=True)
+        return subscription
+
+    def unsubscribe(self, subscription: StatusSubscription) -> None:
+        for key in subscription.keys:
+            subscribers = self._subscribers.get(key)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[key]
+
+    async def watch(
+        self,
+        entries: list[_TrackedTask],
+        last_event_id: Optional[int] = None,
+        heartbeat_seconds: float = 15.0,
+        max_buffer: int = 32,
+    ) -> AsyncGenerator[Optional[VideoStatusSnapshot], None]:
+        """按版本号顺序产出状态变化，空闲时产出 None 作为心跳，全部任务结束后退出。
+
+        last_event_id 用于断线续传：版本号不大于它的快照视为客户端已收到；
+        已结束的任务总会重放最终状态，保证每条连接都能收到终态后再关闭。
+        """
+        subscription = self.subscribe(entries, max_buffer)
+        finished: set[str] = set()
+        try:
+            current = sorted(
+                (entry.snapshot for entry in entries if entry.snapshot is not None),
+                key=lambda item: item.version,
+            )
+            for snapshot in current:
+                if last_event_id is None or snapshot.version > last_event_id or snapshot.settled:
+                    yield snapshot
+                if snapshot.settled:
+                    finished.add(snapshot.task_id)
+            while len(finished) < len(entries):
+                snapshots = await subscription.drain(heartbeat_seconds)
+                if not snapshots:
+                    yield None
+                    continue
+                for snapshot in sorted(snapshots, key=lambda item: item.version):
+                    yield snapshot
+                    if snapshot.settled:
+                        finished.add(snapshot.task_id)
+        finally:
+            self.unsubscribe(subscription)
+
+    def _ensure_polling(self, entry: _TrackedTask, force: bool = False) -> None:
+        if not (self._enabled or force) or entry.polling:
+            return
+        if self._tasks.get(entry.key) is not entry:
+            # 已被淘汰的条目不再轮询，否则循环脱离 _tasks，close() 无法取消
+            return
+        if entry.snapshot is not None and entry.snapshot.terminal:
+            return
+        entry.loop_task = asyncio.create_task(self._poll_loop(entry))
+
+    async def _poll_loop(self, entry: _TrackedTask) -> None:
+        entry.interval = self._min_interval
+        while True:
+            await asyncio.sleep(entry.interval)
+            if entry.snapshot is not None and entry.snapshot.terminal:
+                break
+            watched = entry.key in self._subscribers
+            if not watched and time.monotonic() - entry.last_access > self._idle_timeout:
+                break
+            try:
+                snapshot = await self._refresh(entry)
+            except UpstreamServiceError as exc:
+                logger.warning(
+                    "video poll failed task_id=%s code=%s step=video_poller",
+                    mask_task_id(entry.task_id),
+                    exc.code,
+                )
+                entry.interval = min(self._max_interval, entry.interval * self._backoff)
+                continue
+            except Exception:
+                logger.exception(
+                    "video poll crashed task_id=%s step=video_poller",
+                    mask_task_id(entry.task_id),
+                )
+                break
+            if snapshot.terminal:
+                break
+            entry.interval = min(self._max_interval, entry.interval * self._backoff)
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """超出上限时从最久未访问的开始淘汰；有订阅者的与刚加入的 keep 不淘汰。"""
+        overflow = len(self._tasks) - self._max_tasks
+        if overflow <= 0:
+            return
+        for key in list(self._tasks):
+            if overflow <= 0:
+                break
+            if key == keep or key in self._subscribers:
+                continue
+            entry = self._tasks.pop(key)
+            if entry.polling:
+                entry.loop_task.cancel()
+            overflow -= 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "tracked_tasks": len(self._tasks),
+            "polling_tasks": sum(1 for entry in self._tasks.values() if entry.polling),
+            "upstream_polls": self._upstream_polls,
+            "upstream_errors": self._upstream_errors,
+            "served_from_store": self._served_from_store,
+            "subscribed_tasks": len(self._subscribers),
+            "task_store_enabled": int(self._task_store is not None),
+            "mirror_enabled": int(self._mirror is not None),
+        }
+
+    async def close(self) -> None:
+        loops = [entry.loop_task for entry in self._tasks.values() if entry.polling]
+        loops += [
+            entry.mirror_task
+            for entry in self._tasks.values()
+            if entry.mirror_task is not None and not entry.mirror_task.done()
+        ]
+        self._tasks.clear()
+        self._subscribers.clear()
+        for task in loops:
+            task.cancel()
+        if loops:
+            await asyncio.gather(*loops, return_exceptions=True)
+
+
+_poller: Optional[VideoStatusPoller] = None
+
+
+def get_video_poller(settings: Optional[Settings] = None) -> VideoStatusPoller:
+    global _poller
+    if _poller is None:
+        _poller = VideoStatusPoller(settings or get_settings())
+    return _poller
+
+
+async def close_video_poller() -> None:
+    global _poller
+    poller, _poller = _poller, None
+    if poller is not None:
+        await poller.close()
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from functools import lru_cache
 import re
 from typing import Any, Optional
 
 import httpx
 
 from app.core.config import Settings, get_settings
+from app.core.json_codec import loads
+from app.core.metrics import errors_total
+from app.services.singleflight import build_flight_key, get_singleflight
+from app.services.upstream import get_upstream_pool
 
 
 TASK_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9:_-]{7,127}$")
@@ -24,6 +27,10 @@ class UpstreamServiceError(Exception):
     code: str
     message: str
     status_code: int
+    retry_after: Optional[int] = None
+
+    def __post_init__(self) -> None:
+        errors_total.inc("video", self.code)
 
 
 def is_valid_task_id(task_id: str) -> bool:
@@ -59,6 +66,37 @@ def extract_video_url(data: Any) -> Optional[str]:
     return None
 
 
+def parse_progress(value: Any) -> Optional[int]:
+    """上游 progress 可能是 40、"40" 或 "40%"，统一成 0-100 的整数。"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip().rstrip("%")
+    try:
+        progress = int(float(value))
+    except (TypeError, ValueError):
+        return None
+    return max(0, min(progress, 100))
+
+
+def parse_status_result(result: Any) -> dict[str, Any]:
+    """把上游状态查询结果归一化为 status/video_url/error_message/progress。"""
+    status = normalize_status(result.get("status") if isinstance(result, dict) else None)
+    fail_reason = None
+    if isinstance(result, dict):
+        fail_reason = sanitize_error_message(result.get("fail_reason"))
+    if status != "failed":
+        fail_reason = None
+    video_url = extract_video_url(result.get("data") if isinstance(result, dict) else None)
+    progress = parse_progress(result.get("progress")) if isinstance(result, dict) else None
+    return {
+        "status": status,
+        "video_url": video_url,
+        "error_message": fail_reason,
+        "progress": progress,
+    }
+
+
 def _map_status_code(status_code: int) -> tuple[str, int]:
     if status_code == 401:
         return "UNAUTHORIZED", 401
@@ -74,10 +112,17 @@ def _map_status_code(status_code: int) -> tuple[str, int]:
 
 
 class T8StarVideoProvider:
-    def __init__(self, base_url: str, api_key: str, timeout_seconds: float = 180.0):
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        timeout_seconds: float = 180.0,
+        coalesce_status: bool = True,
+    ):
         self.base_url = base_url.rstrip("/")
         self.api_key = api_key
         self.timeout_seconds = timeout_seconds
+        self.coalesce_status = coalesce_status
 
     def _headers(self, user_api_key: Optional[str]) -> dict:
         key = (user_api_key or "").strip() or self.api_key
@@ -98,12 +143,23 @@ class T8StarVideoProvider:
 
     async def status(self, task_id: str, user_api_key: Optional[str]) -> dict:
         url = f"{self.base_url}/v2/videos/generations/{task_id}"
-        return await _request_json(
-            "GET",
-            url,
-            headers=self._headers(user_api_key),
-            timeout_seconds=self.timeout_seconds,
+        headers = self._headers(user_api_key)
+
+        async def _call() -> dict:
+            return await _request_json(
+                "GET",
+                url,
+                headers=headers,
+                timeout_seconds=self.timeout_seconds,
+            )
+
+        if not self.coalesce_status:
+            return await _call()
+        # 状态查询与用户无关，只按 API Key + task_id 合并
+        key = build_flight_key(
+            "video.status", headers.get("Authorization", ""), None, task_id
         )
+        return await get_singleflight("video.status").do(key, _call)
 
 
 class VideoProviderRegistry:
@@ -122,10 +178,11 @@ async def _request_json(
     timeout_seconds: float = 180.0,
 ) -> dict:
     try:
-        async with httpx.AsyncClient(timeout=timeout_seconds) as client:
-            response = await client.request(method, url, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()
+        response = await get_upstream_pool().request(
+            method, url, timeout_seconds=timeout_seconds, headers=headers, json=payload
+        )
+        response.raise_for_status()
+        return loads(response.content)
     except httpx.TimeoutException as exc:
         raise UpstreamServiceError(
             code="TIMEOUT",
@@ -147,14 +204,22 @@ async def _request_json(
         ) from exc
 
 
-@lru_cache
+_registry: Optional[VideoProviderRegistry] = None
+
+
 def get_video_provider_registry(settings: Optional[Settings] = None) -> VideoProviderRegistry:
+    # Settings 不可哈希，不能直接套 lru_cache，这里按进程缓存一次
+    global _registry
+    if _registry is not None:
+        return _registry
     settings = settings or get_settings()
     providers = {
         "t8star": T8StarVideoProvider(
             base_url=settings.ai_gateway_base_url,
             api_key=settings.ai_gateway_api_key,
             timeout_seconds=settings.video_timeout_sec,
+            coalesce_status=settings.singleflight_enabled,
         )
     }
-    return VideoProviderRegistry(providers)
+    _registry = VideoProviderRegistry(providers)
+    return _registry
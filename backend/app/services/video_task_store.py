@@ -0,0 +1,467 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from contextlib import closing
+from dataclasses import dataclass
+import logging
+import sqlite3
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional, Protocol
+
+from app.core.config import Settings, get_settings
+
+try:
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:  # pragma: no cover - 未安装时只能使用 SQLite 替身
+    AsyncConnectionPool = None
+
+logger = logging.getLogger("gridworkflow")
+
+TERMINAL_STATUSES = {"succeeded", "failed"}
+# 整批写入失败后逐行重写时，开头连续失败这么多行就不再逐行尝试
+_OUTAGE_PROBE_ROWS = 3
+
+# 表结构以 backend/sql/SCHEMA_WORKFLOW_PERSISTENCE.sql 为准，这里只覆盖用到的列
+_INSERT_SQL = (
+    "INSERT INTO video_tasks (id, user_id, task_id, status, progress, result_url, error_message) "
+    "SELECT {p}, {p}, {p}, {p}, {p}, {p}, {p} "
+    "WHERE NOT EXISTS (SELECT 1 FROM video_tasks WHERE task_id = {p})"
+)
+_UPDATE_SQL = (
+    "UPDATE video_tasks SET status = {p}, progress = COALESCE({p}, progress), "
+    "result_url = {p}, error_message = {p}{touch} WHERE task_id = {p}"
+)
+_SELECT_SQL = (
+    "SELECT task_id, user_id, status, progress, result_url, error_message "
+    "FROM video_tasks WHERE task_id = {p} ORDER BY created_at DESC LIMIT 1"
+)
+
+
+@dataclass
+class VideoTaskRecord:
+    task_id: str
+    user_id: Optional[str]
+    status: str = "queued"
+    progress: Optional[int] = None
+    result_url: Optional[str] = None
+    error_message: Optional[str] = None
+
+    @property
+    def terminal(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def state(self) -> tuple[Any, ...]:
+        return (self.status, self.progress, self.result_url, self.error_message)
+
+
+def _clamp_progress(progress: Optional[int]) -> Optional[int]:
+    if progress is None:
+        return None
+    return max(0, min(100, int(progress)))
+
+
+def _insert_row(record: VideoTaskRecord) -> tuple[Any, ...]:
+    return (
+        str(uuid.uuid4()),
+        record.user_id,
+        record.task_id,
+        record.status,
+        _clamp_progress(record.progress) or 0,
+        record.result_url,
+        record.error_message,
+        record.task_id,
+    )
+
+
+def _update_row(record: VideoTaskRecord) -> tuple[Any, ...]:
+    return (
+        record.status,
+        _clamp_progress(record.progress),
+        record.result_url,
+        record.error_message,
+        record.task_id,
+    )
+
+
+class VideoTaskRepository(Protocol):
+    async def insert_many(self, records: list[VideoTaskRecord]) -> None:
+        ...
+
+    async def update_many(self, records: list[VideoTaskRecord]) -> None:
+        ...
+
+    async def get(self, task_id: str) -> Optional[VideoTaskRecord]:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+
+class SQLiteVideoTaskRepository:
+    """本地开发用的替身，列与线上 video_tasks 保持一致（UUID 以文本存储）。"""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path, timeout=5)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS video_tasks ("
+                "id TEXT PRIMARY KEY, session_id TEXT, user_id TEXT NOT NULL, "
+                "task_id TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'queued', "
+                "progress INTEGER DEFAULT 0, result_url TEXT, error_message TEXT, "
+                "created_at TEXT DEFAULT CURRENT_TIMESTAMP, "
+                "updated_at TEXT DEFAULT CURRENT_TIMESTAMP)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_video_tasks_task_id ON video_tasks(task_id)"
+            )
+            self._initialized = True
+        return conn
+
+    def _insert_many_sync(self, records: list[VideoTaskRecord]) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(_INSERT_SQL.format(p="?"), [_insert_row(item) for item in records])
+
+    def _update_many_sync(self, records: list[VideoTaskRecord]) -> None:
+        sql = _UPDATE_SQL.format(p="?", touch=", updated_at = CURRENT_TIMESTAMP")
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(sql, [_update_row(item) for item in records])
+
+    def _get_sync(self, task_id: str) -> Optional[VideoTaskRecord]:
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(_SELECT_SQL.format(p="?"), (task_id,)).fetchone()
+        return VideoTaskRecord(*row) if row else None
+
+    async def insert_many(self, records: list[VideoTaskRecord]) -> None:
+        await asyncio.to_thread(self._insert_many_sync, records)
+
+    async def update_many(self, records: list[VideoTaskRecord]) -> None:
+        await asyncio.to_thread(self._update_many_sync, records)
+
+    async def get(self, task_id: str) -> Optional[VideoTaskRecord]:
+        return await asyncio.to_thread(self._get_sync, task_id)
+
+    async def close(self) -> None:
+        return None
+
+
+class PostgresVideoTaskRepository:
+    """直连 Supabase Postgres（服务端连接串，不经过 RLS），依赖 psycopg_pool。"""
+
+    def __init__(self, dsn: str, max_connections: int = 5) -> None:
+        if AsyncConnectionPool is None:
+            raise RuntimeError("psycopg_pool 未安装，无法使用 postgres 任务存储。")
+        self._pool = AsyncConnectionPool(dsn, min_size=1, max_size=max_connections, open=False)
+        self._opened = False
+
+    async def _ensure_open(self) -> None:
+        if not self._opened:
+            await self._pool.open()
+            self._opened = True
+
+    async def insert_many(self, records: list[VideoTaskRecord]) -> None:
+        await self._ensure_open()
+        async with self._pool.connection() as conn, conn.cursor() as cur:
+            await cur.executemany(
+                _INSERT_SQL.format(p="%s"), [_insert_row(item) for item in records]
+            )
+
+    async def update_many(self, records: list[VideoTaskRecord]) -> None:
+        # updated_at 由表上的触发器维护
+        await self._ensure_open()
+        async with self._pool.connection() as conn, conn.cursor() as cur:
+            await cur.executemany(
+                _UPDATE_SQL.format(p="%s", touch=""), [_update_row(item) for item in records]
+            )
+
+    async def get(self, task_id: str) -> Optional[VideoTaskRecord]:
+        await self._ensure_open()
+        async with self._pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute(_SELECT_SQL.format(p="%s"), (task_id,))
+            row = await cur.fetchone()
+        if not row:
+            return None
+        task_id, user_id, *rest = row
+        return VideoTaskRecord(task_id, str(user_id) if user_id else None, *rest)
+
+    async def close(self) -> None:
+        if self._opened:
+            await self._pool.close()
+
+
+class VideoTaskStore:
+    """在仓储之上合并写入：状态/进度未变化不写，变化先进入待写队列，按间隔或批量大小批量落库。"""
+
+    def __init__(
+        self,
+        repository: VideoTaskRepository,
+        flush_interval: float = 1.0,
+        batch_size: int = 100,
+        max_known: int = 10000,
+        max_retries: int = 5,
+        max_retry_delay: float = 30.0,
+    ) -> None:
+        self._repository = repository
+        self._flush_interval = max(0.05, flush_interval)
+        self._batch_size = max(1, batch_size)
+        self._max_known = max(1, max_known)
+        self._max_retries = max(0, max_retries)
+        self._max_retry_delay = max(self._flush_interval, max_retry_delay)
+        self._pending_inserts: dict[str, VideoTaskRecord] = {}
+        self._pending_updates: dict[str, VideoTaskRecord] = {}
+        # 最近一次已入队的状态，用于跳过重复写入
+        self._known: OrderedDict[str, tuple[Any, ...]] = OrderedDict()
+        # 写入失败的任务已重试次数，以及连续失败的批次数（决定退避时长）
+        self._attempts: dict[str, int] = {}
+        self._consecutive_failures = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._rows_written = 0
+        self._writes_skipped = 0
+        self._flushes = 0
+        self._flush_errors = 0
+        self._rows_dropped = 0
+        self._reads = 0
+
+    def record_created(self, task_id: str, user_id: Optional[str]) -> None:
+        # video_tasks.user_id 非空；IP 白名单调用方没有 user_id，不落库，状态只保留在内存
+        if not user_id:
+            return
+        record = VideoTaskRecord(task_id, user_id)
+        self._pending_inserts[task_id] = record
+        self._remember(task_id, record.state())
+        self._schedule()
+
+    def record_status(
+        self,
+        task_id: str,
+        status: str,
+        progress: Optional[int] = None,
+        result_url: Optional[str] = None,
+        error_message: Optional[str] = None,
+    ) -> None:
+        record = VideoTaskRecord(task_id, None, status, progress, result_url, error_message)
+        if self._known.get(task_id) == record.state():
+            self._writes_skipped += 1
+            return
+        self._remember(task_id, record.state())
+        pending = self._pending_inserts.get(task_id)
+        if pending is not None:
+            # 创建尚未落库，直接合并进插入
+            record.user_id = pending.user_id
+            self._pending_inserts[task_id] = record
+        else:
+            self._pending_updates[task_id] = record
+        self._schedule()
+
+    async def get(self, task_id: str) -> Optional[VideoTaskRecord]:
+        pending = self._pending_updates.get(task_id) or self._pending_inserts.get(task_id)
+        if pending is not None and pending.user_id is not None:
+            return pending
+        self._reads += 1
+        record = await self._repository.get(task_id)
+        if record is not None and pending is not None:
+            record = VideoTaskRecord(
+                task_id,
+                record.user_id,
+                pending.status,
+                pending.progress,
+                pending.result_url,
+                pending.error_message,
+            )
+        return record
+
+    def _remember(self, task_id: str, state: tuple[Any, ...]) -> None:
+        self._known[task_id] = state
+        self._known.move_to_end(task_id)
+        while len(self._known) > self._max_known:
+            self._known.popitem(last=False)
+
+    def _schedule(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if len(self._pending_inserts) + len(self._pending_updates) >= self._batch_size:
+            self._wakeup.set()
+
+    async def _flush_loop(self) -> None:
+        while self._pending_inserts or self._pending_updates:
+            if self._consecutive_failures:
+                # 写入失败后按指数退避重试，期间不因批量大小提前唤醒
+                await asyncio.sleep(
+                    min(
+                        self._flush_interval * 2 ** self._consecutive_failures,
+                        self._max_retry_delay,
+                    )
+                )
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            inserts = list(self._pending_inserts.values())
+            updates = list(self._pending_updates.values())
+            self._pending_inserts.clear()
+            self._pending_updates.clear()
+            if not (inserts or updates):
+                return
+            start_time = time.perf_counter()
+            failed_inserts = await self._write(self._repository.insert_many, inserts)
+            failed_updates = await self._write(self._repository.update_many, updates)
+            failed = {id(record) for record in failed_inserts + failed_updates}
+            written = [record for record in inserts + updates if id(record) not in failed]
+            self._forget_attempts(written)
+            if failed:
+                self._flush_errors += 1
+                self._consecutive_failures += 1
+                self._requeue_inserts(failed_inserts)
+                self._requeue_updates(failed_updates)
+            else:
+                self._consecutive_failures = 0
+            if not written:
+                return
+            self._flushes += 1
+            self._rows_written += len(written)
+            logger.info(
+                "video task flush rows=%d step=video_task_store latency_ms=%.2f",
+                len(written),
+                (time.perf_counter() - start_time) * 1000,
+            )
+
+    async def _write(
+        self,
+        write: Callable[[list[VideoTaskRecord]], Awaitable[None]],
+        records: list[VideoTaskRecord],
+    ) -> list[VideoTaskRecord]:
+        """整批写入，失败时逐行重写，返回仍失败的行；一行坏数据不会拖着整批耗尽重试次数。"""
+        if not records:
+            return []
+        try:
+            await write(records)
+            return []
+        except Exception:
+            logger.exception(
+                "video task flush failed rows=%d step=video_task_store", len(records)
+            )
+            if len(records) == 1:
+                return records
+        failed: list[VideoTaskRecord] = []
+        for index, record in enumerate(records):
+            try:
+                await write([record])
+            except Exception:
+                failed.append(record)
+                if len(failed) == index + 1 == _OUTAGE_PROBE_ROWS:
+                    # 开头几行全部失败更像是数据库不可用，整批留给退避后重试
+                    return records
+        if failed:
+            logger.warning(
+                "video task rows failed rows=%d step=video_task_store", len(failed)
+            )
+        return failed
+
+    def _retry_allowed(self, record: VideoTaskRecord) -> bool:
+        attempts = self._attempts.get(record.task_id, 0) + 1
+        if attempts > self._max_retries:
+            # 超过重试上限才放弃，清掉去重记录，之后的状态变化仍会尝试写入
+            self._attempts.pop(record.task_id, None)
+            self._known.pop(record.task_id, None)
+            self._rows_dropped += 1
+            return False
+        self._attempts[record.task_id] = attempts
+        return True
+
+    def _requeue_inserts(self, records: list[VideoTaskRecord]) -> None:
+        """失败的插入放回待写队列；期间到达的新状态优先，但保留插入所需的 user_id。"""
+        for record in records:
+            if not self._retry_allowed(record):
+                continue
+            newer = self._pending_updates.pop(record.task_id, None)
+            if newer is not None:
+                newer.user_id = record.user_id
+                record = newer
+            self._pending_inserts.setdefault(record.task_id, record)
+
+    def _requeue_updates(self, records: list[VideoTaskRecord]) -> None:
+        for record in records:
+            if not self._retry_allowed(record):
+                continue
+            if record.task_id not in self._pending_inserts:
+                self._pending_updates.setdefault(record.task_id, record)
+
+    def _forget_attempts(self, records: list[VideoTaskRecord]) -> None:
+        for record in records:
+            self._attempts.pop(record.task_id, None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": len(self._pending_inserts) + len(self._pending_updates),
+            "rows_written": self._rows_written,
+            "writes_skipped": self._writes_skipped,
+            "flushes": self._flushes,
+            "flush_errors": self._flush_errors,
+            "rows_dropped": self._rows_dropped,
+            "reads": self._reads,
+        }
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+        await self._repository.close()
+
+
+def _build_repository(settings: Settings) -> Optional[VideoTaskRepository]:
+    backend = settings.video_task_store.strip().lower()
+    if not backend:
+        return None
+    if backend == "sqlite":
+        return SQLiteVideoTaskRepository(settings.video_task_sqlite_path)
+    if backend == "postgres":
+        if not settings.database_url:
+            logger.warning("DATABASE_URL missing, video task store disabled")
+            return None
+        return PostgresVideoTaskRepository(settings.database_url)
+    logger.warning("unknown video task store backend=%s, store disabled", backend)
+    return None
+
+
+_store: Optional[VideoTaskStore] = None
+_store_ready = False
+
+
+def get_video_task_store(settings: Optional[Settings] = None) -> Optional[VideoTaskStore]:
+    """未配置 VIDEO_TASK_STORE 时返回 None，任务状态只保留在内存。"""
+    global _store, _store_ready
+    if not _store_ready:
+        settings = settings or get_settings()
+        repository = _build_repository(settings)
+        if repository is not None:
+            _store = VideoTaskStore(
+                repository,
+                flush_interval=settings.video_task_flush_interval_ms / 1000,
+                batch_size=settings.video_task_flush_batch_size,
+            )
+        _store_ready = True
+    return _store
+
+
+async def close_video_task_store() -> None:
+    global _store, _store_ready
+    store, _store = _store, None
+    _store_ready = False
+    if store is not None:
+        await store.close()
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import BinaryIO, Optional, Protocol
+
+from app.core.config import Settings, get_settings
+from app.storage.cos_client import (
+    UploadResult,
+    close_cos_client,
+    cos_client_stats,
+    get_cos_client,
+)
+from app.storage.local import LocalStorageBackend, MemoryStorageBackend
+
+logger = logging.getLogger("gridworkflow")
+
+
+class StorageBackend(Protocol):
+    """媒体对象存储接口。方法均为阻塞调用，需在存储线程池中执行（build_access_url 除外）。
+
+    失败统一抛出 COSUploadError，以沿用对外冻结的 COS_UPLOAD_FAILED 错误码。
+    """
+
+    name: str
+    supports_presigned_upload: bool
+
+    def upload_fileobj(self, fileobj: BinaryIO, key: str, content_type: str) -> None:
+        ...
+
+    def put_object(self, key: str, body: bytes, content_type: str) -> None:
+        ...
+
+    def create_multipart_upload(self, key: str, content_type: str) -> str:
+        ...
+
+    def upload_part(
+        self, key: str, upload_id: str, part_number: int, body: bytes, content_md5: str
+    ) -> str:
+        ...
+
+    def complete_multipart_upload(
+        self, key: str, upload_id: str, parts: list[tuple[int, str]]
+    ) -> None:
+        ...
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        ...
+
+    def presign_put_url(
+        self, key: str, content_type: str, content_length: int, expires_in: int
+    ) -> str:
+        ...
+
+    def head_object_size(self, key: str) -> Optional[int]:
+        ...
+
+    def read_range(self, key: str, start: int, end: int) -> bytes:
+        ...
+
+    def delete_object(self, key: str) -> None:
+        ...
+
+    def build_access_url(self, key: str) -> UploadResult:
+        ...
+
+    def stats(self) -> dict:
+        ...
+
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+LOCAL_BACKENDS = {"local", "memory"}
+
+
+def resolve_storage_backend_name(settings: Settings) -> str:
+    """规范化 STORAGE_BACKEND；local/memory 之外的取值（含拼写错误）一律按 cos 处理。"""
+    name = settings.storage_backend.strip().lower()
+    return name if name in LOCAL_BACKENDS else "cos"
+
+
+def get_storage_backend(settings: Optional[Settings] = None) -> StorageBackend:
+    """按 STORAGE_BACKEND 选择实现；cos 未配置时抛出 COSConfigError。"""
+    global _backend
+    settings = settings or get_settings()
+    name = resolve_storage_backend_name(settings)
+    if name == "cos":
+        if settings.storage_backend.strip().lower() != "cos":
+            logger.warning("unknown storage backend=%s, using cos", settings.storage_backend)
+        return get_cos_client(settings)
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if name == "local":
+                    _backend = LocalStorageBackend(
+                        settings.storage_local_root, settings.storage_public_base_url
+                    )
+                else:
+                    _backend = MemoryStorageBackend(settings.storage_public_base_url)
+    return _backend
+
+
+def storage_backend_stats() -> Optional[dict]:
+    if _backend is not None:
+        return _backend.stats()
+    return cos_client_stats()
+
+
+async def close_storage_backend() -> None:
+    global _backend
+    _backend = None
+    await close_cos_client()
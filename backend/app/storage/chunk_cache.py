@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator, BinaryIO, Callable, Optional
+
+from app.core.config import Settings, get_settings
+from app.services.singleflight import SingleFlight
+
+
+ChunkSource = Callable[[int, int], AsyncIterator[bytes]]
+
+
+class ChunkCache:
+    """按固定大小分块缓存对象内容的磁盘 LRU，总大小不超过 max_bytes。
+
+    每块是独立文件，命中时可直接 sendfile；同一块的并发回源会合并为一次。
+    进程重启后按文件修改时间重建索引，已缓存的块继续可用。
+    """
+
+    def __init__(self, root: str, chunk_size: int, max_bytes: int, max_sizes: int = 4096) -> None:
+        self.chunk_size = max(64 * 1024, chunk_size)
+        self._root = root
+        self._max_bytes = max(self.chunk_size, max_bytes)
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        self._sizes: OrderedDict[str, int] = OrderedDict()
+        self._max_sizes = max(1, max_sizes)
+        self._flight = SingleFlight("chunk_cache")
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        found: list[tuple[float, str, int]] = []
+        for dirpath, _, filenames in os.walk(self._root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if filename.startswith(".tmp-"):
+                    os.unlink(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, os.path.relpath(path, self._root), stat.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def _name(key: str, index: int) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return f"{digest[:2]}/{digest}.{index}"
+
+    def chunk_range(self, index: int, size: int) -> tuple[int, int]:
+        start = index * self.chunk_size
+        return start, min(size, start + self.chunk_size) - 1
+
+    def remember_size(self, key: str, size: int) -> None:
+        self._sizes[key] = size
+        self._sizes.move_to_end(key)
+        while len(self._sizes) > self._max_sizes:
+            self._sizes.popitem(last=False)
+
+    def known_size(self, key: str) -> Optional[int]:
+        return self._sizes.get(key)
+
+    async def open_chunk(
+        self, key: str, index: int, size: int, source: ChunkSource
+    ) -> BinaryIO:
+        """打开该块的缓存文件，未缓存时从 source(start, end) 流式回源写入。
+
+        返回已打开的文件，之后即使该块被淘汰也能读完。
+        """
+        name = self._name(key, index)
+        path = os.path.join(self._root, name)
+        if name in self._entries:
+            self._entries.move_to_end(name)
+            try:
+                handle = open(path, "rb")
+            except FileNotFoundError:
+                self._forget(name)
+            else:
+                self._hits += 1
+                return handle
+        self._misses += 1
+        start, end = self.chunk_range(index, size)
+        for _ in range(2):
+            await self._flight.do(name, lambda: self._fill(name, start, end, source))
+            try:
+                return open(path, "rb")
+            except FileNotFoundError:
+                # 刚写入就被并发的回源挤出，重新回源一次
+                self._forget(name)
+        raise OSError("chunk evicted before it could be served")
+
+    def _forget(self, name: str) -> None:
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    async def _fill(self, name: str, start: int, end: int, source: ChunkSource) -> None:
+        if name in self._entries:
+            return
+        path = os.path.join(self._root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        written = 0
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                async for data in source(start, end):
+                    await asyncio.to_thread(handle.write, data)
+                    written += len(data)
+            if written != end - start + 1:
+                raise OSError("short chunk read")
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._entries[name] = written
+        self._total_bytes += written
+        self._evict(keep=name)
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        while self._total_bytes > self._max_bytes and self._entries:
+            name, size = next(iter(self._entries.items()))
+            if name == keep:
+                break
+            del self._entries[name]
+            self._total_bytes -= size
+            self._evictions += 1
+            try:
+                # 已打开该文件的响应不受影响，unlink 只移除目录项
+                os.unlink(os.path.join(self._root, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "chunks": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self._max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "filling": self._flight.stats()["in_flight"],
+        }
+
+
+_cache: Optional[ChunkCache] = None
+
+
+def get_chunk_cache(settings: Optional[Settings] = None) -> ChunkCache:
+    global _cache
+    if _cache is None:
+        settings = settings or get_settings()
+        _cache = ChunkCache(
+            settings.media_proxy_cache_dir,
+            settings.media_proxy_chunk_bytes,
+            settings.media_proxy_cache_max_bytes,
+        )
+    return _cache
+
+
+def chunk_cache_stats() -> Optional[dict[str, int]]:
+    return _cache.stats() if _cache is not None else None
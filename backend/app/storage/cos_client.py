@@ -1,23 +1,31 @@
 from __future__ import annotations
 
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime, timezone
+import logging
 import os
 import re
+import threading
+import time
 from typing import Optional
 from uuid import uuid4
 
-from app.core.config import Settings
+from app.core.config import Settings, get_settings
 
 try:
     from qcloud_cos import CosConfig, CosS3Client
+    from qcloud_cos.cos_exception import CosServiceError
 except ImportError as exc:  # pragma: no cover - runtime dependency
     CosConfig = None
     CosS3Client = None
+    CosServiceError = Exception
     _COS_IMPORT_ERROR = exc
 else:
     _COS_IMPORT_ERROR = None
 
+logger = logging.getLogger("gridworkflow")
+
 
 class COSConfigError(RuntimeError):
     pass
@@ -157,6 +165,9 @@ def clamp_signed_ttl(seconds: int) -> int:
 
 
 class COSClient:
+    name = "cos"
+    supports_presigned_upload = True
+
     def __init__(self, settings: Settings) -> None:
         if _COS_IMPORT_ERROR is not None:
             raise COSConfigError("cos sdk is not installed") from _COS_IMPORT_ERROR
@@ -170,14 +181,36 @@ class COSClient:
         self._signed_url_ttl = clamp_signed_ttl(
             settings.cos_signed_url_ttl_seconds
         )
+        # 剩余有效期低于该值时提前重签，避免返回马上过期的地址
+        self._signed_url_refresh = min(
+            max(0, settings.cos_signed_url_refresh_seconds), self._signed_url_ttl // 2
+        )
+        self._signed_url_cache_entries = max(0, settings.cos_signed_url_cache_entries)
+        self._signed_urls: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._signed_urls_lock = threading.Lock()
+        self._signed_url_hits = 0
+        self._signed_url_misses = 0
 
         config = CosConfig(
             Region=settings.cos_region,
             SecretId=settings.cos_secret_id,
             SecretKey=settings.cos_secret_key,
+            KeepAlive=True,
+            # SDK 调用都在存储线程池里执行，连接池至少容纳全部工作线程
+            PoolConnections=max(10, settings.storage_max_workers),
+            PoolMaxSize=max(10, settings.storage_max_workers),
         )
         self._client = CosS3Client(config)
 
+    def close(self) -> None:
+        """关闭 SDK 内部 requests.Session 持有的 keep-alive 连接。"""
+        session = getattr(self._client, "_session", None)
+        if session is not None:
+            try:
+                session.close()
+            except Exception:
+                logger.warning("cos session close failed", exc_info=True)
+
     def upload_fileobj(self, fileobj, key: str, content_type: str) -> None:
         try:
             self._client.upload_file_from_buffer(
@@ -189,20 +222,182 @@ class COSClient:
         except Exception as exc:
             raise COSUploadError("cos upload failed") from exc
 
-    def build_access_url(self, key: str) -> UploadResult:
-        if self._signed_url:
-            url = self._client.get_presigned_url(
-                Method="GET",
+    def put_object(self, key: str, body: bytes, content_type: str) -> None:
+        try:
+            self._client.put_object(
                 Bucket=self._bucket,
+                Body=body,
                 Key=key,
-                Expired=self._signed_url_ttl,
+                ContentType=content_type,
             )
+        except Exception as exc:
+            raise COSUploadError("cos upload failed") from exc
+
+    def create_multipart_upload(self, key: str, content_type: str) -> str:
+        try:
+            response = self._client.create_multipart_upload(
+                Bucket=self._bucket,
+                Key=key,
+                ContentType=content_type,
+            )
+        except Exception as exc:
+            raise COSUploadError("cos multipart init failed") from exc
+        return response["UploadId"]
+
+    def upload_part(
+        self, key: str, upload_id: str, part_number: int, body: bytes, content_md5: str
+    ) -> str:
+        try:
+            response = self._client.upload_part(
+                Bucket=self._bucket,
+                Key=key,
+                Body=body,
+                PartNumber=part_number,
+                UploadId=upload_id,
+                ContentMD5=content_md5,
+            )
+        except Exception as exc:
+            raise COSUploadError("cos part upload failed") from exc
+        return response["ETag"]
+
+    def complete_multipart_upload(
+        self, key: str, upload_id: str, parts: list[tuple[int, str]]
+    ) -> None:
+        try:
+            self._client.complete_multipart_upload(
+                Bucket=self._bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={
+                    "Part": [
+                        {"PartNumber": number, "ETag": etag} for number, etag in parts
+                    ]
+                },
+            )
+        except Exception as exc:
+            raise COSUploadError("cos multipart complete failed") from exc
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        try:
+            self._client.abort_multipart_upload(
+                Bucket=self._bucket, Key=key, UploadId=upload_id
+            )
+        except Exception as exc:
+            raise COSUploadError("cos multipart abort failed") from exc
+
+    def presign_put_url(
+        self, key: str, content_type: str, content_length: int, expires_in: int
+    ) -> str:
+        # Content-Type/Content-Length 参与签名，客户端无法改用其他类型或大小
+        return self._client.get_presigned_url(
+            Method="PUT",
+            Bucket=self._bucket,
+            Key=key,
+            Expired=expires_in,
+            Headers={"Content-Type": content_type, "Content-Length": str(content_length)},
+        )
+
+    def head_object_size(self, key: str) -> Optional[int]:
+        try:
+            response = self._client.head_object(Bucket=self._bucket, Key=key)
+        except CosServiceError as exc:
+            if exc.get_status_code() == 404:
+                return None
+            raise COSUploadError("cos head object failed") from exc
+        except Exception as exc:
+            raise COSUploadError("cos head object failed") from exc
+        return int(response.get("Content-Length", 0))
+
+    def read_range(self, key: str, start: int, end: int) -> bytes:
+        try:
+            response = self._client.get_object(
+                Bucket=self._bucket, Key=key, Range=f"bytes={start}-{end}"
+            )
+            return response["Body"].get_raw_stream().read()
+        except Exception as exc:
+            raise COSUploadError("cos ranged read failed") from exc
+
+    def delete_object(self, key: str) -> None:
+        self.forget_signed_url(key)
+        try:
+            self._client.delete_object(Bucket=self._bucket, Key=key)
+        except Exception as exc:
+            raise COSUploadError("cos delete failed") from exc
+
+    def build_access_url(self, key: str) -> UploadResult:
+        if self._signed_url:
+            url, expires_in = self._signed_get_url(key)
             return UploadResult(
                 url=url,
                 key=key,
                 signed=True,
-                expires_in=self._signed_url_ttl,
+                expires_in=expires_in,
             )
 
         url = self._client.get_object_url(Bucket=self._bucket, Key=key)
         return UploadResult(url=url, key=key, signed=False, expires_in=None)
+
+    def _signed_get_url(self, key: str) -> tuple[str, int]:
+        """按对象 key 缓存签名地址，剩余有效期充足时直接复用，expires_in 为实际剩余秒数。"""
+        now = time.monotonic()
+        with self._signed_urls_lock:
+            cached = self._signed_urls.get(key)
+            if cached is not None and cached[1] - now > self._signed_url_refresh:
+                self._signed_urls.move_to_end(key)
+                self._signed_url_hits += 1
+                return cached[0], int(cached[1] - now)
+            self._signed_url_misses += 1
+        url = self._client.get_presigned_url(
+            Method="GET",
+            Bucket=self._bucket,
+            Key=key,
+            Expired=self._signed_url_ttl,
+        )
+        if self._signed_url_cache_entries:
+            with self._signed_urls_lock:
+                self._signed_urls[key] = (url, now + self._signed_url_ttl)
+                self._signed_urls.move_to_end(key)
+                while len(self._signed_urls) > self._signed_url_cache_entries:
+                    self._signed_urls.popitem(last=False)
+        return url, self._signed_url_ttl
+
+    def forget_signed_url(self, key: str) -> None:
+        with self._signed_urls_lock:
+            self._signed_urls.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._signed_urls_lock:
+            return {
+                "backend": self.name,
+                "signed_url_cache_entries": len(self._signed_urls),
+                "signed_url_hits": self._signed_url_hits,
+                "signed_url_misses": self._signed_url_misses,
+            }
+
+
+_client: Optional[COSClient] = None
+_client_lock = threading.Lock()
+
+
+def get_cos_client(settings: Optional[Settings] = None) -> COSClient:
+    """进程内共用一个 COS 客户端，复用 SDK 的 HTTP 连接池与签名地址缓存。
+
+    未配置时抛出 COSConfigError，且不缓存失败结果。
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = COSClient(settings or get_settings())
+    return _client
+
+
+def cos_client_stats() -> Optional[dict]:
+    return _client.stats() if _client is not None else None
+
+
+async def close_cos_client() -> None:
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        client.close()
@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from contextlib import closing
+from dataclasses import dataclass, replace
+import hashlib
+import logging
+import sqlite3
+from typing import Any, BinaryIO, Optional, Protocol
+
+from app.core.config import Settings, get_settings
+
+try:
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:  # pragma: no cover - 未安装时只能使用 SQLite 替身
+    AsyncConnectionPool = None
+
+logger = logging.getLogger("gridworkflow")
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# 表结构见 backend/sql/SCHEMA_MEDIA_OBJECTS.sql；SQLite 与 Postgres 共用语句
+_COLUMNS = "digest, media_type, object_key, content_type, size_bytes, ref_count"
+_REGISTER_SQL = (
+    f"INSERT INTO media_objects ({_COLUMNS}) VALUES ({{p}}, {{p}}, {{p}}, {{p}}, {{p}}, 1) "
+    "ON CONFLICT (digest) DO UPDATE SET ref_count = media_objects.ref_count + 1 "
+    f"RETURNING {_COLUMNS}"
+)
+_ACQUIRE_SQL = (
+    "UPDATE media_objects SET ref_count = ref_count + 1 WHERE digest = {p} "
+    f"RETURNING {_COLUMNS}"
+)
+_RELEASE_SQL = (
+    "UPDATE media_objects SET ref_count = ref_count - 1 "
+    "WHERE digest = {p} AND ref_count > 0 RETURNING ref_count"
+)
+
+
+@dataclass(frozen=True)
+class MediaObject:
+    digest: str
+    media_type: str
+    key: str
+    content_type: str
+    size: int
+    ref_count: int = 1
+
+
+def hash_fileobj(fileobj: BinaryIO) -> str:
+    """分块计算 sha256，结束后把读指针放回开头。阻塞调用，需在存储线程池中执行。"""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(HASH_CHUNK_BYTES)
+        if not chunk:
+            break
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+class MediaObjectRepository(Protocol):
+    async def register(self, item: MediaObject) -> MediaObject:
+        ...
+
+    async def acquire(self, digest: str) -> Optional[MediaObject]:
+        ...
+
+    async def release(self, digest: str) -> Optional[int]:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+
+class SQLiteMediaObjectRepository:
+    """本地开发用的替身，需要 SQLite 3.35+（RETURNING）。"""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path, timeout=5)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS media_objects ("
+                "digest TEXT PRIMARY KEY, media_type TEXT NOT NULL, "
+                "object_key TEXT NOT NULL, content_type TEXT NOT NULL, "
+                "size_bytes INTEGER NOT NULL, ref_count INTEGER NOT NULL DEFAULT 1, "
+                "created_at TEXT DEFAULT CURRENT_TIMESTAMP)"
+            )
+            self._initialized = True
+        return conn
+
+    def _fetch_sync(self, sql: str, params: tuple[Any, ...]) -> Optional[tuple]:
+        with closing(self._connect()) as conn, conn:
+            return conn.execute(sql.format(p="?"), params).fetchone()
+
+    async def register(self, item: MediaObject) -> MediaObject:
+        row = await asyncio.to_thread(
+            self._fetch_sync,
+            _REGISTER_SQL,
+            (item.digest, item.media_type, item.key, item.content_type, item.size),
+        )
+        return MediaObject(*row)
+
+    async def acquire(self, digest: str) -> Optional[MediaObject]:
+        row = await asyncio.to_thread(self._fetch_sync, _ACQUIRE_SQL, (digest,))
+        return MediaObject(*row) if row else None
+
+    async def release(self, digest: str) -> Optional[int]:
+        row = await asyncio.to_thread(self._fetch_sync, _RELEASE_SQL, (digest,))
+        return row[0] if row else None
+
+    async def close(self) -> None:
+        return None
+
+
+class PostgresMediaObjectRepository:
+    def __init__(self, dsn: str, max_connections: int = 3) -> None:
+        if AsyncConnectionPool is None:
+            raise RuntimeError("psycopg_pool 未安装，无法使用 postgres 摘要索引。")
+        self._pool = AsyncConnectionPool(dsn, min_size=1, max_size=max_connections, open=False)
+        self._opened = False
+
+    async def _fetch(self, sql: str, params: tuple[Any, ...]) -> Optional[tuple]:
+        if not self._opened:
+            await self._pool.open()
+            self._opened = True
+        async with self._pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute(sql.format(p="%s"), params)
+            return await cur.fetchone()
+
+    async def register(self, item: MediaObject) -> MediaObject:
+        row = await self._fetch(
+            _REGISTER_SQL,
+            (item.digest, item.media_type, item.key, item.content_type, item.size),
+        )
+        return MediaObject(*row)
+
+    async def acquire(self, digest: str) -> Optional[MediaObject]:
+        row = await self._fetch(_ACQUIRE_SQL, (digest,))
+        return MediaObject(*row) if row else None
+
+    async def release(self, digest: str) -> Optional[int]:
+        row = await self._fetch(_RELEASE_SQL, (digest,))
+        return row[0] if row else None
+
+    async def close(self) -> None:
+        if self._opened:
+            await self._pool.close()
+
+
+class MediaDigestIndex:
+    """内容摘要 -> 已存对象。内存 LRU 在前，持久化表在后（可选）。
+
+    每次复用或新登记都会把引用计数加一，release 减一；计数归零的对象才可以安全清理。
+    内存命中时引用计数在后台补记，避免热门素材每次都等一次数据库往返。
+    """
+
+    def __init__(
+        self, repository: Optional[MediaObjectRepository], max_entries: int = 4096
+    ) -> None:
+        self._repository = repository
+        self._max_entries = max(1, max_entries)
+        self._memory: OrderedDict[str, MediaObject] = OrderedDict()
+        self._background: set[asyncio.Task] = set()
+        self._hits = 0
+        self._memory_hits = 0
+        self._misses = 0
+        self._registered = 0
+        self._collisions = 0
+
+    async def acquire(self, digest: str) -> Optional[MediaObject]:
+        item = self._memory.get(digest)
+        if item is not None:
+            self._memory.move_to_end(digest)
+            self._hits += 1
+            self._memory_hits += 1
+            if self._repository is None:
+                item = replace(item, ref_count=item.ref_count + 1)
+                self._remember(item)
+            else:
+                self._spawn(self._repository.acquire(digest))
+            return item
+        if self._repository is not None:
+            try:
+                item = await self._repository.acquire(digest)
+            except Exception:
+                # 索引不可用时退化为普通上传，不影响主流程
+                logger.warning("media digest lookup failed step=media_dedup")
+                item = None
+            if item is not None:
+                self._hits += 1
+                self._remember(item)
+                return item
+        self._misses += 1
+        return None
+
+    async def register(self, item: MediaObject) -> MediaObject:
+        """登记新上传的对象；若并发上传已先登记同一内容，返回先到的那个。"""
+        if self._repository is not None:
+            try:
+                stored = await self._repository.register(item)
+            except Exception:
+                logger.warning("media digest register failed step=media_dedup")
+                return item
+        else:
+            existing = self._memory.get(item.digest)
+            stored = (
+                replace(existing, ref_count=existing.ref_count + 1) if existing else item
+            )
+        if stored.key != item.key:
+            self._collisions += 1
+        else:
+            self._registered += 1
+        self._remember(stored)
+        return stored
+
+    async def release(self, digest: str) -> Optional[int]:
+        if self._repository is not None:
+            remaining = await self._repository.release(digest)
+        else:
+            item = self._memory.get(digest)
+            remaining = max(0, item.ref_count - 1) if item else None
+        item = self._memory.get(digest)
+        if item is not None and remaining is not None:
+            self._memory[digest] = replace(item, ref_count=remaining)
+        return remaining
+
+    def _remember(self, item: MediaObject) -> None:
+        self._memory[item.digest] = item
+        self._memory.move_to_end(item.digest)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("media ref count update failed step=media_dedup")
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._memory),
+            "hits": self._hits,
+            "memory_hits": self._memory_hits,
+            "misses": self._misses,
+            "registered": self._registered,
+            "collisions": self._collisions,
+        }
+
+    async def close(self) -> None:
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        if self._repository is not None:
+            await self._repository.close()
+
+
+def _build_repository(settings: Settings) -> Optional[MediaObjectRepository]:
+    backend = settings.media_dedup_store.strip().lower()
+    if not backend:
+        return None
+    if backend == "sqlite":
+        return SQLiteMediaObjectRepository(settings.media_dedup_sqlite_path)
+    if backend == "postgres":
+        if not settings.database_url:
+            logger.warning("DATABASE_URL missing, media digest index is memory only")
+            return None
+        return PostgresMediaObjectRepository(settings.database_url)
+    logger.warning("unknown media dedup store backend=%s, memory only", backend)
+    return None
+
+
+_index: Optional[MediaDigestIndex] = None
+
+
+def get_media_digest_index(settings: Optional[Settings] = None) -> Optional[MediaDigestIndex]:
+    """未开启去重时返回 None，上传按原逻辑每次生成新对象。"""
+    global _index
+    settings = settings or get_settings()
+    if not settings.media_dedup_enabled:
+        return None
+    if _index is None:
+        _index = MediaDigestIndex(_build_repository(settings), settings.media_dedup_cache_entries)
+    return _index
+
+
+async def close_media_digest_index() -> None:
+    global _index
+    index, _index = _index, None
+    if index is not None:
+        await index.close()
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import functools
+import math
+import time
+from typing import Any, Callable, Optional, TypeVar
+
+from app.core.config import Settings, get_settings
+from app.core.tracing import span
+
+T = TypeVar("T")
+
+
+class StorageBusyError(RuntimeError):
+    pass
+
+
+class BlockingExecutor:
+    """专用于存储 SDK 阻塞调用的有界线程池，避免大文件上传占住事件循环。
+
+    并发数即线程数；超出的调用在事件循环侧排队，排队数达到上限时直接拒绝。
+    调用方取消等待时，已经开始的阻塞调用会跑完再归还名额。
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int) -> None:
+        self.name = name
+        self._max_workers = max(1, max_workers)
+        self._max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._max_workers, thread_name_prefix=f"gridworkflow-{name}"
+        )
+        self._semaphore = asyncio.Semaphore(self._max_workers)
+        self._waiting = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        with span(f"{self.name}.{getattr(fn, '__name__', 'call')}") as current:
+            return await self._run(current, fn, *args, **kwargs)
+
+    async def _run(self, current: Any, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        if self._waiting >= self._max_queue and self._semaphore.locked():
+            self._rejected += 1
+            raise StorageBusyError(f"{self.name} executor queue is full")
+        enqueued = time.monotonic()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        waited = time.monotonic() - enqueued
+        current.set("wait_ms", round(waited * 1000, 3))
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        self._active += 1
+        try:
+            future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            self._active -= 1
+            self._semaphore.release()
+            raise
+        future.add_done_callback(
+            lambda done: loop.call_soon_threadsafe(self._finish, done, started)
+        )
+        return await asyncio.wrap_future(future)
+
+    def _finish(self, future: Future, started: float) -> None:
+        self._active -= 1
+        self._semaphore.release()
+        self._run_total += time.monotonic() - started
+        if future.cancelled() or future.exception() is not None:
+            self._failed += 1
+        else:
+            self._completed += 1
+
+    def retry_after(self) -> int:
+        finished = self._completed + self._failed
+        run_avg = self._run_total / finished if finished else 1.0
+        return max(1, math.ceil((self._waiting + 1) / self._max_workers * run_avg))
+
+    def stats(self) -> dict[str, float]:
+        finished = self._completed + self._failed
+        return {
+            "max_workers": self._max_workers,
+            "active": self._active,
+            "queue_depth": self._waiting,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "wait_ms_avg": round(self._wait_total / finished * 1000, 2) if finished else 0.0,
+            "wait_ms_max": round(self._wait_max * 1000, 2),
+            "run_ms_avg": round(self._run_total / finished * 1000, 2) if finished else 0.0,
+        }
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._executor.shutdown, True)
+
+
+_executor: Optional[BlockingExecutor] = None
+
+
+def get_storage_executor(settings: Optional[Settings] = None) -> BlockingExecutor:
+    global _executor
+    if _executor is None:
+        settings = settings or get_settings()
+        _executor = BlockingExecutor(
+            "storage", settings.storage_max_workers, settings.storage_max_queue
+        )
+    return _executor
+
+
+async def close_storage_executor() -> None:
+    global _executor
+    executor, _executor = _executor, None
+    if executor is not None:
+        await executor.close()
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+from typing import BinaryIO, Optional
+from uuid import uuid4
+
+from app.storage.cos_client import COSUploadError, UploadResult
+
+FILES_ROUTE = "/media/files"
+_COPY_CHUNK_BYTES = 1024 * 1024
+
+
+def _check_md5(body: bytes, content_md5: str) -> str:
+    digest = hashlib.md5(body).digest()
+    if content_md5 and base64.b64encode(digest).decode("ascii") != content_md5:
+        raise COSUploadError("part checksum mismatch")
+    return digest.hex()
+
+
+class _LocalBackendBase:
+    """本地实现共用部分：对象经由 /media/files/{key} 由后端自己提供下载，不支持直传地址。"""
+
+    supports_presigned_upload = False
+
+    def __init__(self, public_base_url: str) -> None:
+        self._base_url = public_base_url.rstrip("/")
+        self._lock = threading.Lock()
+        self._objects_written = 0
+        self._bytes_written = 0
+
+    def build_access_url(self, key: str) -> UploadResult:
+        return UploadResult(url=f"{self._base_url}{FILES_ROUTE}/{key}", key=key, signed=False)
+
+    def presign_put_url(
+        self, key: str, content_type: str, content_length: int, expires_in: int
+    ) -> str:
+        raise COSUploadError("presigned upload is not supported by this storage backend")
+
+    def object_path(self, key: str) -> Optional[str]:
+        """对象在本地磁盘上的路径，可零拷贝发送；内存实现返回 None。"""
+        return None
+
+    def content_type_of(self, key: str) -> str:
+        return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+    def _count_write(self, size: int) -> None:
+        with self._lock:
+            self._objects_written += 1
+            self._bytes_written += size
+
+
+class LocalStorageBackend(_LocalBackendBase):
+    """对象写到本地目录，用于开发和无外部依赖的压测。写入先落临时文件再原子替换。"""
+
+    name = "local"
+
+    def __init__(self, root: str, public_base_url: str = "") -> None:
+        super().__init__(public_base_url)
+        self._root = os.path.realpath(root)
+        self._uploads = os.path.join(self._root, ".multipart")
+        os.makedirs(self._uploads, exist_ok=True)
+
+    def _path(self, key: str) -> Optional[str]:
+        if not key or key.startswith(".") or "/." in key:
+            return None
+        path = os.path.realpath(os.path.join(self._root, key))
+        if not path.startswith(self._root + os.sep):
+            return None
+        return path
+
+    def _target(self, key: str) -> str:
+        path = self._path(key)
+        if path is None:
+            raise COSUploadError("invalid object key")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def _write_atomic(self, key: str, write) -> int:
+        path = self._target(key)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                write(handle)
+                size = handle.tell()
+            os.replace(tmp_path, path)
+        except BaseException as exc:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            if isinstance(exc, OSError):
+                raise COSUploadError("local storage write failed") from exc
+            raise
+        self._count_write(size)
+        return size
+
+    def upload_fileobj(self, fileobj: BinaryIO, key: str, content_type: str) -> None:
+        self._write_atomic(
+            key, lambda handle: shutil.copyfileobj(fileobj, handle, _COPY_CHUNK_BYTES)
+        )
+
+    def put_object(self, key: str, body: bytes, content_type: str) -> None:
+        self._write_atomic(key, lambda handle: handle.write(body))
+
+    def create_multipart_upload(self, key: str, content_type: str) -> str:
+        upload_id = uuid4().hex
+        os.makedirs(os.path.join(self._uploads, upload_id))
+        return upload_id
+
+    def _part_path(self, upload_id: str, part_number: int) -> str:
+        if not upload_id.isalnum():
+            raise COSUploadError("invalid upload id")
+        return os.path.join(self._uploads, upload_id, f"{part_number:05d}")
+
+    def upload_part(
+        self, key: str, upload_id: str, part_number: int, body: bytes, content_md5: str
+    ) -> str:
+        etag = _check_md5(body, content_md5)
+        try:
+            with open(self._part_path(upload_id, part_number), "wb") as handle:
+                handle.write(body)
+        except OSError as exc:
+            raise COSUploadError("local part write failed") from exc
+        return etag
+
+    def complete_multipart_upload(
+        self, key: str, upload_id: str, parts: list[tuple[int, str]]
+    ) -> None:
+        def _concat(handle) -> None:
+            for number, _ in parts:
+                with open(self._part_path(upload_id, number), "rb") as part:
+                    shutil.copyfileobj(part, handle, _COPY_CHUNK_BYTES)
+
+        self._write_atomic(key, _concat)
+        self.abort_multipart_upload(key, upload_id)
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        shutil.rmtree(os.path.dirname(self._part_path(upload_id, 0)), ignore_errors=True)
+
+    def head_object_size(self, key: str) -> Optional[int]:
+        path = self._path(key)
+        if path is None or not os.path.isfile(path):
+            return None
+        return os.path.getsize(path)
+
+    def read_range(self, key: str, start: int, end: int) -> bytes:
+        path = self._path(key)
+        if path is None:
+            raise COSUploadError("invalid object key")
+        try:
+            with open(path, "rb") as handle:
+                return os.pread(handle.fileno(), end - start + 1, start)
+        except OSError as exc:
+            raise COSUploadError("local ranged read failed") from exc
+
+    def delete_object(self, key: str) -> None:
+        path = self._path(key)
+        if path is None:
+            return
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            raise COSUploadError("local delete failed") from exc
+
+    def object_path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        if path is None or not os.path.isfile(path):
+            return None
+        return path
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "objects_written": self._objects_written,
+            "bytes_written": self._bytes_written,
+        }
+
+
+class MemoryStorageBackend(_LocalBackendBase):
+    """进程内字典存储，进程退出即丢失，只用于测试与压测。"""
+
+    name = "memory"
+
+    def __init__(self, public_base_url: str = "") -> None:
+        super().__init__(public_base_url)
+        self._objects: dict[str, tuple[bytes, str]] = {}
+        self._uploads: dict[str, dict[int, bytes]] = {}
+
+    def upload_fileobj(self, fileobj: BinaryIO, key: str, content_type: str) -> None:
+        self.put_object(key, fileobj.read(), content_type)
+
+    def put_object(self, key: str, body: bytes, content_type: str) -> None:
+        with self._lock:
+            self._objects[key] = (bytes(body), content_type)
+        self._count_write(len(body))
+
+    def create_multipart_upload(self, key: str, content_type: str) -> str:
+        upload_id = uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {}
+        return upload_id
+
+    def upload_part(
+        self, key: str, upload_id: str, part_number: int, body: bytes, content_md5: str
+    ) -> str:
+        etag = _check_md5(body, content_md5)
+        with self._lock:
+            if upload_id not in self._uploads:
+                raise COSUploadError("unknown upload id")
+            self._uploads[upload_id][part_number] = bytes(body)
+        return etag
+
+    def complete_multipart_upload(
+        self, key: str, upload_id: str, parts: list[tuple[int, str]]
+    ) -> None:
+        with self._lock:
+            stored = self._uploads.pop(upload_id, None)
+        if stored is None:
+            raise COSUploadError("unknown upload id")
+        body = b"".join(stored[number] for number, _ in parts)
+        self.put_object(key, body, self.content_type_of(key))
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+
+    def head_object_size(self, key: str) -> Optional[int]:
+        item = self._objects.get(key)
+        return len(item[0]) if item else None
+
+    def read_range(self, key: str, start: int, end: int) -> bytes:
+        item = self._objects.get(key)
+        if item is None:
+            raise COSUploadError("object not found")
+        return item[0][start : end + 1]
+
+    def delete_object(self, key: str) -> None:
+        with self._lock:
+            self._objects.pop(key, None)
+
+    def content_type_of(self, key: str) -> str:
+        item = self._objects.get(key)
+        return item[1] if item else super().content_type_of(key)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "objects": len(self._objects),
+            "bytes": sum(len(body) for body, _ in self._objects.values()),
+            "objects_written": self._objects_written,
+            "bytes_written": self._bytes_written,
+        }
@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.core.config import Settings, get_settings
+from app.services.upstream import get_upstream_pool
+from app.storage.backend import StorageBackend, get_storage_backend
+from app.storage.cos_client import (
+    COSConfigError,
+    COSUploadError,
+    MediaValidationError,
+    build_object_key,
+    detect_content_type,
+    validate_media,
+)
+from app.storage.dedup import MediaObject, get_media_digest_index
+from app.storage.executor import StorageBusyError, get_storage_executor
+from app.storage.multipart import MultipartUploader
+
+logger = logging.getLogger("gridworkflow")
+
+MAGIC_BYTES = 512
+
+MIRROR_PENDING = "pending"
+MIRROR_DONE = "done"
+MIRROR_FAILED = "failed"
+
+# 持久化与缓存里只保存对象 key，访问地址（可能是有效期很短的签名地址）在对外返回时再生成
+STORAGE_REF_PREFIX = "storage:"
+
+
+class MirrorFetchError(RuntimeError):
+    def __init__(self, message: str, retryable: bool) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class MirrorJob:
+    """一次转存：同一个源地址只转存一次，重复提交拿到同一个任务。"""
+
+    __slots__ = ("id", "source_url", "media_type", "user_id", "status", "key", "attempts", "done")
+
+    def __init__(self, source_url: str, media_type: str, user_id: Optional[str]) -> None:
+        self.id = mirror_id(source_url)
+        self.source_url = source_url
+        self.media_type = media_type
+        self.user_id = user_id
+        self.status = MIRROR_PENDING
+        self.key: Optional[str] = None
+        self.attempts = 0
+        self.done = asyncio.Event()
+
+    @property
+    def ref(self) -> Optional[str]:
+        return storage_ref(self.key) if self.key else None
+
+    @property
+    def url(self) -> Optional[str]:
+        """每次访问重新生成，开启 COS_SIGNED_URL 时不会拿到已过期的签名地址。"""
+        return resolve_media_url(self.ref)
+
+    def to_payload(self) -> dict[str, Any]:
+        return {"id": self.id, "status": self.status, "url": self.url}
+
+
+def mirror_id(source_url: str) -> str:
+    return hashlib.sha256(source_url.encode("utf-8")).hexdigest()[:32]
+
+
+def storage_ref(key: str) -> str:
+    return f"{STORAGE_REF_PREFIX}{key}"
+
+
+def resolve_media_url(ref: Optional[str], settings: Optional[Settings] = None) -> Optional[str]:
+    """把 storage:<key> 换成当前可访问的地址；上游原地址等其他值原样返回。"""
+    if not ref or not ref.startswith(STORAGE_REF_PREFIX):
+        return ref
+    try:
+        storage = get_storage_backend(settings)
+    except COSConfigError:
+        logger.warning("storage unavailable for mirrored media step=media_mirror")
+        return None
+    return storage.build_access_url(ref[len(STORAGE_REF_PREFIX):]).url
+
+
+def _filename_of(url: str) -> Optional[str]:
+    return os.path.basename(urlsplit(url).path) or None
+
+
+class MediaMirror:
+    """把上游生成的临时图片/视频地址转存到对象存储。
+
+    下载按块读取并直接交给分片上传，不在内存中保留整个文件；
+    同时进行的转存数受 concurrency 限制，网络错误与 5xx 按退避重试。
+    """
+
+    def __init__(self, settings: Settings, storage: StorageBackend) -> None:
+        self._settings = settings
+        self._storage = storage
+        self._slots = asyncio.Semaphore(max(1, settings.media_mirror_concurrency))
+        self._max_retries = max(0, settings.media_mirror_max_retries)
+        self._timeout = max(1.0, settings.media_mirror_timeout_sec)
+        self._max_jobs = max(1, settings.media_mirror_max_jobs)
+        self._jobs: OrderedDict[str, MirrorJob] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+        self._mirrored = 0
+        self._failed = 0
+        self._retries = 0
+
+    def submit(
+        self, source_url: str, media_type: str, user_id: Optional[str] = None
+    ) -> MirrorJob:
+        job = self._jobs.get(mirror_id(source_url))
+        if job is not None and job.status != MIRROR_FAILED:
+            self._jobs.move_to_end(job.id)
+            return job
+        job = MirrorJob(source_url, media_type, user_id)
+        self._jobs[job.id] = job
+        self._evict()
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str) -> Optional[MirrorJob]:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: MirrorJob, timeout: float) -> MirrorJob:
+        """最多等待 timeout 秒；超时后任务继续在后台执行。"""
+        if timeout > 0 and not job.done.is_set():
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    async def _run(self, job: MirrorJob) -> None:
+        try:
+            async with self._slots:
+                await self._attempt_all(job)
+        except Exception:
+            logger.exception("media mirror crashed media_type=%s step=media_mirror", job.media_type)
+        finally:
+            if job.status == MIRROR_PENDING:
+                job.status = MIRROR_FAILED
+                self._failed += 1
+            job.done.set()
+
+    async def _attempt_all(self, job: MirrorJob) -> None:
+        for attempt in range(self._max_retries + 1):
+            job.attempts = attempt + 1
+            try:
+                job.key = await self._copy(job)
+                job.status = MIRROR_DONE
+                self._mirrored += 1
+                break
+            except (MirrorFetchError, httpx.HTTPError, COSUploadError, StorageBusyError) as exc:
+                retryable = getattr(exc, "retryable", True)
+                if not retryable or attempt >= self._max_retries:
+                    logger.warning(
+                        "media mirror failed media_type=%s attempts=%d step=media_mirror",
+                        job.media_type,
+                        job.attempts,
+                    )
+                    job.status = MIRROR_FAILED
+                    self._failed += 1
+                    break
+                self._retries += 1
+                await asyncio.sleep(min(5.0, 0.5 * 2**attempt))
+            except MediaValidationError:
+                logger.warning(
+                    "media mirror rejected media_type=%s step=media_mirror", job.media_type
+                )
+                job.status = MIRROR_FAILED
+                self._failed += 1
+                break
+
+    async def _copy(self, job: MirrorJob) -> str:
+        settings = self._settings
+        max_bytes = (
+            settings.cos_image_max_bytes
+            if job.media_type == "image"
+            else settings.cos_video_max_bytes
+        )
+        pool = get_upstream_pool(settings)
+        async with pool.stream("GET", job.source_url, timeout_seconds=self._timeout) as response:
+            if response.status_code != 200:
+                raise MirrorFetchError(
+                    "mirror source unavailable",
+                    retryable=response.status_code >= 500 or response.status_code == 429,
+                )
+            declared = int(response.headers.get("content-length") or 0)
+            if declared > max_bytes:
+                raise MediaValidationError("BAD_REQUEST", "file size not allowed")
+            uploader: Optional[MultipartUploader] = None
+            head = bytearray()
+            received = 0
+            try:
+                async for chunk in response.aiter_bytes():
+                    received += len(chunk)
+                    if received > max_bytes:
+                        raise MediaValidationError("BAD_REQUEST", "file size not allowed")
+                    if uploader is not None:
+                        await uploader.write(chunk)
+                        continue
+                    head += chunk
+                    if len(head) >= MAGIC_BYTES:
+                        uploader = self._begin(job, response, bytes(head))
+                        await uploader.write(bytes(head))
+                if uploader is None:
+                    if not head:
+                        raise MirrorFetchError("mirror source empty", retryable=True)
+                    uploader = self._begin(job, response, bytes(head))
+                    await uploader.write(bytes(head))
+                stored = await uploader.finish()
+            except BaseException:
+                if uploader is not None:
+                    await uploader.abort()
+                raise
+        return await self._publish(job, stored.key, stored.sha256, stored.size, uploader.content_type)
+
+    def _begin(self, job: MirrorJob, response: httpx.Response, head: bytes) -> MultipartUploader:
+        content_type = validate_media(job.media_type, response.headers.get("content-type"), head)
+        if detect_content_type(job.media_type, head) is None:
+            raise MediaValidationError("BAD_REQUEST", "media signature mismatch")
+        key = build_object_key(
+            self._settings.cos_media_prefix,
+            job.media_type,
+            _filename_of(job.source_url),
+            content_type,
+        )
+        return MultipartUploader(
+            self._storage,
+            get_storage_executor(self._settings),
+            key,
+            content_type,
+            part_size=self._settings.cos_part_size_bytes,
+            concurrency=self._settings.cos_part_concurrency,
+            max_retries=self._settings.cos_part_max_retries,
+        )
+
+    async def _publish(
+        self, job: MirrorJob, key: str, digest: str, size: int, content_type: str
+    ) -> str:
+        index = get_media_digest_index(self._settings)
+        if index is not None:
+            stored = await index.register(MediaObject(digest, job.media_type, key, content_type, size))
+            if stored.key != key:
+                try:
+                    await get_storage_executor(self._settings).run(
+                        self._storage.delete_object, key
+                    )
+                except (COSUploadError, StorageBusyError):
+                    logger.warning("cos delete duplicate failed step=media_mirror")
+                key = stored.key
+        return key
+
+    def _evict(self) -> None:
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self._max_jobs:
+                break
+            if self._jobs[job_id].status != MIRROR_PENDING:
+                del self._jobs[job_id]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "jobs": len(self._jobs),
+            "running": len(self._tasks),
+            "mirrored": self._mirrored,
+            "failed": self._failed,
+            "retries": self._retries,
+        }
+
+    async def close(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._jobs.clear()
+
+
+_mirror: Optional[MediaMirror] = None
+
+
+def get_media_mirror(settings: Optional[Settings] = None) -> Optional[MediaMirror]:
+    """未开启转存或存储未配置时返回 None，调用方继续使用上游原地址。"""
+    global _mirror
+    settings = settings or get_settings()
+    if not settings.media_mirror_enabled:
+        return None
+    if _mirror is None:
+        try:
+            storage = get_storage_backend(settings)
+        except COSConfigError:
+            return None
+        _mirror = MediaMirror(settings, storage)
+    return _mirror
+
+
+async def close_media_mirror() -> None:
+    global _mirror
+    mirror, _mirror = _mirror, None
+    if mirror is not None:
+        await mirror.close()
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+from dataclasses import dataclass
+import hashlib
+import logging
+from typing import Optional
+
+from app.core.metrics import upload_bytes_in_flight, upload_bytes_total
+from app.storage.backend import StorageBackend
+from app.storage.cos_client import COSUploadError
+from app.storage.executor import BlockingExecutor, StorageBusyError
+
+logger = logging.getLogger("gridworkflow")
+
+# COS 要求除最后一片外每片不小于 1MB
+MIN_PART_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class StreamedObject:
+    key: str
+    size: int
+    sha256: str
+    parts: int
+
+
+class MultipartUploader:
+    """边接收边上传：数据按固定分片切开，分片并行上传，失败的分片单独重试。
+
+    在途分片数受 concurrency 限制，写入方会在名额用尽时等待，
+    因此内存占用约为 (concurrency + 1) * part_size，与文件大小无关。
+    不足一个分片的小文件在 finish 时改为单次上传。
+    """
+
+    def __init__(
+        self,
+        client: StorageBackend,
+        executor: BlockingExecutor,
+        key: str,
+        content_type: str,
+        part_size: int,
+        concurrency: int,
+        max_retries: int = 3,
+    ) -> None:
+        self._client = client
+        self._executor = executor
+        self._key = key
+        self._content_type = content_type
+        self._part_size = max(MIN_PART_SIZE, part_size)
+        self._max_retries = max(0, max_retries)
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._buffer = bytearray()
+        self._sha256 = hashlib.sha256()
+        self._size = 0
+        self._upload_id: Optional[str] = None
+        self._next_part = 1
+        self._etags: dict[int, str] = {}
+        self._inflight: set[asyncio.Task] = set()
+        self._error: Optional[BaseException] = None
+        self._pending_bytes = 0
+        self.retries = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def content_type(self) -> str:
+        return self._content_type
+
+    @property
+    def sha256(self) -> str:
+        """到目前为止写入数据的摘要，全部写完后即为整个对象的摘要。"""
+        return self._sha256.hexdigest()
+
+    async def write(self, data: bytes) -> None:
+        self._raise_if_failed()
+        self._sha256.update(data)
+        self._size += len(data)
+        self._pending_bytes += len(data)
+        upload_bytes_in_flight.inc(amount=len(data))
+        self._buffer += data
+        while len(self._buffer) >= self._part_size:
+            chunk = bytes(self._buffer[: self._part_size])
+            del self._buffer[: self._part_size]
+            await self._submit(chunk)
+
+    async def finish(self) -> StreamedObject:
+        self._raise_if_failed()
+        if self._upload_id is None:
+            await self._executor.run(
+                self._client.put_object, self._key, bytes(self._buffer), self._content_type
+            )
+            parts = 1
+        else:
+            if self._buffer:
+                await self._submit(bytes(self._buffer))
+            self._buffer.clear()
+            if self._inflight:
+                await asyncio.gather(*self._inflight, return_exceptions=True)
+            self._raise_if_failed()
+            await self._executor.run(
+                self._client.complete_multipart_upload,
+                self._key,
+                self._upload_id,
+                sorted(self._etags.items()),
+            )
+            parts = len(self._etags)
+        self._buffer.clear()
+        self._release_pending()
+        upload_bytes_total.inc(amount=self._size)
+        return StreamedObject(self._key, self._size, self._sha256.hexdigest(), parts)
+
+    async def abort(self) -> None:
+        for task in self._inflight:
+            task.cancel()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        self._buffer.clear()
+        self._release_pending()
+        if self._upload_id is None:
+            return
+        try:
+            await self._executor.run(
+                self._client.abort_multipart_upload, self._key, self._upload_id
+            )
+        except (COSUploadError, StorageBusyError):
+            # 未清理的分片由存储桶生命周期规则兜底
+            logger.warning("cos multipart abort failed step=media_upload")
+
+    async def _submit(self, chunk: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = await self._executor.run(
+                self._client.create_multipart_upload, self._key, self._content_type
+            )
+        await self._slots.acquire()
+        if self._error is not None:
+            self._slots.release()
+            self._raise_if_failed()
+        part_number = self._next_part
+        self._next_part += 1
+        task = asyncio.create_task(self._upload_part(part_number, chunk))
+        self._inflight.add(task)
+        task.add_done_callback(self._part_done)
+
+    def _part_done(self, task: asyncio.Task) -> None:
+        self._inflight.discard(task)
+        self._slots.release()
+        if not task.cancelled() and task.exception() is not None and self._error is None:
+            self._error = task.exception()
+
+    async def _upload_part(self, part_number: int, chunk: bytes) -> None:
+        content_md5 = base64.b64encode(hashlib.md5(chunk).digest()).decode("ascii")
+        for attempt in range(self._max_retries + 1):
+            try:
+                self._etags[part_number] = await self._executor.run(
+                    self._client.upload_part,
+                    self._key,
+                    self._upload_id,
+                    part_number,
+                    chunk,
+                    content_md5,
+                )
+                return
+            except (COSUploadError, StorageBusyError):
+                if attempt >= self._max_retries:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(min(2.0, 0.2 * 2**attempt))
+
+    def _release_pending(self) -> None:
+        upload_bytes_in_flight.dec(amount=self._pending_bytes)
+        self._pending_bytes = 0
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import time
+from typing import Optional
+from urllib.parse import quote, urlencode
+
+from app.core.config import Settings
+from app.storage.backend import resolve_storage_backend_name
+
+PROXY_ROUTE = "/media/proxy"
+
+
+def proxy_requires_signature(settings: Settings) -> bool:
+    """COS 使用签名地址（私有读）时，代理地址也必须签名，否则等于公开了对象。"""
+    return resolve_storage_backend_name(settings) == "cos" and settings.cos_signed_url
+
+
+def _signature(secret: str, key: str, expires: int) -> str:
+    message = f"{key}\n{expires}".encode("utf-8")
+    return hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def build_proxy_url(settings: Settings, key: str) -> Optional[str]:
+    if not settings.media_proxy_enabled:
+        return None
+    url = f"{settings.storage_public_base_url.rstrip('/')}{PROXY_ROUTE}/{quote(key)}"
+    if not proxy_requires_signature(settings):
+        return url
+    expires = int(time.time()) + max(60, settings.media_proxy_url_ttl_seconds)
+    query = urlencode(
+        {"expires": expires, "signature": _signature(settings.cos_secret_key or "", key, expires)}
+    )
+    return f"{url}?{query}"
+
+
+def verify_proxy_signature(
+    settings: Settings, key: str, expires: Optional[int], signature: Optional[str]
+) -> bool:
+    if not proxy_requires_signature(settings):
+        return True
+    if expires is None or not signature or expires < time.time():
+        return False
+    expected = _signature(settings.cos_secret_key or "", key, expires)
+    return hmac.compare_digest(expected, signature)
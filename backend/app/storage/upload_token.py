@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import base64
+from dataclasses import asdict, dataclass
+import hashlib
+import hmac
+import json
+import time
+
+from app.storage.cos_client import MediaValidationError
+
+
+@dataclass(frozen=True)
+class UploadGrant:
+    """签发直传地址时记录的上传约定，完成时据此校验。"""
+
+    user_id: str
+    key: str
+    media_type: str
+    content_type: str
+    size: int
+    expires_at: int
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(raw: str) -> bytes:
+    return base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4))
+
+
+def _sign(secret: str, body: bytes) -> bytes:
+    signature = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(signature).rstrip(b"=")
+
+
+def issue_upload_token(secret: str, grant: UploadGrant) -> str:
+    body = _b64encode(json.dumps(asdict(grant), separators=(",", ":")).encode("utf-8"))
+    return f"{body}.{_sign(secret, body.encode('ascii')).decode('ascii')}"
+
+
+def verify_upload_token(secret: str, token: str, user_id: str, grace_seconds: int = 0) -> UploadGrant:
+    try:
+        # 令牌只含 base64url 与 "."，非 ASCII 输入直接视为无效，比较按字节进行
+        body, _, signature = token.encode("ascii").partition(b".")
+    except UnicodeEncodeError as exc:
+        raise MediaValidationError("BAD_REQUEST", "invalid upload token") from exc
+    if not body or not hmac.compare_digest(_sign(secret, body), signature):
+        raise MediaValidationError("BAD_REQUEST", "invalid upload token")
+    try:
+        grant = UploadGrant(**json.loads(_b64decode(body.decode("ascii"))))
+    except (ValueError, TypeError) as exc:
+        raise MediaValidationError("BAD_REQUEST", "invalid upload token") from exc
+    if grant.user_id != user_id:
+        raise MediaValidationError("FORBIDDEN", "upload token belongs to another user")
+    if grant.expires_at + grace_seconds < time.time():
+        raise MediaValidationError("BAD_REQUEST", "upload token expired")
+    return grant
@@ -0,0 +1,82 @@
+"""IP 白名单匹配基准：对比逐条 ``address in network`` 线性扫描与编译后的区间二分查找。
+
+在 backend 目录下运行:
+    python -m benchmarks.ip_allowlist --sizes 10,100,1000,10000 --lookups 20000
+
+每组随机生成 IPv4/IPv6 混合的 CIDR 列表，查询地址一半命中一半不命中。
+"""
+from __future__ import annotations
+
+import argparse
+from ipaddress import IPv4Address, IPv6Address, ip_network
+import random
+import time
+
+
+def _random_cidrs(count: int, rng: random.Random) -> list[str]:
+    cidrs: list[str] = []
+    for _ in range(count):
+        if rng.random() < 0.8:
+            prefix = rng.randint(16, 32)
+            address = IPv4Address(rng.getrandbits(32))
+            cidrs.append(str(ip_network(f"{address}/{prefix}", strict=False)))
+        else:
+            prefix = rng.randint(32, 64)
+            address = IPv6Address(rng.getrandbits(128))
+            cidrs.append(str(ip_network(f"{address}/{prefix}", strict=False)))
+    return cidrs
+
+
+def _addresses(cidrs: list[str], count: int, rng: random.Random) -> list:
+    networks = [ip_network(item) for item in cidrs]
+    addresses = []
+    for index in range(count):
+        if index % 2 == 0:
+            network = rng.choice(networks)
+            offset = rng.randrange(network.num_addresses)
+            addresses.append(network.network_address + offset)
+        else:
+            addresses.append(IPv4Address(rng.getrandbits(32)))
+    return addresses
+
+
+def _time(fn, addresses: list) -> tuple[float, int]:
+    started = time.perf_counter()
+    matched = sum(1 for address in addresses if fn(address))
+    return time.perf_counter() - started, matched
+
+
+def main() -> None:
+    from app.core.ip_matcher import compile_networks
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000,10000")
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'cidrs':>7}  {'linear us/op':>13}  {'compiled us/op':>15}  {'compile ms':>10}")
+    for size in (int(item) for item in args.sizes.split(",")):
+        cidrs = _random_cidrs(size, rng)
+        addresses = _addresses(cidrs, args.lookups, rng)
+        networks = tuple(ip_network(item) for item in cidrs)
+
+        started = time.perf_counter()
+        matcher = compile_networks(",".join(cidrs))
+        compile_elapsed = time.perf_counter() - started
+
+        linear, linear_matched = _time(
+            lambda address: any(address in network for network in networks), addresses
+        )
+        compiled, compiled_matched = _time(lambda address: address in matcher, addresses)
+        if linear_matched != compiled_matched:
+            raise SystemExit(f"mismatch at size={size}: {linear_matched} != {compiled_matched}")
+        print(
+            f"{size:>7}  {linear / len(addresses) * 1_000_000:>13.2f}  "
+            f"{compiled / len(addresses) * 1_000_000:>15.2f}  {compile_elapsed * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""JSON 编解码基准：对比标准库与 orjson/msgspec 处理带大体积 base64 字段的请求体与响应信封。
+
+在 backend 目录下运行:
+    python -m benchmarks.json_codec --sizes-mb 1,4,8 --rounds 20
+
+未安装的实现会被跳过；应用实际使用的实现由 JSON_CODEC 决定（默认 auto）。
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import os
+import time
+
+
+def _payloads(size: int) -> tuple[dict, dict]:
+    image = base64.b64encode(os.urandom(size * 3 // 4)).decode("ascii")
+    request = {
+        "prompt": "电影感分镜，雨夜街道，霓虹灯反射",
+        "model": "nano-banana-2",
+        "image": f"data:image/png;base64,{image}",
+        "anchors": [{"name": "主角", "image_base64": image[: size // 4]}],
+    }
+    response = {
+        "ok": True,
+        "data": {"images": [{"b64_json": image, "revised_prompt": request["prompt"]}]},
+        "error": None,
+    }
+    return request, response
+
+
+def _best(fn, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    from app.core import json_codec
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes-mb", default="1,4,8")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    names = ["stdlib"] + [
+        name for name in json_codec.JSON_CODECS if name != "stdlib" and json_codec._available(name)
+    ]
+    print(f"active codec: {json_codec.codec_name}")
+    print(f"{'size':>6}  {'codec':<8}  {'decode ms':>10}  {'encode ms':>10}  {'speedup':>8}")
+    for size_mb in (int(item) for item in args.sizes_mb.split(",")):
+        request, response = _payloads(size_mb * 1024 * 1024)
+        body = json_codec._stdlib_dumps(request)
+        baseline = 0.0
+        for name in names:
+            dumps, loads = json_codec._bind(name)
+            if loads(dumps(request)) != request:
+                raise SystemExit(f"{name} round trip mismatch")
+            decode = _best(lambda: loads(body), args.rounds)
+            encode = _best(lambda: dumps(response), args.rounds)
+            baseline = baseline or decode + encode
+            print(
+                f"{size_mb:>4}MB  {name:<8}  {decode * 1000:>10.2f}  {encode * 1000:>10.2f}  "
+                f"{baseline / (decode + encode):>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
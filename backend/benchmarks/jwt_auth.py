@@ -0,0 +1,89 @@
+"""鉴权开销基准：对比开启与关闭 JWT 校验缓存时每次请求的鉴权耗时。
+
+在 backend 目录下运行:
+    python -m benchmarks.jwt_auth --requests 20000 --tokens 50
+
+直接调用 require_user 依赖本身，不经过路由与网络，结果只反映鉴权开销。
+--tokens 表示轮流使用的不同 token 数，模拟多个客户端同时轮询。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import time
+
+SECRET = "benchmark-secret-benchmark-secret"
+
+
+def _configure() -> None:
+    # 必须在导入 app 之前设置，Settings 在首次 get_settings() 时读取环境变量
+    os.environ["SUPABASE_JWT_SECRET"] = SECRET
+    os.environ.setdefault("SUPABASE_JWT_AUDIENCE", "authenticated")
+    os.environ.setdefault("SUPABASE_JWT_ISSUER", "https://bench.supabase.co/auth/v1")
+
+
+class _State:
+    pass
+
+
+class _Request:
+    def __init__(self) -> None:
+        self.state = _State()
+
+
+async def _measure(settings, headers: list[str], requests: int) -> float:
+    from app.core.auth import require_user
+
+    started = time.perf_counter()
+    for index in range(requests):
+        await require_user(_Request(), headers[index % len(headers)], settings)
+    return time.perf_counter() - started
+
+
+def _report(name: str, requests: int, elapsed: float) -> None:
+    print(
+        f"{name:<16} {requests:>7} req  {elapsed / requests * 1_000_000:>8.2f} us/req  "
+        f"{requests / elapsed:>10.0f} req/s"
+    )
+
+
+async def _run(args: argparse.Namespace) -> None:
+    import jwt
+
+    from app.core import auth
+    from app.core.config import get_settings
+
+    base = get_settings()
+    claims = {
+        "aud": base.supabase_jwt_audience,
+        "iss": base.supabase_jwt_issuer,
+        "exp": int(time.time()) + 3600,
+        "role": "authenticated",
+    }
+    headers = [
+        "Bearer " + jwt.encode({**claims, "sub": f"user-{index}"}, SECRET, algorithm="HS256")
+        for index in range(args.tokens)
+    ]
+
+    uncached = base.model_copy(update={"jwt_cache_enabled": False})
+    elapsed = await _measure(uncached, headers, args.requests)
+    _report("no cache", args.requests, elapsed)
+
+    cached = base.model_copy(update={"jwt_cache_enabled": True})
+    elapsed = await _measure(cached, headers, args.requests)
+    _report("verified cache", args.requests, elapsed)
+    print(auth.token_cache_stats())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--tokens", type=int, default=50)
+    args = parser.parse_args()
+    _configure()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""媒体上传/下载吞吐基准，使用 local 或 memory 存储后端，不依赖 COS 等外部服务。
+
+在 backend 目录下运行:
+    python -m benchmarks.media_throughput --backend memory --size-mb 8 --requests 32 --concurrency 4
+
+请求在进程内经 ASGI 直接调用应用，结果反映后端自身的处理开销，不含网络传输。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+def _configure(args: argparse.Namespace) -> None:
+    # 必须在导入 app 之前设置，Settings 在首次 get_settings() 时读取环境变量
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ.setdefault("STORAGE_LOCAL_ROOT", tempfile.mkdtemp(prefix="gw-bench-"))
+    os.environ.setdefault("SUPABASE_JWT_SECRET", "benchmark-secret-benchmark-secret")
+    os.environ["COS_PART_SIZE_BYTES"] = str(args.part_mb * 1024 * 1024)
+    os.environ.setdefault("STORAGE_MAX_QUEUE", str(args.requests))
+
+
+def _payload(size: int) -> bytes:
+    # MP4 文件头，其余为随机数据
+    head = b"\x00\x00\x00\x18ftypmp42"
+    return head + os.urandom(size - len(head))
+
+
+def _report(name: str, latencies: list[float], total_bytes: int, elapsed: float) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{name:<20} {len(latencies):>5} req  {total_bytes / elapsed / 1024 / 1024:>9.1f} MB/s  "
+        f"p50 {statistics.median(ordered) * 1000:>8.1f} ms  p95 {p95 * 1000:>8.1f} ms"
+    )
+
+
+async def _run(args: argparse.Namespace) -> None:
+    import httpx
+    import jwt
+
+    from app.main import app
+
+    token = jwt.encode(
+        {"sub": "benchmark", "exp": int(time.time()) + 3600},
+        os.environ["SUPABASE_JWT_SECRET"],
+        algorithm="HS256",
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    body = _payload(args.size_mb * 1024 * 1024)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def _upload(path: str) -> tuple[float, str]:
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(
+                    path,
+                    data={"media_type": "video"},
+                    files={"file": ("bench.mp4", body, "video/mp4")},
+                    headers=headers,
+                )
+                response.raise_for_status()
+                return time.perf_counter() - started, response.json()["data"]["url"]
+
+        async def _download(url: str, byte_range: str | None) -> tuple[float, int]:
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(
+                    url, headers={"Range": byte_range} if byte_range else None
+                )
+                response.raise_for_status()
+                return time.perf_counter() - started, len(response.content)
+
+        urls: list[str] = []
+        for path in ("/media/upload", "/media/upload/stream"):
+            started = time.perf_counter()
+            results = await asyncio.gather(*(_upload(path) for _ in range(args.requests)))
+            elapsed = time.perf_counter() - started
+            urls.extend(url for _, url in results)
+            _report(path, [latency for latency, _ in results], len(body) * len(results), elapsed)
+
+        for name, byte_range in (("GET full", None), ("GET 1MB range", "bytes=1048576-2097151")):
+            started = time.perf_counter()
+            results = await asyncio.gather(*(_download(url, byte_range) for url in urls))
+            elapsed = time.perf_counter() - started
+            _report(
+                name,
+                [latency for latency, _ in results],
+                sum(size for _, size in results),
+                elapsed,
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("memory", "local"), default="memory")
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--part-mb", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    _configure(args)
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
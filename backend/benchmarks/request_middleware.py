@@ -0,0 +1,113 @@
+"""请求上下文中间件开销基准：对比 @app.middleware("http") 旧实现与纯 ASGI 实现在 /health 上的吞吐。
+
+在 backend 目录下运行:
+    python -m benchmarks.request_middleware --requests 3000 --concurrency 16
+
+三个应用挂载相同路由，分别为不加中间件、旧的 BaseHTTPMiddleware 包装、RequestContextMiddleware。
+请求在进程内经 ASGI 直接调用，结果只反映框架与中间件开销。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+from uuid import uuid4
+
+
+def _legacy_app(router):
+    """复刻改写前的 request_context，仅供对比。"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    from app.schemas.response import error_response
+
+    logger = logging.getLogger("gridworkflow")
+    app = FastAPI()
+    app.include_router(router)
+
+    @app.middleware("http")
+    async def request_context(request: Request, call_next):
+        request_id = str(uuid4())
+        request.state.request_id = request_id
+        start_time = time.perf_counter()
+        try:
+            response = await call_next(request)
+        except Exception:
+            logger.exception("Unhandled error request_id=%s", request_id)
+            response = JSONResponse(
+                status_code=500,
+                content=error_response("UPSTREAM_ERROR", "服务内部异常，请稍后重试。"),
+            )
+        logger.info(
+            "request completed request_id=%s step=%s model=%s latency_ms=%.2f",
+            request_id,
+            getattr(request.state, "step", "-"),
+            getattr(request.state, "model", "-"),
+            (time.perf_counter() - start_time) * 1000,
+        )
+        response.headers["X-Request-ID"] = request_id
+        return response
+
+    return app
+
+
+async def _measure(name: str, app, args: argparse.Namespace) -> None:
+    import httpx
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def _one() -> float:
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get("/health")
+                response.raise_for_status()
+                return time.perf_counter() - started
+
+        await asyncio.gather(*(_one() for _ in range(min(200, args.requests))))
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(_one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{name:<16} {args.requests / elapsed:>9.0f} req/s  "
+        f"p50 {statistics.median(ordered) * 1000:>7.2f} ms  p95 {p95 * 1000:>7.2f} ms"
+    )
+
+
+async def _run(args: argparse.Namespace) -> None:
+    from fastapi import FastAPI
+
+    from app.api import api_router
+    from app.core.request_context import RequestContextMiddleware
+
+    # 日志输出会淹没中间件本身的开销，压测期间只保留 WARNING 以上
+    logging.getLogger("gridworkflow").setLevel(logging.WARNING)
+
+    bare = FastAPI()
+    bare.include_router(api_router)
+    current = FastAPI()
+    current.include_router(api_router)
+    current.add_middleware(RequestContextMiddleware)
+
+    await _measure("no middleware", bare, args)
+    await _measure("legacy http", _legacy_app(api_router), args)
+    await _measure("pure ASGI", current, args)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    os.environ.setdefault("SUPABASE_JWT_SECRET", "benchmark-secret-benchmark-secret")
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
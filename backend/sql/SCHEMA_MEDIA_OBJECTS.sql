@@ -0,0 +1,45 @@
+-- =============================================================================
+-- GridWorkflow 媒体内容摘要表 DDL
+-- =============================================================================
+-- 用途：MEDIA_DEDUP_ENABLED=true 且 MEDIA_DEDUP_STORE=postgres 时，
+--       按内容 sha256 记录已上传的 COS 对象，相同内容的上传直接复用已有对象
+-- 访问：仅后端通过 DATABASE_URL 直连读写，不对前端开放
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS media_objects (
+  -- 文件内容的 sha256（十六进制）
+  digest TEXT PRIMARY KEY,
+
+  media_type TEXT NOT NULL
+    CHECK (media_type IN ('image', 'video')),
+
+  -- COS 对象 key，首个上传该内容的请求决定
+  object_key TEXT NOT NULL,
+
+  content_type TEXT NOT NULL,
+  size_bytes BIGINT NOT NULL,
+
+  -- 引用计数：每次上传（包括复用）加一，释放时减一；归零后对象才可清理
+  ref_count INTEGER NOT NULL DEFAULT 1
+    CHECK (ref_count >= 0),
+
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+COMMENT ON TABLE media_objects IS '媒体内容摘要表：内容寻址去重，记录摘要到 COS 对象的映射';
+COMMENT ON COLUMN media_objects.ref_count IS '引用计数：为 0 的对象可被清理任务删除';
+
+-- 清理任务按引用计数扫描
+CREATE INDEX IF NOT EXISTS idx_media_objects_unreferenced
+  ON media_objects(updated_at) WHERE ref_count = 0;
+
+-- 复用 SCHEMA_WORKFLOW_PERSISTENCE.sql 中的 update_updated_at_column()
+DROP TRIGGER IF EXISTS trigger_media_objects_updated_at ON media_objects;
+CREATE TRIGGER trigger_media_objects_updated_at
+  BEFORE UPDATE ON media_objects
+  FOR EACH ROW
+  EXECUTE FUNCTION update_updated_at_column();
+
+-- 启用 RLS 且不建策略：anon / authenticated 角色无法访问
+ALTER TABLE media_objects ENABLE ROW LEVEL SECURITY;